@@ -0,0 +1,131 @@
+import email.utils
+import logging
+import random
+import time
+from typing import Dict, Any, Optional
+
+from .config import (
+    DB_BATCH_SIZE, DB_MIN_BATCH_SIZE, DB_MAX_BATCH_SIZE,
+    DB_TARGET_BATCH_BYTES, DB_TARGET_BATCH_LATENCY,
+    DB_RETRY_BASE_DELAY, DB_RETRY_MAX_DELAY
+)
+
+logger = logging.getLogger("traffic_simulator.batching")
+
+# Status codes worth retrying; everything else is treated as a permanent failure
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class AdaptiveBatcher:
+    """Class to size upload batches from observed payload bytes and latency
+
+    The batch grows while requests come back faster than the target latency
+    and shrinks when they are slow or the server pushes back (429/503). The
+    size is also capped so that a request body stays near the byte target.
+    """
+
+    def __init__(self, initial: int = DB_BATCH_SIZE, min_size: int = DB_MIN_BATCH_SIZE,
+                 max_size: int = DB_MAX_BATCH_SIZE, target_bytes: int = DB_TARGET_BATCH_BYTES,
+                 target_latency: float = DB_TARGET_BATCH_LATENCY):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.target_bytes = target_bytes
+        self.target_latency = target_latency
+        self._size = float(min(self.max_size, max(self.min_size, initial)))
+        self.bytes_per_row: Optional[float] = None  # Moving average of serialised row size
+
+    @property
+    def size(self) -> int:
+        """Number of rows to put in the next batch"""
+        size = self._size
+        if self.bytes_per_row:
+            size = min(size, self.target_bytes / self.bytes_per_row)
+        return int(min(self.max_size, max(self.min_size, size)))
+
+    def record(self, rows: int, nbytes: int, latency: float):
+        """Feed back the outcome of a successful batch"""
+        if rows <= 0:
+            return
+
+        row_bytes = nbytes / rows
+        if self.bytes_per_row is None:
+            self.bytes_per_row = row_bytes
+        else:
+            self.bytes_per_row = 0.8 * self.bytes_per_row + 0.2 * row_bytes
+
+        if latency > self.target_latency * 1.5:
+            # Too slow: back off multiplicatively
+            self._size *= 0.7
+        elif latency < self.target_latency:
+            # Headroom left: grow gently
+            self._size *= 1.25
+        self._size = min(self.max_size, max(self.min_size, self._size))
+
+    def throttle(self):
+        """Shrink the batch after the server signalled overload"""
+        self._size = max(self.min_size, self._size * 0.5)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta seconds or HTTP date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+def retry_delay(attempt: int, retry_after: Optional[float] = None,
+                base: float = DB_RETRY_BASE_DELAY, cap: float = DB_RETRY_MAX_DELAY) -> float:
+    """Return how long to wait before retry number ``attempt`` (0-based)
+
+    A server supplied Retry-After wins; otherwise use exponential backoff
+    with "equal jitter" so that parallel uploads do not retry in lockstep.
+    """
+    if retry_after is not None:
+        return min(cap, retry_after)
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class TableThroughput:
+    """Class to accumulate upload throughput for one table"""
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self.rows = 0
+        self.bytes = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed_rows = 0
+        self.elapsed = 0.0  # Wall-clock seconds spent inside insert calls
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "table": self.table_name,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failed_rows": self.failed_rows,
+            "seconds": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "bytes_per_second": round(self.bytes_per_second, 1),
+        }
+
+    def summary(self) -> str:
+        return (
+            f"{self.table_name}: {self.rows} rows in {self.elapsed:.1f}s "
+            f"({self.rows_per_second:.0f} rows/s, {self.bytes_per_second / 1024:.0f} KiB/s), "
+            f"{self.batches} batches, {self.retries} retries, {self.failed_rows} rows failed"
+        )
@@ -0,0 +1,376 @@
+
+import asyncio
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+
+import numpy as np
+
+from .config import (
+    BENCHMARK_ROW_SCALES, BENCHMARK_FLEET_SCALES, BENCHMARK_TICKS, BENCHMARK_TOLERANCE, BENCHMARK_BASELINE,
+    DB_MAX_BATCH_SIZE, HISTORICAL_CHUNK_SIZE, TRAFFIC_ZONES
+)
+from .db import Database, encode_rows
+from .sinks import Sink, create_sink
+from .rest_server import LocalRestServer
+from .generators.vehicle_generator import VehicleGenerator
+from .generators.congestion_generator import CongestionGenerator
+from .generators.anomaly_generator import AnomalyGenerator
+from .generators.trust_generator import TrustGenerator
+from .generators.rsu_generator import RsuGenerator
+
+logger = logging.getLogger("traffic_simulator.benchmark")
+
+# Simulated start of every tick run, so runs see the same traffic profile
+TICK_START = datetime.datetime(2026, 3, 2, 8, 0)
+
+# Metrics compared against the baseline, and whether higher is better
+METRICS = {"rows_per_s": True, "p50_ms": False, "p99_ms": False, "peak_rss_mb": False}
+
+class NullSink(Sink):
+    """Sink that accepts and drops every row, so generators are timed without I/O"""
+
+    name = "null"
+    supports_partial_rows = True
+
+    async def insert_data(self, table_name: str, data: List[Dict[str, Any]]) -> bool:
+        return bool(data)
+
+    async def get_count(self, table_name: str) -> int:
+        return 0
+
+    async def clear_table(self, table_name: str) -> bool:
+        return True
+
+class Measurement:
+    """Rows handled by one benchmark run, and the latency of each timed step (ticks only)"""
+
+    def __init__(self):
+        self.rows = 0
+        self.seconds = 0.0
+        self.latencies: List[float] = []
+
+    def timed(self, rows: int, seconds: float):
+        self.rows += rows
+        self.seconds += seconds
+        self.latencies.append(seconds)
+
+# Benchmark runs by name: (scale kind, coroutine taking the scale)
+CASES: Dict[str, Tuple[str, Callable[[int], Awaitable[Measurement]]]] = {}
+
+def case(name: str, scale_kind: str):
+    """Register a benchmark run; ``scale_kind`` is "rows" or "fleet" (see BENCHMARK_*_SCALES)"""
+    def register(function: Callable[[int], Awaitable[Measurement]]):
+        CASES[name] = (scale_kind, function)
+        return function
+    return register
+
+async def timed_generation(coroutine: Awaitable[List[Dict[str, Any]]]) -> Measurement:
+    measurement = Measurement()
+    started = time.perf_counter()
+    rows = await coroutine
+    measurement.timed(len(rows), time.perf_counter() - started)
+    return measurement
+
+def vehicle_ids_for(count: int) -> List[str]:
+    return VehicleGenerator(NullSink()).create_vehicle_ids(count)
+
+@case("generate/vehicles", "rows")
+async def generate_vehicles(scale: int) -> Measurement:
+    return await timed_generation(VehicleGenerator(NullSink()).generate_historical_data(scale))
+
+@case("generate/anomalies", "rows")
+async def generate_anomalies(scale: int) -> Measurement:
+    vehicle_ids = vehicle_ids_for(scale)
+    return await timed_generation(AnomalyGenerator(NullSink()).generate_historical_data(scale, vehicle_ids))
+
+@case("generate/trust", "rows")
+async def generate_trust(scale: int) -> Measurement:
+    vehicle_ids = vehicle_ids_for(scale)
+    return await timed_generation(TrustGenerator(NullSink()).generate_historical_data(scale, vehicle_ids))
+
+@case("generate/congestion", "rows")
+async def generate_congestion(scale: int) -> Measurement:
+    # Enough synthetic zones for about ``scale`` rows over the default horizon
+    slots = CongestionGenerator(NullSink(), synthetic_zones=0).engine.slots
+    generator = CongestionGenerator(NullSink(), synthetic_zones=max(0, scale // slots - len(TRAFFIC_ZONES)))
+    return await timed_generation(generator.generate_historical_data())
+
+@case("generate/rsus", "rows")
+async def generate_rsus(scale: int) -> Measurement:
+    return await timed_generation(RsuGenerator(NullSink(), count=scale).generate_historical_data())
+
+async def timed_ticks(tick: Callable[[datetime.datetime], Awaitable[Any]], rows: int,
+                      before: Optional[Callable[[], None]] = None) -> Measurement:
+    """Time BENCHMARK_TICKS calls of ``tick``, five virtual seconds apart, each handling ``rows`` rows"""
+    measurement = Measurement()
+    for number in range(BENCHMARK_TICKS):
+        if before is not None:
+            before()
+        now = TICK_START + datetime.timedelta(seconds=5 * number)
+        started = time.perf_counter()
+        await tick(now)
+        measurement.timed(rows, time.perf_counter() - started)
+    return measurement
+
+async def live_vehicles(scale: int) -> VehicleGenerator:
+    """A vehicle generator whose fleet has ``scale`` vehicles"""
+    generator = VehicleGenerator(NullSink())
+    await generator.tick(TICK_START - datetime.timedelta(seconds=5))
+    generator.fleet.spawn(scale - len(generator.fleet))
+    generator.registry.add_many(generator.fleet.vehicle_id[generator.fleet.active_slots].tolist())
+    return generator
+
+@case("tick/vehicles", "fleet")
+async def tick_vehicles(scale: int) -> Measurement:
+    generator = await live_vehicles(scale)
+    measurement = await timed_ticks(generator.tick, scale)
+    await generator.flush()
+    return measurement
+
+@case("tick/detector", "fleet")
+async def tick_detector(scale: int) -> Measurement:
+    vehicles = await live_vehicles(scale)
+    generator = AnomalyGenerator(NullSink(), fleet=vehicles.fleet)
+    return await timed_ticks(generator.detect, scale, before=lambda: vehicles.fleet.step(5))
+
+@case("tick/rsus", "fleet")
+async def tick_rsus(scale: int) -> Measurement:
+    vehicles = await live_vehicles(scale)
+    generator = RsuGenerator(NullSink(), fleet=vehicles.fleet)
+    return await timed_ticks(generator.tick, scale, before=lambda: vehicles.fleet.step(5))
+
+@case("tick/anomalies", "fleet")
+async def tick_anomalies(scale: int) -> Measurement:
+    vehicles = await live_vehicles(scale)
+    generator = AnomalyGenerator(NullSink(), registry=vehicles.registry)
+    return await timed_ticks(generator.tick, 1)
+
+@case("tick/trust", "fleet")
+async def tick_trust(scale: int) -> Measurement:
+    vehicles = await live_vehicles(scale)
+    generator = TrustGenerator(NullSink(), registry=vehicles.registry)
+    return await timed_ticks(generator.tick, 1)
+
+@case("tick/congestion", "fleet")
+async def tick_congestion(scale: int) -> Measurement:
+    # The scale is the number of zones here
+    generator = CongestionGenerator(NullSink(), hours=1, synthetic_zones=max(0, scale - len(TRAFFIC_ZONES)))
+    return await timed_ticks(generator.tick, len(generator.engine.zones))
+
+def sample_rows(scale: int) -> List[Dict[str, Any]]:
+    """``scale`` anomaly rows, repeating one generated chunk so building them costs little time or memory
+
+    Copies of a chunk are further apart than one upload batch, so no batch
+    holds a key twice.
+    """
+    size = max(HISTORICAL_CHUNK_SIZE, DB_MAX_BATCH_SIZE)
+    chunk = AnomalyGenerator(NullSink()).generate_chunk(0, size, vehicle_ids_for(size), TICK_START)
+    copies, rest = divmod(scale, len(chunk))
+    return chunk * copies + chunk[:rest]
+
+def run_insert_endpoint(port_queue):
+    """Serve a discarding ``LocalRestServer`` on a free local port (sent back through ``port_queue``) until killed"""
+    async def serve():
+        server = await LocalRestServer(port=0, store=False).start()
+        port_queue.put(server.port)
+        await server.serve_forever()
+    logging.getLogger("traffic_simulator").setLevel(logging.WARNING)
+    asyncio.run(serve())
+
+@case("upload/insert_data", "rows")
+async def upload_insert_data(scale: int) -> Measurement:
+    # The endpoint runs in its own process, so the client's cost is what gets measured
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    endpoint = context.Process(target=run_insert_endpoint, args=(port_queue,), daemon=True)
+    endpoint.start()
+    try:
+        port = port_queue.get(timeout=30)
+        rows = sample_rows(scale)
+        measurement = Measurement()
+        async with Database(base_url=f"http://127.0.0.1:{port}") as db:
+            started = time.perf_counter()
+            await db.insert_data("anomalies", rows)
+            measurement.timed(db.throughput["anomalies"].rows, time.perf_counter() - started)
+        return measurement
+    finally:
+        endpoint.kill()
+
+@case("serialise/json", "rows")
+async def serialise_json(scale: int) -> Measurement:
+    rows = sample_rows(scale)
+    measurement = Measurement()
+    started = time.perf_counter()
+    for start in range(0, len(rows), DB_MAX_BATCH_SIZE):
+        encode_rows(rows[start:start + DB_MAX_BATCH_SIZE])
+    measurement.timed(len(rows), time.perf_counter() - started)
+    return measurement
+
+async def timed_file_sink(name: str, scale: int) -> Measurement:
+    rows = sample_rows(scale)
+    measurement = Measurement()
+    with tempfile.TemporaryDirectory() as output_dir:
+        async with create_sink(name, output_dir) as sink:
+            started = time.perf_counter()
+            for start in range(0, len(rows), HISTORICAL_CHUNK_SIZE):
+                await sink.insert_data("anomalies", rows[start:start + HISTORICAL_CHUNK_SIZE])
+            await sink.close()
+            measurement.timed(len(rows), time.perf_counter() - started)
+    return measurement
+
+@case("serialise/ndjson", "rows")
+async def serialise_ndjson(scale: int) -> Measurement:
+    return await timed_file_sink("ndjson", scale)
+
+@case("serialise/csv", "rows")
+async def serialise_csv(scale: int) -> Measurement:
+    return await timed_file_sink("csv", scale)
+
+@case("serialise/parquet", "rows")
+async def serialise_parquet(scale: int) -> Measurement:
+    return await timed_file_sink("parquet", scale)
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in KiB elsewhere
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+def run_case(name: str, scale: int, verbose: bool = False) -> Dict[str, Any]:
+    """Run one benchmark in this (fresh worker) process and return its metrics"""
+    if not verbose:
+        for logger_name in ("traffic_simulator", "httpx"):
+            logging.getLogger(logger_name).setLevel(logging.WARNING)
+    measurement = asyncio.run(CASES[name][1](scale))
+    result = {
+        "rows": measurement.rows,
+        "seconds": round(measurement.seconds, 4),
+        "rows_per_s": round(measurement.rows / measurement.seconds, 1) if measurement.seconds > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    if len(measurement.latencies) > 1:
+        p50, p99 = np.percentile(measurement.latencies, [50, 99])
+        result["p50_ms"] = round(p50 * 1000, 3)
+        result["p99_ms"] = round(p99 * 1000, 3)
+    return result
+
+def run_benchmarks(names: List[str], scales: Dict[str, List[int]], verbose: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Run every benchmark at every scale of its kind, each in a fresh process
+
+    A fresh process per run keeps peak RSS per run rather than the
+    maximum over everything run before it. Runs that fail (e.g. a missing
+    optional dependency) are logged and left out.
+    """
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in names:
+        for scale in scales[CASES[name][0]]:
+            key = f"{name}@{scale}"
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                try:
+                    results[key] = executor.submit(run_case, name, scale, verbose).result()
+                except Exception as e:
+                    logger.warning(f"{key}: skipped ({type(e).__name__}: {e})")
+                    continue
+            logger.info(f"{key}: {format_result(results[key])}")
+    return results
+
+def format_result(result: Dict[str, Any]) -> str:
+    text = f"{result['rows_per_s'] or 0:,.0f} rows/s, peak RSS {result['peak_rss_mb']:.0f} MB"
+    if "p50_ms" in result:
+        text += f", tick p50 {result['p50_ms']:.2f} ms / p99 {result['p99_ms']:.2f} ms"
+    return text
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float = BENCHMARK_TOLERANCE) -> List[str]:
+    """Log each metric against the baseline; return the runs and metrics that got worse by more than ``tolerance``"""
+    regressions = []
+    logger.info(f"  {'benchmark':<30}{'metric':<13}{'baseline':>14}{'current':>14}{'change':>9}")
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            verdict = "worse" if worse > tolerance else "better" if worse < -tolerance else ""
+            logger.info(f"  {key:<30}{metric:<13}{old:>14,.2f}{new:>14,.2f}{change:>+9.1%} {verdict}")
+            if verdict == "worse":
+                regressions.append(f"{key} {metric}")
+    return regressions
+
+def save_baseline(path: str, results: Dict[str, Dict[str, Any]]):
+    """Write results as a JSON baseline, with enough context to tell machines apart"""
+    document = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    logger.info(f"Saved {len(results)} results to {path}")
+
+def load_baseline(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path) as f:
+        document = json.load(f)
+    logger.info(f"Comparing against {path} ({document.get('created')}, {document.get('machine')})")
+    return document["results"]
+
+def parse_scales(text: str) -> List[int]:
+    return [int(part) for part in text.split(",") if part]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the generators, simulation ticks and sinks")
+
+    parser.add_argument("benchmarks", nargs="*", help="Benchmark names or prefixes to run, e.g. generate tick/vehicles (default: all)")
+    parser.add_argument("--rows", type=parse_scales, default=BENCHMARK_ROW_SCALES, help="Comma-separated row counts for generation, upload and serialisation runs")
+    parser.add_argument("--vehicles", type=parse_scales, default=BENCHMARK_FLEET_SCALES, help="Comma-separated live fleet sizes for tick runs")
+    parser.add_argument("--quick", action="store_true", help="Only run the smallest scale of each kind")
+    parser.add_argument("--save", nargs="?", const=BENCHMARK_BASELINE, default=None, help="Save the results as a JSON baseline")
+    parser.add_argument("--compare", nargs="?", const=BENCHMARK_BASELINE, default=None, help="Compare the results with a saved JSON baseline; exits with status 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_TOLERANCE, help="Relative change that counts as a regression")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    parser.add_argument("--verbose", action="store_true", help="Keep the generators' own logging")
+
+    args = parser.parse_args()
+    logger.setLevel(logging.INFO)
+
+    if args.list:
+        for name, (scale_kind, _) in CASES.items():
+            print(f"{name:<24}{scale_kind}")
+        sys.exit(0)
+
+    names = [name for name in CASES
+             if not args.benchmarks or any(name == b or name.startswith(b.rstrip("/") + "/") for b in args.benchmarks)]
+    scales = {"rows": args.rows, "fleet": args.vehicles}
+    if args.quick:
+        scales = {kind: values[:1] for kind, values in scales.items()}
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    results = run_benchmarks(names, scales, args.verbose)
+
+    regressions = []
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            logger.warning(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        else:
+            logger.info("No regressions")
+    if args.save:
+        save_baseline(args.save, results)
+    sys.exit(1 if regressions else 0)
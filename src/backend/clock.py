@@ -0,0 +1,226 @@
+import asyncio
+import datetime
+import logging
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
+
+from .config import SIMULATION_SPEED, SCHEDULER_RESOLUTION, TIMER_WHEEL_SLOTS, TIMER_WHEEL_LEVELS
+
+logger = logging.getLogger("traffic_simulator.clock")
+
+class SimulationClock:
+    """Class to map simulated (virtual) time onto wall-clock time
+
+    ``speed`` 1.0 runs in real time and N runs N times faster. ``speed`` 0
+    runs as fast as possible: virtual time only moves when the scheduler
+    jumps it to the next due tick. Deadlines are measured from the clock's
+    start, so they do not drift with the time spent in callbacks.
+    """
+
+    def __init__(self, speed: float = SIMULATION_SPEED, start: Optional[datetime.datetime] = None):
+        if speed < 0:
+            raise ValueError("speed must be >= 0 (0 runs as fast as possible)")
+        self.speed = speed
+        self.start = start or datetime.datetime.now()
+        self._current = self.start
+        self._wall_start: Optional[float] = None
+
+    @property
+    def as_fast_as_possible(self) -> bool:
+        return self.speed == 0
+
+    def _loop_time(self) -> float:
+        loop = asyncio.get_running_loop()
+        if self._wall_start is None:
+            self._wall_start = loop.time()
+        return loop.time()
+
+    def now(self) -> datetime.datetime:
+        """Current virtual time"""
+        if self.as_fast_as_possible:
+            return self._current
+        elapsed = (self._loop_time() - self._wall_start) * self.speed
+        return self.start + datetime.timedelta(seconds=elapsed)
+
+    def lag(self, moment: datetime.datetime) -> float:
+        """Virtual seconds by which the clock is already past ``moment`` (0 if not yet reached)"""
+        if self.as_fast_as_possible:
+            return 0.0
+        return max(0.0, (self.now() - moment).total_seconds())
+
+    async def sleep_until(self, moment: datetime.datetime):
+        """Wait until virtual time reaches ``moment``"""
+        if self.as_fast_as_possible:
+            self._current = max(self._current, moment)
+            # Still yield so uploads and other tasks get to run
+            await asyncio.sleep(0)
+            return
+        loop_time = self._loop_time()
+        deadline = self._wall_start + (moment - self.start).total_seconds() / self.speed
+        if deadline > loop_time:
+            await asyncio.sleep(deadline - loop_time)
+
+class TimerWheel:
+    """Hierarchical timing wheel of integer ticks
+
+    Level ``k`` has ``slots`` buckets of ``slots**k`` ticks each. A timer is
+    filed in the lowest level whose span covers its distance from the
+    current tick, and cascades one level down whenever the wheel reaches
+    the start of its bucket. Adding a timer and advancing one tick are both
+    O(1), amortised.
+    """
+
+    def __init__(self, slots: int = TIMER_WHEEL_SLOTS, levels: int = TIMER_WHEEL_LEVELS):
+        self.slots = slots
+        self.levels = levels
+        self.current = 0
+        self.count = 0
+        self.wheels: List[List[List[Tuple[int, Any]]]] = [
+            [[] for _ in range(slots)] for _ in range(levels)
+        ]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, item: Any, due: int):
+        """Schedule ``item`` to come out of ``advance`` at tick ``due``"""
+        due = max(due, self.current + 1)
+        self._file(item, due)
+        self.count += 1
+
+    def _file(self, item: Any, due: int):
+        delta = due - self.current
+        span = self.slots
+        for level in range(self.levels):
+            if delta < span or level == self.levels - 1:
+                # Timers beyond the top level's span are re-filed each time their bucket cascades
+                slot = (due // (span // self.slots)) % self.slots
+                self.wheels[level][slot].append((due, item))
+                return
+            span *= self.slots
+
+    def advance(self) -> List[Any]:
+        """Move to the next tick and return the items due on it"""
+        self.current += 1
+        # Cascade from the top so timers can fall through several levels in one step
+        for level in range(self.levels - 1, 0, -1):
+            width = self.slots ** level
+            if self.current % width:
+                continue
+            slot = (self.current // width) % self.slots
+            bucket = self.wheels[level][slot]
+            self.wheels[level][slot] = []
+            for due, item in bucket:
+                self._file(item, due)
+
+        slot = self.current % self.slots
+        bucket = self.wheels[0][slot]
+        due_items = [item for due, item in bucket if due == self.current]
+        self.wheels[0][slot] = [(due, item) for due, item in bucket if due != self.current]
+        self.count -= len(due_items)
+        return due_items
+
+class PeriodicTask:
+    """Bookkeeping for one callback run every ``interval`` virtual seconds"""
+
+    def __init__(self, name: str, interval: int, callback: Callable[[datetime.datetime], Awaitable[Any]]):
+        self.name = name
+        self.interval = interval  # in scheduler ticks
+        self.callback = callback
+        self.runs = 0
+        self.skipped = 0
+        self.max_lag = 0.0
+        self.running: Optional[asyncio.Task] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"task": self.name, "runs": self.runs, "skipped": self.skipped, "max_lag": round(self.max_lag, 3)}
+
+class SimulationScheduler:
+    """Class to drive every periodic simulation task off one clock
+
+    Tasks are kept in a ``TimerWheel`` and fired at exact multiples of
+    their interval in virtual time, so they never drift. In paced modes a
+    callback runs as its own task; if it is still running when its next
+    tick comes, or the loop woke up a whole interval late, the tick is
+    skipped and counted rather than queued. In as-fast-as-possible mode
+    each tick's callbacks are awaited before virtual time moves on.
+    """
+
+    def __init__(self, clock: SimulationClock, resolution: float = SCHEDULER_RESOLUTION):
+        self.clock = clock
+        self.resolution = resolution
+        self.wheel = TimerWheel()
+        self.tasks: List[PeriodicTask] = []
+
+    def every(self, interval: float, callback: Callable[[datetime.datetime], Awaitable[Any]],
+              name: Optional[str] = None) -> PeriodicTask:
+        """Run ``callback(now)`` every ``interval`` virtual seconds, starting at the first tick"""
+        ticks = max(1, round(interval / self.resolution))
+        task = PeriodicTask(name or getattr(callback, "__qualname__", "task"), ticks, callback)
+        self.tasks.append(task)
+        self.wheel.add(task, self.wheel.current + 1)
+        return task
+
+    def time_of(self, tick: int) -> datetime.datetime:
+        """Virtual time of a scheduler tick (tick 1 is the clock's start)"""
+        return self.clock.start + datetime.timedelta(seconds=(tick - 1) * self.resolution)
+
+    async def run(self, until: Optional[datetime.datetime] = None):
+        """Run until virtual time ``until`` (forever if None)"""
+        logger.info(f"Scheduler started at {self.clock.start.isoformat()} "
+                    f"({'as fast as possible' if self.clock.as_fast_as_possible else f'{self.clock.speed}x'})")
+        try:
+            while self.wheel:
+                due = self.wheel.advance()
+                if not due:
+                    continue
+                tick = self.wheel.current
+                moment = self.time_of(tick)
+                if until is not None and moment >= until:
+                    break
+
+                await self.clock.sleep_until(moment)
+                started = [self._fire(task, tick, moment) for task in due]
+                if self.clock.as_fast_as_possible:
+                    await asyncio.gather(*[t for t in started if t is not None])
+        finally:
+            pending = [task.running for task in self.tasks if task.running and not task.running.done()]
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            self.log_stats()
+
+    def _fire(self, task: PeriodicTask, tick: int, moment: datetime.datetime) -> Optional[asyncio.Task]:
+        next_tick = tick + task.interval
+        lag = self.clock.lag(moment)
+        task.max_lag = max(task.max_lag, lag)
+        started = None
+
+        if task.running is not None and not task.running.done():
+            task.skipped += 1
+            logger.warning(f"{task.name}: previous run still busy at {moment.isoformat()}, skipping tick")
+        else:
+            task.runs += 1
+            task.running = asyncio.create_task(self._run_callback(task, moment))
+            started = task.running
+
+        # Woke up at least one whole interval late: skip the missed ticks instead of bursting
+        missed = int(lag // (task.interval * self.resolution))
+        if missed:
+            task.skipped += missed
+            next_tick += missed * task.interval
+            logger.warning(f"{task.name}: {lag:.1f}s behind, skipped {missed} tick(s)")
+
+        self.wheel.add(task, next_tick)
+        return started
+
+    async def _run_callback(self, task: PeriodicTask, moment: datetime.datetime):
+        try:
+            await task.callback(moment)
+        except Exception as e:
+            logger.exception(f"{task.name} failed at {moment.isoformat()}: {str(e)}")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [task.to_dict() for task in self.tasks]
+
+    def log_stats(self):
+        for task in self.tasks:
+            logger.info(f"{task.name}: {task.runs} runs, {task.skipped} skipped ticks, max lag {task.max_lag:.2f}s")
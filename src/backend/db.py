@@ -1,120 +1,393 @@
-
+import asyncio
 import json
 import logging
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterable, AsyncIterator
 import httpx
-from .config import SUPABASE_URL, SUPABASE_KEY, DB_BATCH_SIZE
+from .config import (
+    SUPABASE_URL, SUPABASE_KEY, DB_MAX_CONNECTIONS,
+    DB_UPLOAD_CONCURRENCY, DB_BATCH_DELAY, DB_REQUEST_TIMEOUT, DB_MAX_RETRIES,
+    DB_MAX_BATCH_SIZE
+)
+from .batching import (
+    AdaptiveBatcher, TableThroughput, RETRYABLE_STATUS_CODES,
+    parse_retry_after, retry_delay
+)
+from .sinks import Sink
+from .schema import CONFLICT_KEYS, latest_per_key
 
 logger = logging.getLogger("traffic_simulator.db")
 
-class Database:
-    """Class to handle database operations"""
-    
-    def __init__(self):
-        self.base_url = SUPABASE_URL
-        self.key = SUPABASE_KEY
+def encode_rows(rows: List[Dict[str, Any]]) -> bytes:
+    """JSON body of a PostgREST bulk insert"""
+    return json.dumps(rows, separators=(",", ":"), default=str).encode("utf-8")
+
+class Database(Sink):
+    """Class to handle database operations
+
+    A single keep-alive connection pool is shared by every request made
+    through this object. Use it as an async context manager (or call
+    ``close()``) so the pool is released cleanly:
+
+        async with Database() as db:
+            await db.insert_data("vehicles", rows)
+    """
+
+    name = "supabase"
+
+    def __init__(self, max_connections: int = DB_MAX_CONNECTIONS,
+                 concurrency: int = DB_UPLOAD_CONCURRENCY, base_url: Optional[str] = None,
+                 key: Optional[str] = None):
+        super().__init__()
+        # Any PostgREST endpoint works, e.g. a local rest_server.py instead of the Supabase project
+        self.base_url = (base_url or SUPABASE_URL).rstrip("/")
+        self.key = key or SUPABASE_KEY
         self.headers = {
             "apikey": self.key,
             "Content-Type": "application/json",
             "Prefer": "resolution=merge-duplicates"
         }
-        
+        self.max_connections = max_connections
+        self.concurrency = max(1, concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._batchers: Dict[str, AdaptiveBatcher] = {}
+        self._resume_at = 0.0  # Event-loop time before which uploads are paused
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating the connection pool on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                timeout=DB_REQUEST_TIMEOUT
+            )
+        return self._client
+
+    async def close(self):
+        """Close the shared connection pool"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self) -> "Database":
+        self._get_client()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
     async def create_tables(self):
         """Create all necessary tables if they don't exist"""
         logger.info("Creating tables if they don't exist...")
-        
+
         # We'll assume the tables are already created in Supabase
         # This function is a placeholder for actual table creation
         # which would typically be done through migrations
-        
+
         logger.info("Tables verified.")
         return True
 
-    async def insert_data(self, table_name: str, data: List[Dict[str, Any]]) -> bool:
-        """Insert data into specified table with batching for large datasets"""
+    async def insert_data(self, table_name: str, data: List[Dict[str, Any]],
+                          concurrency: Optional[int] = None) -> bool:
+        """Insert data into specified table with batching for large datasets
+
+        Batches are sized adaptively per table (see ``AdaptiveBatcher``) and
+        up to ``concurrency`` batches (defaults to the value given at
+        construction) are kept in flight on the shared connection pool.
+        Failed batches are retried with jittered exponential backoff, and a
+        429/503 ``Retry-After`` pauses every upload slot, not just one.
+        """
         if not data:
             logger.warning(f"No data to insert into {table_name}")
             return False
-            
+
         logger.info(f"Inserting {len(data)} records into {table_name}")
-        
-        # Split data into batches to avoid timeouts
-        batches = [data[i:i + DB_BATCH_SIZE] for i in range(0, len(data), DB_BATCH_SIZE)]
-        
-        success_count = 0
-        for i, batch in enumerate(batches):
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{self.base_url}/rest/v1/{table_name}",
-                        headers=self.headers,
-                        json=batch,
-                        timeout=30.0
-                    )
-                    
-                    if response.status_code == 201:
-                        success_count += len(batch)
-                        logger.info(f"Successfully inserted batch {i+1}/{len(batches)} into {table_name}")
-                    else:
-                        logger.error(f"Failed to insert batch {i+1}/{len(batches)} into {table_name}. Status: {response.status_code}")
-                        logger.error(f"Response: {response.text}")
-                        
-                # Small delay between batches to avoid rate limits
-                time.sleep(0.5)
-                        
-            except Exception as e:
-                logger.error(f"Error inserting batch {i+1}/{len(batches)} into {table_name}: {str(e)}")
-                
+
+        async def pieces() -> AsyncIterator[List[Dict[str, Any]]]:
+            for i in range(0, len(data), DB_MAX_BATCH_SIZE):
+                yield data[i:i + DB_MAX_BATCH_SIZE]
+
+        success_count, _ = await self._upload_rows(table_name, pieces(), concurrency)
+
         logger.info(f"Successfully inserted {success_count}/{len(data)} records into {table_name}")
         return success_count > 0
-        
-    async def get_count(self, table_name: str) -> int:
-        """Get count of records in a table"""
+
+    async def insert_stream(self, table_name: str, chunks: AsyncIterable[List[Dict[str, Any]]],
+                            concurrency: Optional[int] = None) -> int:
+        """Insert records from an async iterator of chunks as they arrive
+
+        The next chunk is only pulled once an upload slot is free, so memory
+        stays bounded by the batch size and concurrency, not by the total
+        number of rows. Returns the number of records inserted.
+        """
+        logger.info(f"Streaming records into {table_name}")
+
+        success_count, total = await self._upload_rows(table_name, chunks, concurrency)
+
+        logger.info(f"Successfully inserted {success_count}/{total} streamed records into {table_name}")
+        return success_count
+
+    async def _upload_rows(self, table_name: str, chunks: AsyncIterable[List[Dict[str, Any]]],
+                           concurrency: Optional[int] = None) -> Tuple[int, int]:
+        """Re-slice incoming chunks into adaptive batches and upload them
+
+        Returns ``(rows inserted, rows received)``.
+        """
+        batcher = self._get_batcher(table_name)
+        stats = self._get_throughput(table_name)
+        slots = asyncio.Semaphore(max(1, concurrency or self.concurrency))
+        started = time.perf_counter()
+
+        pending = set()
+        inserted = 0
+        received = 0
+        number = 0
+        buffer: List[Dict[str, Any]] = []
+
+        def on_done(task: asyncio.Task):
+            nonlocal inserted
+            pending.discard(task)
+            if not task.cancelled() and task.exception() is None:
+                inserted += task.result()
+
+        async def dispatch(flush: bool):
+            nonlocal number
+            # Cut each batch only once an upload slot is free, so that its
+            # size reflects the latest latency feedback
+            while buffer and (flush or len(buffer) >= batcher.size):
+                await slots.acquire()
+                size = batcher.size
+                batch = buffer[:size]
+                del buffer[:size]
+                number += 1
+                task = asyncio.create_task(
+                    self._upload_slot(table_name, batch, number, batcher, stats, slots)
+                )
+                pending.add(task)
+                task.add_done_callback(on_done)
+
+        try:
+            async for chunk in chunks:
+                received += len(chunk)
+                buffer.extend(chunk)
+                await dispatch(flush=False)
+            await dispatch(flush=True)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            stats.elapsed += time.perf_counter() - started
+
+        logger.info(f"Throughput so far - {stats.summary()}")
+        return inserted, received
+
+    def throughput_report(self) -> List[Dict[str, Any]]:
+        """Return accumulated upload throughput for every table written so far"""
+        return [stats.to_dict() for stats in self.throughput.values()]
+
+    def _insert_url(self, table_name: str) -> str:
+        """Upsert endpoint, merging on the table's natural key rather than the primary key"""
+        url = f"{self.base_url}/rest/v1/{table_name}"
+        if table_name in CONFLICT_KEYS:
+            url += f"?on_conflict={CONFLICT_KEYS[table_name]}"
+        return url
+
+    def _get_batcher(self, table_name: str) -> AdaptiveBatcher:
+        if table_name not in self._batchers:
+            self._batchers[table_name] = AdaptiveBatcher()
+        return self._batchers[table_name]
+
+    async def _wait_for_backpressure(self):
+        """Sleep (without blocking the loop) while the server asked us to back off"""
+        delay = self._resume_at - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _upload_slot(self, table_name: str, batch: List[Dict[str, Any]], number: int,
+                           batcher: AdaptiveBatcher, stats: TableThroughput,
+                           slots: asyncio.Semaphore) -> int:
+        """Upload one batch and release its slot afterwards"""
         try:
-            async with httpx.AsyncClient() as client:
-                # Use count API
+            return await self._upload_batch(table_name, batch, number, batcher, stats)
+        finally:
+            # Optional pause before this slot takes the next batch
+            if DB_BATCH_DELAY > 0:
+                await asyncio.sleep(DB_BATCH_DELAY)
+            slots.release()
+
+    async def _upload_batch(self, table_name: str, batch: List[Dict[str, Any]], number: int,
+                            batcher: AdaptiveBatcher, stats: TableThroughput) -> int:
+        """POST one batch, retrying transient failures; return rows inserted"""
+        client = self._get_client()
+        # One upsert statement cannot touch the same key twice
+        rows = latest_per_key(table_name, batch)
+        try:
+            body = encode_rows(rows)
+        except Exception as e:
+            logger.error(f"Failed to encode batch {number} for {table_name}: {type(e).__name__}: {str(e)}")
+            stats.failed_rows += len(rows)
+            return 0
+
+        for attempt in range(DB_MAX_RETRIES + 1):
+            await self._wait_for_backpressure()
+            retry_after = None
+
+            try:
+                sent_at = time.perf_counter()
+                response = await client.post(
+                    self._insert_url(table_name),
+                    headers=self.headers,
+                    content=body
+                )
+                latency = time.perf_counter() - sent_at
+            except httpx.TransportError as e:
+                reason = f"{type(e).__name__}: {str(e)}"
+            except Exception as e:
+                # Anything else is not transient; fail this batch rather than the whole upload
+                logger.error(f"Failed to insert batch {number} into {table_name}: {type(e).__name__}: {str(e)}")
+                break
+            else:
+                if response.status_code == 201:
+                    batcher.record(len(rows), len(body), latency)
+                    stats.rows += len(rows)
+                    stats.bytes += len(body)
+                    stats.batches += 1
+                    logger.debug(f"Inserted batch {number} ({len(rows)} rows, {len(body)} bytes) into {table_name} in {latency:.2f}s")
+                    return len(rows)
+
+                if response.status_code == 413 and len(rows) > 1:
+                    # Payload too large: shrink future batches and split this one
+                    batcher.throttle()
+                    half = len(rows) // 2
+                    first = await self._upload_batch(table_name, rows[:half], number, batcher, stats)
+                    second = await self._upload_batch(table_name, rows[half:], number, batcher, stats)
+                    return first + second
+
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    logger.error(f"Failed to insert batch {number} into {table_name}. Status: {response.status_code}")
+                    logger.error(f"Response: {response.text}")
+                    break
+
+                reason = f"status {response.status_code}"
+                if response.status_code in (429, 503):
+                    batcher.throttle()
+                    retry_after = parse_retry_after(response.headers.get("retry-after"))
+
+            if attempt == DB_MAX_RETRIES:
+                logger.error(f"Giving up on batch {number} into {table_name} after {attempt + 1} attempts ({reason})")
+                break
+
+            delay = retry_delay(attempt, retry_after)
+            if retry_after is not None:
+                # Server-directed backoff applies to every upload slot
+                loop_time = asyncio.get_running_loop().time()
+                self._resume_at = max(self._resume_at, loop_time + delay)
+            stats.retries += 1
+            logger.warning(f"Batch {number} into {table_name} failed ({reason}); retry {attempt + 1}/{DB_MAX_RETRIES} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        stats.failed_rows += len(rows)
+        return 0
+
+    async def fetch_rows(self, table_name: str, columns: List[str], since: Optional[str] = None,
+                         since_column: str = "timestamp", limit: int = 1000,
+                         newest_first: bool = False) -> List[Dict[str, Any]]:
+        """Read rows back through PostgREST (see ``Sink.fetch_rows``), retrying transient failures"""
+        params = {
+            "select": ",".join(columns),
+            "order": f"{since_column}.{'desc' if newest_first else 'asc'}",
+            "limit": str(limit),
+        }
+        if since is not None:
+            params[since_column] = f"gt.{since}"
+
+        client = self._get_client()
+        for attempt in range(DB_MAX_RETRIES + 1):
+            await self._wait_for_backpressure()
+            retry_after = None
+
+            try:
                 response = await client.get(
-                    f"{self.base_url}/rest/v1/{table_name}?select=count",
-                    headers={
-                        "apikey": self.key,
-                        "Content-Type": "application/json",
-                        "Prefer": "count=exact"
-                    }
+                    f"{self.base_url}/rest/v1/{table_name}",
+                    params=params,
+                    headers={"apikey": self.key}
                 )
-                
+            except httpx.TransportError as e:
+                if attempt == DB_MAX_RETRIES:
+                    logger.error(f"Giving up fetching rows from {table_name} after {attempt + 1} attempts")
+                    raise
+                reason = f"{type(e).__name__}: {str(e)}"
+            else:
                 if response.status_code == 200:
-                    count = int(response.headers.get("content-range", "0/0").split("/")[1])
-                    logger.info(f"Table {table_name} has {count} records")
-                    return count
-                else:
-                    logger.error(f"Failed to get count for {table_name}. Status: {response.status_code}")
+                    return response.json()
+
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == DB_MAX_RETRIES:
+                    # An empty result would read as "no rows", so a failed read raises
+                    logger.error(f"Failed to fetch rows from {table_name}. Status: {response.status_code}")
                     logger.error(f"Response: {response.text}")
-                    return 0
-                    
+                    raise httpx.HTTPStatusError(
+                        f"Fetching rows from {table_name} failed with status {response.status_code}",
+                        request=response.request, response=response
+                    )
+
+                reason = f"status {response.status_code}"
+                if response.status_code in (429, 503):
+                    retry_after = parse_retry_after(response.headers.get("retry-after"))
+
+            delay = retry_delay(attempt, retry_after)
+            if retry_after is not None:
+                loop_time = asyncio.get_running_loop().time()
+                self._resume_at = max(self._resume_at, loop_time + delay)
+            logger.warning(f"Fetching rows from {table_name} failed ({reason}); retry {attempt + 1}/{DB_MAX_RETRIES} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def get_count(self, table_name: str) -> int:
+        """Get count of records in a table"""
+        try:
+            client = self._get_client()
+            # Use count API
+            response = await client.get(
+                f"{self.base_url}/rest/v1/{table_name}?select=count",
+                headers={
+                    "apikey": self.key,
+                    "Content-Type": "application/json",
+                    "Prefer": "count=exact"
+                }
+            )
+
+            if response.status_code == 200:
+                count = int(response.headers.get("content-range", "0/0").split("/")[1])
+                logger.info(f"Table {table_name} has {count} records")
+                return count
+            else:
+                logger.error(f"Failed to get count for {table_name}. Status: {response.status_code}")
+                logger.error(f"Response: {response.text}")
+                return 0
+
         except Exception as e:
             logger.error(f"Error getting count for {table_name}: {str(e)}")
             return 0
-            
+
     async def clear_table(self, table_name: str) -> bool:
         """Clear all data from a table"""
         logger.warning(f"Clearing all data from {table_name}")
-        
+
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.delete(
-                    f"{self.base_url}/rest/v1/{table_name}?select=*",
-                    headers=self.headers
-                )
-                
-                if response.status_code in (200, 204):
-                    logger.info(f"Successfully cleared table {table_name}")
-                    return True
-                else:
-                    logger.error(f"Failed to clear table {table_name}. Status: {response.status_code}")
-                    logger.error(f"Response: {response.text}")
-                    return False
-                    
+            client = self._get_client()
+            response = await client.delete(
+                f"{self.base_url}/rest/v1/{table_name}?select=*",
+                headers=self.headers
+            )
+
+            if response.status_code in (200, 204):
+                logger.info(f"Successfully cleared table {table_name}")
+                return True
+            else:
+                logger.error(f"Failed to clear table {table_name}. Status: {response.status_code}")
+                logger.error(f"Response: {response.text}")
+                return False
+
         except Exception as e:
             logger.error(f"Error clearing table {table_name}: {str(e)}")
             return False
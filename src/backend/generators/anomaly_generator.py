@@ -2,234 +2,218 @@
 import asyncio
 import datetime
 import logging
-import random
-from typing import List, Dict, Any
-import uuid
+from typing import List, Dict, Any, AsyncIterator, Optional
+
+import numpy as np
 
 from ..config import (
-    ANOMALY_TYPES, ANOMALY_SEVERITY, ANOMALY_SEVERITY_WEIGHTS,
-    get_traffic_volume_factor, ANOMALY_UPDATE_INTERVAL,
-    get_timestamp_hours_ago
+    ANOMALY_UPDATE_INTERVAL, VEHICLE_UPDATE_INTERVAL, ANOMALY_SEVERITY, DETECTED_ANOMALY_TYPES,
+    HISTORICAL_CHUNK_SIZE, get_timestamp_hours_ago, generate_vehicle_id
+)
+from ..clock import SimulationClock, SimulationScheduler
+from ..registry import VehicleRegistry
+from ..rng import RngStreams, get_streams
+from .sampling import (
+    LIVE_ANOMALY_TYPE_TABLE, UNDETECTED_ANOMALY_TYPE_TABLE, ANOMALY_SEVERITY_TABLE, ANOMALY_MESSAGE_TEMPLATES,
+    draw_anomalies
 )
+from .vehicle_engine import random_timestamps
+from .fleet import FleetStore
+from .detector import TelemetryDetector, OVERSPEED, BRAKING
+from ..traffic_profile import get_traffic_profile
 
 logger = logging.getLogger("traffic_simulator.anomaly_generator")
 
 class AnomalyGenerator:
-    """Class to generate realistic traffic anomaly data"""
+    """Class to generate realistic traffic anomaly data
     
-    def __init__(self, db):
+    Given the live vehicle ``fleet``, Overspeed, Emergency Braking and GPS
+    Spoofing anomalies are detected from its telemetry on every vehicle
+    tick (see ``detect``), and only the other types are drawn at random.
+    """
+    
+    def __init__(self, db, registry: Optional[VehicleRegistry] = None, streams: Optional[RngStreams] = None,
+                 fleet: Optional[FleetStore] = None):
         self.db = db
+        self.registry = registry if registry is not None else VehicleRegistry()
+        self.streams = (streams or get_streams()).child("anomalies")
+        self.random = self.streams.python("live")  # Live ticks
+        self.fleet = fleet
+        self.detector = TelemetryDetector() if fleet is not None else None
         
-    async def generate_historical_data(self, count: int = 10000) -> List[Dict[str, Any]]:
+    async def generate_historical_data(self, count: int = 10000,
+                                       vehicle_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """Generate historical anomaly data for the past 24 hours"""
         logger.info(f"Generating {count} historical anomaly records")
         
         anomalies = []
+        async for chunk in self.stream_historical_data(count, vehicle_ids=vehicle_ids):
+            anomalies.extend(chunk)
+                
+        logger.info(f"Generated {len(anomalies)} historical anomaly records")
+        return anomalies
+        
+    async def stream_historical_data(self, count: int = 10000, chunk_size: int = HISTORICAL_CHUNK_SIZE,
+                                     vehicle_ids: Optional[List[str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield historical anomaly records in chunks of at most ``chunk_size`` rows
+        
+        Anomalies refer to ``vehicle_ids`` when given, otherwise to vehicles
+        in the shared registry.
+        """
+        if vehicle_ids is None:
+            vehicle_ids = await self.fetch_vehicle_ids()
         now = datetime.datetime.now()
         
-        # Get active vehicles first to reference in anomalies
-        async with self.db.client.get(
-            f"{self.db.base_url}/rest/v1/vehicles?select=vehicle_id,vehicle_type&limit=1000",
-            headers=self.db.headers
-        ) as response:
-            if response.status_code == 200:
-                vehicles = await response.json()
-            else:
-                # Fallback to generating random vehicle IDs
-                logger.warning("Failed to fetch vehicles, using random IDs")
-                vehicles = [{"vehicle_id": f"TS0{random.randint(7, 9)}-{random.randint(1000, 9999)}"} for _ in range(100)]
-        
-        vehicle_ids = [v["vehicle_id"] for v in vehicles] if vehicles else []
-        
-        # Generate anomalies across 24 hours
-        for i in range(count):
-            # Random time in the last 24 hours
-            hours_ago = random.uniform(0, 24)
-            minutes_ago = int(hours_ago * 60)
-            timestamp = now - datetime.timedelta(minutes=minutes_ago)
-            
-            # Anomaly frequency is higher during peak hours
-            hour_of_day = timestamp.hour
-            traffic_factor = get_traffic_volume_factor(hour_of_day)
-            
-            # Skip some timestamps during low traffic times
-            if random.random() > traffic_factor * 1.5 and i % 3 != 0:
-                continue
-                
-            # Select random anomaly type based on configured probabilities
-            anomaly_type = random.choices(
-                list(ANOMALY_TYPES.keys()),
-                weights=list(ANOMALY_TYPES.values())
-            )[0]
-            
-            # Select random severity
-            severity = random.choices(
-                ANOMALY_SEVERITY,
-                weights=ANOMALY_SEVERITY_WEIGHTS
-            )[0]
-            
-            # Get a random vehicle
-            vehicle_id = random.choice(vehicle_ids) if vehicle_ids else f"TS0{random.randint(7, 9)}-{random.randint(1000, 9999)}"
-            
-            # Generate descriptive message based on anomaly type
-            messages = {
-                "Overspeed": [
-                    f"Vehicle {vehicle_id} detected at excess speed",
-                    f"Speed limit violation detected for {vehicle_id}",
-                    f"High speed alert for {vehicle_id}"
-                ],
-                "Emergency Braking": [
-                    f"Hard braking event detected for {vehicle_id}",
-                    f"Emergency stop by {vehicle_id}",
-                    f"Sudden deceleration alert for {vehicle_id}"
-                ],
-                "RSU Offline": [
-                    f"Lost connection with RSU near {vehicle_id}",
-                    f"RSU communication failure in {vehicle_id} zone",
-                    f"RSU offline alert in traffic zone"
-                ],
-                "Signal Tampering": [
-                    f"Suspicious signal activity detected from {vehicle_id}",
-                    f"Possible tampering attempt by {vehicle_id}",
-                    f"Signal integrity violation for {vehicle_id}"
-                ],
-                "GPS Spoofing": [
-                    f"GPS position mismatch detected for {vehicle_id}",
-                    f"Location spoofing attempt by {vehicle_id}",
-                    f"Suspicious location data from {vehicle_id}"
-                ],
-                "Unauthorized Access": [
-                    f"Security breach attempt on {vehicle_id}",
-                    f"Unauthorized control signal for {vehicle_id}",
-                    f"Access violation detected for {vehicle_id}"
-                ],
-                "Software Malfunction": [
-                    f"Software error reported by {vehicle_id}",
-                    f"System malfunction in {vehicle_id}",
-                    f"Diagnostic error code from {vehicle_id}"
-                ]
-            }
-            
-            message = random.choice(messages.get(anomaly_type, [f"{anomaly_type} alert for {vehicle_id}"]))
+        for start in range(0, count, chunk_size):
+            stop = min(count, start + chunk_size)
+            chunk = self.generate_chunk(start, stop, vehicle_ids, now)
+            logger.info(f"Generated {stop}/{count} historical anomaly records")
+            if chunk:
+                yield chunk
+            # Give in-flight uploads a chance to run between chunks
+            await asyncio.sleep(0)
+        
+    async def fetch_vehicle_ids(self) -> List[str]:
+        """Return vehicle IDs that historical anomalies can refer to"""
+        await self.registry.refresh(self.db, force=True)
+        vehicle_ids = self.registry.ids()
+        
+        if not vehicle_ids:
+            # Fallback to generating random vehicle IDs
+            logger.warning("No known vehicles, using random IDs")
+            vehicle_ids = self.fallback_vehicle_ids()
+        
+        return vehicle_ids
+        
+    def fallback_vehicle_ids(self, count: int = 100) -> List[str]:
+        """Random vehicle IDs to use when no vehicles are known, the same in every process"""
+        rng = self.streams.python("fallback_ids")
+        return [generate_vehicle_id(rng) for _ in range(count)]
+        
+    def generate_chunk(self, start: int, stop: int, vehicle_ids: List[str],
+                       now: datetime.datetime) -> List[Dict[str, Any]]:
+        """Generate the anomaly rows for candidate indices ``[start, stop)``
+        
+        Rows are drawn in blocks from the "history" stream, so they are the
+        same however the candidates are split into chunks.
+        """
+        if not vehicle_ids:
+            vehicle_ids = self.fallback_vehicle_ids()
+        columns = self.streams.draw_rows(
+            start, stop, lambda rng, first, count: self.draw_block(rng, first, count, vehicle_ids, now), "history"
+        )
+        columns.pop("row", None)
+        names = list(columns)
+        return [dict(zip(names, row)) for row in zip(*(values.tolist() for values in columns.values()))]
+        
+    def draw_block(self, rng: np.random.Generator, first: int, count: int, vehicle_ids: List[str],
+                   now: datetime.datetime) -> Dict[str, np.ndarray]:
+        """Draw the anomaly columns for ``count`` candidates starting at index ``first``"""
+        # Random times in the last 24 hours; anomaly frequency is higher during
+        # peak hours, so some candidates at low traffic times are skipped
+        timestamps = random_timestamps(rng, now, count)
+        factors = get_traffic_profile().factors(timestamps)
+        keep = (rng.random(count) <= factors * 1.5) | ((first + np.arange(count)) % 3 == 0)
+        timestamps = timestamps[keep]
+        n = len(timestamps)
+        
+        rows = np.flatnonzero(keep)
+        columns = {
+            # Keyed by candidate index, so IDs stay unique across chunks, workers and shards
+            "id": self.streams.row_uuids(first + rows, "ids", now.isoformat()),
+            "timestamp": np.datetime_as_string(timestamps, unit="us"),
+            **draw_anomalies(n, vehicle_ids, rng),
+        }
+        columns = {name: np.asarray(values, dtype=object) for name, values in columns.items()}
+        columns["row"] = rows
+        return columns
+        
+    async def tick(self, now: datetime.datetime):
+        """Generate one round of anomalies at virtual time ``now``"""
+        traffic_factor = get_traffic_profile().factor(now)
+        
+        # Number of anomalies to generate is based on time of day
+        # During peak hours, generate more anomalies
+        num_anomalies = max(1, int(self.random.randint(2, 5) * traffic_factor))
+        
+        # Pick the vehicles involved from the shared registry (no per-cycle fetch)
+        await self.registry.refresh(self.db)
+        vehicle_ids = self.registry.sample(num_anomalies, self.random)
+        if not vehicle_ids:
+            # Fallback to generating random vehicle IDs
+            vehicle_ids = [generate_vehicle_id(self.random) for _ in range(num_anomalies)]
+        
+        anomalies = []
+        anomaly_ids = self.streams.row_uuids(np.arange(len(vehicle_ids)), "live", now.isoformat())
+        
+        type_table = UNDETECTED_ANOMALY_TYPE_TABLE if self.detector is not None else LIVE_ANOMALY_TYPE_TABLE
+        for vehicle_id, anomaly_id in zip(vehicle_ids, anomaly_ids):
+            anomaly_type = type_table.draw(self.random)
+            severity = ANOMALY_SEVERITY_TABLE.draw(self.random)
+            message = ANOMALY_MESSAGE_TEMPLATES.render(anomaly_type, vehicle_id, self.random)
             
             anomaly = {
-                "id": str(uuid.uuid4()),
-                "timestamp": timestamp.isoformat(),
+                "id": anomaly_id,
+                "timestamp": now.isoformat(),
                 "vehicle_id": vehicle_id,
                 "type": anomaly_type,
                 "severity": severity,
                 "message": message,
-                "status": "Detected" if random.random() < 0.7 else "Resolved",
+                "status": "Detected",
             }
             
             anomalies.append(anomaly)
-            
-            if i % 1000 == 0:
-                logger.info(f"Generated {i+1}/{count} historical anomaly records")
-                
-        logger.info(f"Generated {len(anomalies)} historical anomaly records")
-        return anomalies
         
-    async def simulate(self):
-        """Run continuous simulation of anomaly detection"""
+        # Insert anomalies into database
+        if anomalies:
+            await self.db.insert_data("anomalies", anomalies)
+            logger.info(f"Generated {len(anomalies)} new anomalies")
+        
+    async def detect(self, now: datetime.datetime):
+        """Check the fleet's telemetry at virtual time ``now`` and insert the anomalies it shows"""
+        if self.detector is None:
+            return
+        detections = self.detector.observe(self.fleet, now)
+        if not len(detections["slot"]):
+            return
+        
+        vehicle_ids = self.fleet.vehicle_id[detections["slot"]].tolist()
+        severities = self.detector.severity(detections["value"], detections["limit"]).tolist()
+        anomaly_ids = self.streams.row_uuids(np.arange(len(vehicle_ids)), "detected", now.isoformat())
+        anomalies = []
+        for anomaly_id, vehicle_id, kind, severity, value, limit in zip(
+            anomaly_ids, vehicle_ids, detections["type"].tolist(), severities,
+            detections["value"].tolist(), detections["limit"].tolist()
+        ):
+            anomaly_type = DETECTED_ANOMALY_TYPES[kind]
+            unit = "m/s²" if kind == BRAKING else "km/h"
+            reading = f"{value:.1f} {unit}, limit {limit:g} {unit}"
+            if kind == OVERSPEED:
+                reading = f"sustained {reading}"
+            anomalies.append({
+                "id": anomaly_id,
+                "timestamp": now.isoformat(),
+                "vehicle_id": vehicle_id,
+                "type": anomaly_type,
+                "severity": ANOMALY_SEVERITY[severity],
+                "message": f"{ANOMALY_MESSAGE_TEMPLATES.render(anomaly_type, vehicle_id, self.random)} ({reading})",
+                "status": "Detected",
+            })
+        
+        await self.db.insert_data("anomalies", anomalies)
+        logger.info(f"Detected {len(anomalies)} anomalies in vehicle telemetry")
+        
+    async def simulate(self, clock: Optional[SimulationClock] = None):
+        """Run continuous simulation of anomaly detection
+        
+        Runs ``tick`` every ANOMALY_UPDATE_INTERVAL on its own scheduler;
+        ``run_simulations`` in seed_data.py drives all generators off one
+        shared clock instead.
+        """
         logger.info("Starting anomaly simulation")
         
-        while True:
-            current_hour = datetime.datetime.now().hour
-            traffic_factor = get_traffic_volume_factor(current_hour)
-            
-            # Number of anomalies to generate is based on time of day
-            # During peak hours, generate more anomalies
-            num_anomalies = max(1, int(random.randint(2, 5) * traffic_factor))
-            
-            # Get active vehicles to reference in anomalies
-            async with self.db.client.get(
-                f"{self.db.base_url}/rest/v1/vehicles?select=vehicle_id,vehicle_type&limit=1000",
-                headers=self.db.headers
-            ) as response:
-                if response.status_code == 200:
-                    vehicles = await response.json()
-                    vehicle_ids = [v["vehicle_id"] for v in vehicles]
-                else:
-                    # Fallback to generating random vehicle IDs
-                    vehicle_ids = [f"TS0{random.randint(7, 9)}-{random.randint(1000, 9999)}" for _ in range(100)]
-            
-            anomalies = []
-            
-            for _ in range(num_anomalies):
-                # Select random anomaly type based on configured probabilities
-                anomaly_type = random.choices(
-                    list(ANOMALY_TYPES.keys()),
-                    weights=list(ANOMALY_TYPES.values())
-                )[0]
-                
-                # Select random severity
-                severity = random.choices(
-                    ANOMALY_SEVERITY,
-                    weights=ANOMALY_SEVERITY_WEIGHTS
-                )[0]
-                
-                # Get a random vehicle
-                vehicle_id = random.choice(vehicle_ids)
-                
-                # Generate descriptive message based on anomaly type
-                messages = {
-                    "Overspeed": [
-                        f"Vehicle {vehicle_id} detected at excess speed",
-                        f"Speed limit violation detected for {vehicle_id}",
-                        f"High speed alert for {vehicle_id}"
-                    ],
-                    "Emergency Braking": [
-                        f"Hard braking event detected for {vehicle_id}",
-                        f"Emergency stop by {vehicle_id}",
-                        f"Sudden deceleration alert for {vehicle_id}"
-                    ],
-                    "RSU Offline": [
-                        f"Lost connection with RSU near {vehicle_id}",
-                        f"RSU communication failure in {vehicle_id} zone",
-                        f"RSU offline alert in traffic zone"
-                    ],
-                    "Signal Tampering": [
-                        f"Suspicious signal activity detected from {vehicle_id}",
-                        f"Possible tampering attempt by {vehicle_id}",
-                        f"Signal integrity violation for {vehicle_id}"
-                    ],
-                    "GPS Spoofing": [
-                        f"GPS position mismatch detected for {vehicle_id}",
-                        f"Location spoofing attempt by {vehicle_id}",
-                        f"Suspicious location data from {vehicle_id}"
-                    ],
-                    "Unauthorized Access": [
-                        f"Security breach attempt on {vehicle_id}",
-                        f"Unauthorized control signal for {vehicle_id}",
-                        f"Access violation detected for {vehicle_id}"
-                    ],
-                    "Software Malfunction": [
-                        f"Software error reported by {vehicle_id}",
-                        f"System malfunction in {vehicle_id}",
-                        f"Diagnostic error code from {vehicle_id}"
-                    ]
-                }
-                
-                message = random.choice(messages.get(anomaly_type, [f"{anomaly_type} alert for {vehicle_id}"]))
-                
-                anomaly = {
-                    "id": str(uuid.uuid4()),
-                    "timestamp": datetime.datetime.now().isoformat(),
-                    "vehicle_id": vehicle_id,
-                    "type": anomaly_type,
-                    "severity": severity,
-                    "message": message,
-                    "status": "Detected",
-                }
-                
-                anomalies.append(anomaly)
-            
-            # Insert anomalies into database
-            if anomalies:
-                await self.db.insert_data("anomalies", anomalies)
-                logger.info(f"Generated {len(anomalies)} new anomalies")
-                
-            # Wait for next update interval with some randomness
-            wait_time = ANOMALY_UPDATE_INTERVAL + random.randint(-60, 60)
-            await asyncio.sleep(max(60, wait_time))  # At least 1 minute
+        scheduler = SimulationScheduler(clock or SimulationClock())
+        scheduler.every(ANOMALY_UPDATE_INTERVAL, self.tick, name="anomalies")
+        if self.detector is not None:
+            scheduler.every(VEHICLE_UPDATE_INTERVAL, self.detect, name="detector")
+        await scheduler.run()
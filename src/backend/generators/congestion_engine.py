@@ -0,0 +1,309 @@
+
+import datetime
+import logging
+import math
+import random
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from ..config import (
+    TRAFFIC_ZONES, CITY_CENTER_LAT, CITY_CENTER_LNG, CONGESTION_PEAK_RULES, CONGESTION_NOISE_STD,
+    CONGESTION_AR_TIMESCALE, CONGESTION_HISTORY_HOURS, CONGESTION_HISTORY_RESOLUTION, CONGESTION_SYNTHETIC_RADIUS_KM,
+    KM_PER_DEGREE
+)
+from ..traffic_profile import TrafficProfile, get_traffic_profile
+from .vehicle_engine import hour_of_day
+
+logger = logging.getLogger("traffic_simulator.congestion_engine")
+
+# Record columns in the order the congestion generator emits them
+CONGESTION_COLUMNS = ["zone_name", "lat", "lng", "congestion_level", "updated_at"]
+
+# Zone × sample cells held at once when replaying the history for its final state
+HISTORY_STATE_CELLS = 1 << 20
+
+def ar1_scan(initial: np.ndarray, inputs: np.ndarray, phi: float, block: int = 64) -> np.ndarray:
+    """Run ``x[t] = phi * x[t-1] + inputs[:, t]`` along axis 1, starting from ``x[-1] = initial``
+
+    Blocks of ``block`` steps are solved with one matrix product each, so
+    the Python loop runs ``T / block`` times instead of ``T``; powers of
+    ``phi`` never exceed ``block``, which keeps it numerically stable.
+    """
+    out = np.empty_like(inputs)
+    powers = phi ** np.arange(block + 1)
+    k = np.arange(block)
+    kernel = np.tril(powers[np.abs(k[:, None] - k[None, :])])  # kernel[i, j] = phi**(i - j) for j <= i
+    last = initial
+    for start in range(0, inputs.shape[1], block):
+        u = inputs[:, start:start + block]
+        n = u.shape[1]
+        out[:, start:start + n] = u @ kernel[:n, :n].T + last[:, None] * powers[1:n + 1]
+        last = out[:, start + n - 1]
+    return out
+
+class PeakRules:
+    """Compiled form of ``CONGESTION_PEAK_RULES``
+
+    ``active[r, hour]`` says whether rule ``r`` applies at an hour of day;
+    ``boost_low`` / ``boost_high`` hold each rule's inclusive boost range.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]] = CONGESTION_PEAK_RULES):
+        self.rules = rules
+        self.active = np.zeros((len(rules), 24), dtype=bool)
+        self.boost_low = np.zeros(len(rules), dtype=np.int64)
+        self.boost_high = np.zeros(len(rules), dtype=np.int64)
+        for r, rule in enumerate(rules):
+            for first, last in rule["hours"]:
+                self.active[r, first:last] = True
+            self.boost_low[r], self.boost_high[r] = rule["boost"]
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def rule_of(self, zone_name: str) -> int:
+        """Index of the first rule listing ``zone_name``, or -1"""
+        for r, rule in enumerate(self.rules):
+            if zone_name in rule["zones"]:
+                return r
+        return -1
+
+class ZoneTable:
+    """Class to hold congestion zones as column arrays, with the peak rule each follows"""
+
+    def __init__(self, names: np.ndarray, lat: np.ndarray, lng: np.ndarray, rule: np.ndarray):
+        self.names = names
+        self.lat = lat
+        self.lng = lng
+        self.rule = rule  # Index into PeakRules, -1 for none
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_config(cls, rules: PeakRules, zones: Dict[str, Dict[str, float]] = TRAFFIC_ZONES) -> "ZoneTable":
+        return cls(
+            np.array(list(zones.keys()), dtype=object),
+            np.array([z["lat"] for z in zones.values()]),
+            np.array([z["lng"] for z in zones.values()]),
+            np.array([rules.rule_of(name) for name in zones], dtype=np.int64),
+        )
+
+    def with_synthetic(self, count: int, rng: np.random.Generator,
+                       radius_km: float = CONGESTION_SYNTHETIC_RADIUS_KM) -> "ZoneTable":
+        """Return this table plus ``count`` zones on a square grid around the city center
+
+        Synthetic zones follow the peak rules in the same proportions as
+        the configured zones.
+        """
+        if count <= 0:
+            return self
+        side = math.ceil(math.sqrt(count))
+        rows, cols = np.divmod(np.arange(count), side)
+        offsets = np.linspace(-radius_km, radius_km, side) if side > 1 else np.zeros(1)
+        lat = CITY_CENTER_LAT + offsets[rows] / KM_PER_DEGREE
+        lng = CITY_CENTER_LNG + offsets[cols] / (KM_PER_DEGREE * np.cos(np.radians(lat)))
+        names = np.array([f"Grid R{r:03d}C{c:03d}" for r, c in zip(rows.tolist(), cols.tolist())], dtype=object)
+        rule = self.rule[rng.integers(0, len(self.rule), count)]
+        return ZoneTable(
+            np.concatenate([self.names, names]), np.concatenate([self.lat, lat]),
+            np.concatenate([self.lng, lng]), np.concatenate([self.rule, rule]),
+        )
+
+class CongestionEngine:
+    """Columnar engine for zone congestion levels
+
+    Computes a whole zone × time matrix in one pass from the traffic
+    profile (see ``traffic_profile.py``), noise, and the zone's peak-rule boost,
+    clamped to 0-100. The history is a zone-major grid of ``hours`` at one
+    sample every ``resolution`` seconds, so horizons of days or weeks and
+    thousands of zones only change the grid size.
+
+    With a ``timescale`` each zone's level is an AR(1) process relaxing
+    towards the diurnal target (profile volume plus mean peak boost),
+    so consecutive samples are correlated and hour changes ramp in instead
+    of jumping. Live ticks advance the per-zone ``state`` in O(zones)
+    whatever the gap since the last tick, starting from the end of the
+    history (``resume``) rather than a fresh draw. History series are seeded per
+    zone from ``seed``, so a zone split across chunks (or worker
+    processes) is still one continuous series. ``timescale`` 0 draws each
+    sample independently, as the original per-zone loop did.
+    """
+
+    def __init__(self, zones: Optional[ZoneTable] = None, rules: Optional[PeakRules] = None,
+                 hours: float = CONGESTION_HISTORY_HOURS, resolution: float = CONGESTION_HISTORY_RESOLUTION,
+                 noise_std: float = CONGESTION_NOISE_STD, timescale: float = CONGESTION_AR_TIMESCALE,
+                 seed: Optional[int] = None, profile: Optional[TrafficProfile] = None):
+        self.rules = rules or PeakRules()
+        self.zones = zones or ZoneTable.from_config(self.rules)
+        self.hours = hours
+        self.resolution = resolution
+        self.noise_std = noise_std
+        self.timescale = timescale
+        self.seed = seed if seed is not None else random.getrandbits(63)
+
+        # Live AR(1) state: each zone's unclamped level and when it was last advanced
+        self.state: Optional[np.ndarray] = None
+        self.state_time: Optional[datetime.datetime] = None
+
+        self.profile = profile or get_traffic_profile()
+        self.profile_rows = self.profile.rows_for(self.zones.names)
+        self.boost_mean = (self.rules.boost_low + self.rules.boost_high) / 2
+
+    @property
+    def slots(self) -> int:
+        """Samples per zone in the history"""
+        return max(1, int(self.hours * 3600 // self.resolution))
+
+    def history_size(self) -> int:
+        return len(self.zones) * self.slots
+
+    def history_times(self, now: datetime.datetime) -> np.ndarray:
+        """Sample times of the history, newest first, as datetime64"""
+        steps = (np.arange(self.slots) * self.resolution * 1e6).astype("timedelta64[us]")
+        return np.datetime64(now, "us") - steps
+
+    def _peaks(self, zones: np.ndarray, times: np.ndarray):
+        """Peak-rule mask (zones × times) and each zone's rule index (0 for zones without one)"""
+        rule = self.zones.rule[zones]
+        ruled = rule >= 0
+        safe = np.where(ruled, rule, 0)
+        if not len(self.rules):
+            return np.zeros((len(zones), len(times)), dtype=bool), safe
+        return ruled[:, None] & self.rules.active[safe][:, hour_of_day(times)], safe
+
+    def volume(self, zones: np.ndarray, times: np.ndarray) -> np.ndarray:
+        """Traffic-profile volume factor of each of ``zones`` (rows) at each of ``times`` (columns)"""
+        return self.profile.factors(times, self.profile_rows[zones][:, None])
+
+    def levels(self, zones: np.ndarray, times: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Independent congestion levels (0-100) of each of ``zones`` (rows) at each of ``times`` (columns)"""
+        shape = (len(zones), len(times))
+        base = self.volume(zones, times) * 100
+        level = np.clip(np.trunc(base + rng.normal(0, self.noise_std, shape)), 0, 100)
+
+        peak, rule = self._peaks(zones, times)
+        low = self.rules.boost_low[rule][:, None] if len(self.rules) else np.zeros((len(zones), 1))
+        high = self.rules.boost_high[rule][:, None] if len(self.rules) else low
+        boost = low + np.floor(rng.random(shape) * (high - low + 1))
+        return np.minimum(100, level + np.where(peak, boost, 0)).astype(np.int64)
+
+    def targets(self, zones: np.ndarray, times: np.ndarray) -> np.ndarray:
+        """Diurnal target level of each of ``zones`` (rows) at each of ``times`` (columns)"""
+        peak, rule = self._peaks(zones, times)
+        boost = self.boost_mean[rule][:, None] if len(self.rules) else 0.0
+        return self.volume(zones, times) * 100 + np.where(peak, boost, 0)
+
+    def phi(self, seconds: float) -> float:
+        """AR(1) coefficient for a step of ``seconds``"""
+        return float(np.exp(-seconds / self.timescale)) if self.timescale > 0 else 0.0
+
+    def series(self, zones: np.ndarray, times: np.ndarray) -> np.ndarray:
+        """Correlated levels of ``zones`` over ``times`` (oldest first, ``resolution`` apart)"""
+        return np.clip(np.trunc(self._states(zones, times)), 0, 100).astype(np.int64)
+
+    def _states(self, zones: np.ndarray, times: np.ndarray) -> np.ndarray:
+        """Unclamped AR(1) states behind ``series``"""
+        phi = self.phi(self.resolution)
+        target = self.targets(zones, times)
+        # Per-zone streams, so each zone's series is the same whichever chunk computes it
+        noise = np.stack([np.random.default_rng((self.seed, int(zone))).standard_normal(len(times) + 1)
+                          for zone in zones]) if len(zones) else np.empty((0, len(times) + 1))
+        # Start in the stationary distribution around the first target
+        initial = target[:, 0] + self.noise_std * noise[:, 0]
+        inputs = (1 - phi) * target + self.noise_std * np.sqrt(1 - phi ** 2) * noise[:, 1:]
+        return ar1_scan(initial, inputs, phi)
+
+    def history_state(self, now: datetime.datetime) -> np.ndarray:
+        """Unclamped level of every zone at the newest sample of the history ending at ``now``
+
+        Replays the same per-zone series ``history_columns`` draws, a batch
+        of zones at a time, keeping only the last state of each.
+        """
+        zones = np.arange(len(self.zones))
+        times = self.history_times(now)[::-1]
+        batch = max(1, HISTORY_STATE_CELLS // len(times))
+        return np.concatenate([
+            self._states(zones[i:i + batch], times)[:, -1] for i in range(0, len(zones), batch)
+        ] or [np.empty(0)])
+
+    def resume(self, state: np.ndarray, time: datetime.datetime):
+        """Continue the live state from ``state`` (one unclamped level per zone) at ``time``"""
+        self.state = np.asarray(state, dtype=float)
+        self.state_time = time
+
+    def resume_levels(self, levels: Dict[str, float], time: datetime.datetime):
+        """Continue the live state from stored levels by zone name at ``time``
+
+        Zones without a stored level start at their target.
+        """
+        zones = np.arange(len(self.zones))
+        state = self.targets(zones, np.array([np.datetime64(time, "us")]))[:, 0]
+        for slot, name in enumerate(self.zones.names.tolist()):
+            if name in levels:
+                state[slot] = levels[name]
+        self.resume(state, time)
+
+    def advance(self, now: datetime.datetime, rng: np.random.Generator) -> np.ndarray:
+        """Step every zone's live state to ``now`` in O(zones); return the levels"""
+        zones = np.arange(len(self.zones))
+        target = self.targets(zones, np.array([np.datetime64(now, "us")]))[:, 0]
+        noise = rng.standard_normal(len(zones))
+        if self.state is None or len(self.state) != len(zones):
+            self.state = target + self.noise_std * noise
+        else:
+            phi = self.phi(max(0.0, (now - self.state_time).total_seconds()))
+            self.state = phi * self.state + (1 - phi) * target + self.noise_std * np.sqrt(1 - phi ** 2) * noise
+        self.state_time = now
+        return np.clip(np.trunc(self.state), 0, 100).astype(np.int64)
+
+    def history_columns(self, start: int, stop: int, now: datetime.datetime) -> Dict[str, np.ndarray]:
+        """Columns for records ``[start, stop)`` of the zone-major history grid
+
+        Every zone draws from its own stream seeded from ``seed``, so the
+        records do not depend on how the grid is split into chunks.
+        """
+        slots = self.slots
+        first_zone = start // slots
+        zones = np.arange(first_zone, (stop - 1) // slots + 1) if stop > start else np.empty(0, dtype=np.int64)
+        times = self.history_times(now)
+
+        # Whole rows for the zones the range touches, then trimmed to the range
+        cells = slice(start - first_zone * slots, stop - first_zone * slots)
+        if self.timescale > 0:
+            # The process runs forward in time; the history lists the newest sample first
+            level = self.series(zones, times[::-1])[:, ::-1].ravel()[cells]
+        else:
+            level = np.concatenate([
+                self.levels(zones[i:i + 1], times, np.random.default_rng((self.seed, int(zone), 1)))
+                for i, zone in enumerate(zones)
+            ] or [np.empty((0, len(times)), dtype=np.int64)]).ravel()[cells]
+        zone = np.repeat(zones, slots)[cells]
+        stamps = np.datetime_as_string(times, unit="us")[np.arange(start, stop) % slots]
+        return self._columns(zone, level, stamps)
+
+    def snapshot_columns(self, now: datetime.datetime, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+        """Columns for one sample of every zone at ``now``"""
+        zones = np.arange(len(self.zones))
+        if self.timescale > 0:
+            level = self.advance(now, rng)
+        else:
+            level = self.levels(zones, np.array([np.datetime64(now, "us")]), rng)[:, 0]
+        return self._columns(zones, level, np.full(len(zones), now.isoformat(), dtype=object))
+
+    def _columns(self, zone: np.ndarray, level: np.ndarray, stamps: np.ndarray) -> Dict[str, np.ndarray]:
+        return {
+            "zone_name": self.zones.names[zone],
+            "lat": self.zones.lat[zone],
+            "lng": self.zones.lng[zone],
+            "congestion_level": level,
+            "updated_at": stamps,
+        }
+
+    @staticmethod
+    def to_records(columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+        """Convert column arrays into the list-of-dicts rows the database layer expects"""
+        names = [name for name in CONGESTION_COLUMNS if name in columns]
+        values = [columns[name].tolist() for name in names]
+        return [dict(zip(names, row)) for row in zip(*values)]
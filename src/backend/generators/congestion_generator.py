@@ -2,118 +2,126 @@
 import asyncio
 import datetime
 import logging
-import random
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional
 import uuid
 
 from ..config import (
-    TRAFFIC_ZONES, get_traffic_volume_factor,
-    CONGESTION_UPDATE_INTERVAL, get_timestamp_hours_ago
+    CONGESTION_UPDATE_INTERVAL, HISTORICAL_CHUNK_SIZE, CONGESTION_HISTORY_HOURS,
+    CONGESTION_HISTORY_RESOLUTION, CONGESTION_SYNTHETIC_ZONES,
+    get_timestamp_hours_ago
 )
+from ..clock import SimulationClock, SimulationScheduler
+from ..rng import RngStreams, get_streams
+from .congestion_engine import CongestionEngine, PeakRules, ZoneTable
 
 logger = logging.getLogger("traffic_simulator.congestion_generator")
 
 class CongestionGenerator:
     """Class to generate realistic traffic congestion data"""
     
-    def __init__(self, db):
+    def __init__(self, db, hours: float = CONGESTION_HISTORY_HOURS,
+                 resolution: float = CONGESTION_HISTORY_RESOLUTION,
+                 synthetic_zones: int = CONGESTION_SYNTHETIC_ZONES, streams: Optional[RngStreams] = None):
         self.db = db
+        streams = (streams or get_streams()).child("zones_congestion")
+        rules = PeakRules()
+        zones = ZoneTable.from_config(rules)
+        if synthetic_zones:
+            # Seeded separately so the grid layout does not depend on the random state
+            zones = zones.with_synthetic(synthetic_zones, streams.generator("synthetic_zones"))
+        self.engine = CongestionEngine(zones, rules, hours=hours, resolution=resolution,
+                                       seed=streams.seed_int("history"))
+        self.rng = streams.generator("live")
+        self.resumed = False  # Whether live ticks continue from the stored levels yet
         
     async def generate_historical_data(self, count: int = 10000) -> List[Dict[str, Any]]:
-        """Generate historical congestion data for the past 24 hours"""
+        """Generate historical congestion data over the configured history horizon"""
         logger.info(f"Generating historical congestion data")
         
         congestion_data = []
-        now = datetime.datetime.now()
-        
-        # Calculate how many minutes to generate data for
-        minutes_in_day = 24 * 60
-        
-        # For each zone, generate congestion levels over time
-        for zone_name, zone_info in TRAFFIC_ZONES.items():
-            # Generate data for the past 24 hours at regular intervals
-            for minutes_ago in range(0, minutes_in_day, 5):  # Every 5 minutes
-                timestamp = now - datetime.timedelta(minutes=minutes_ago)
-                hour_of_day = timestamp.hour
-                
-                # Base congestion on time of day
-                base_congestion = get_traffic_volume_factor(hour_of_day) * 100
-                
-                # Add randomness
-                noise = random.normalvariate(0, 10)  # Normal distribution with mean=0, std=10
-                congestion_level = max(0, min(100, int(base_congestion + noise)))
-                
-                # Add more congestion to certain zones during peak hours
-                if zone_name in ["Hitech City", "Gachibowli", "Madhapur"] and 17 <= hour_of_day < 20:
-                    # Evening peak in IT areas
-                    congestion_level = min(100, congestion_level + random.randint(10, 20))
-                elif zone_name in ["Jubilee Hills", "Banjara Hills"] and 7 <= hour_of_day < 10:
-                    # Morning peak in residential areas
-                    congestion_level = min(100, congestion_level + random.randint(10, 15))
-                elif zone_name == "NH65-ORR Interchange":
-                    # Highway interchanges are always busy during peaks
-                    if 7 <= hour_of_day < 10 or 17 <= hour_of_day < 20:
-                        congestion_level = min(100, congestion_level + random.randint(15, 25))
-                
-                # Create congestion record
-                congestion_record = {
-                    "zone_name": zone_name,
-                    "lat": zone_info["lat"],
-                    "lng": zone_info["lng"],
-                    "congestion_level": congestion_level,
-                    "updated_at": timestamp.isoformat(),
-                }
-                
-                congestion_data.append(congestion_record)
+        async for chunk in self.stream_historical_data(count):
+            congestion_data.extend(chunk)
         
         logger.info(f"Generated {len(congestion_data)} historical congestion records")
         return congestion_data
     
-    async def simulate(self):
-        """Run continuous simulation of congestion levels"""
+    async def stream_historical_data(self, count: int = 10000,
+                                     chunk_size: int = HISTORICAL_CHUNK_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield historical congestion records in chunks of at most ``chunk_size`` rows
+        
+        The history always covers every zone over the engine's horizon and
+        resolution, so ``count`` is not used to size it.
+        """
+        now = datetime.datetime.now()
+        total = self.history_size()
+        
+        for start in range(0, total, chunk_size):
+            yield self.generate_chunk(start, min(total, start + chunk_size), now)
+            # Give in-flight uploads a chance to run between chunks
+            await asyncio.sleep(0)
+    
+    def history_size(self) -> int:
+        """Number of historical records: one per zone per sample of the history"""
+        return self.engine.history_size()
+    
+    def generate_chunk(self, start: int, stop: int, now: datetime.datetime,
+                       engine: Optional[CongestionEngine] = None) -> List[Dict[str, Any]]:
+        """Generate records ``[start, stop)`` of the zone-major (zone, sample time) grid
+        
+        ``engine`` overrides the generator's own, so worker processes can
+        generate a grid configured in the parent.
+        """
+        engine = engine or self.engine
+        return engine.to_records(engine.history_columns(start, stop, now))
+    
+    def resume_history(self, now: datetime.datetime):
+        """Continue live ticks from the history just seeded up to ``now``"""
+        if self.engine.timescale > 0:
+            self.engine.resume(self.engine.history_state(now), now)
+            self.resumed = True
+    
+    async def resume_from(self, db) -> bool:
+        """Continue live ticks from the newest stored level of each zone; False if there are none"""
+        rows = await db.fetch_rows("zones_congestion", ["zone_name", "congestion_level", "updated_at"],
+                                   since_column="updated_at", limit=len(self.engine.zones), newest_first=True)
+        if not rows:
+            return False
+        latest: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            latest.setdefault(row["zone_name"], row)
+        time = max(datetime.datetime.fromisoformat(str(row["updated_at"])).replace(tzinfo=None)
+                   for row in latest.values())
+        self.engine.resume_levels({name: row["congestion_level"] for name, row in latest.items()}, time)
+        logger.info(f"Resuming congestion levels of {len(latest)} zones from {time.isoformat()}")
+        return True
+    
+    async def tick(self, now: datetime.datetime):
+        """Update congestion levels for every zone at virtual time ``now``"""
+        # Continue from the stored levels rather than jump to a fresh draw
+        if not self.resumed:
+            self.resumed = True
+            if self.engine.timescale > 0:
+                try:
+                    await self.resume_from(self.db)
+                except Exception as e:
+                    logger.error(f"Could not read the latest congestion levels: {str(e)}")
+        
+        congestion_updates = self.engine.to_records(self.engine.snapshot_columns(now, self.rng))
+        
+        # Insert congestion updates into database
+        if congestion_updates:
+            await self.db.insert_data("zones_congestion", congestion_updates)
+            logger.info(f"Updated congestion levels for {len(congestion_updates)} zones")
+        
+    async def simulate(self, clock: Optional[SimulationClock] = None):
+        """Run continuous simulation of congestion levels
+        
+        Runs ``tick`` every CONGESTION_UPDATE_INTERVAL on its own scheduler;
+        ``run_simulations`` in seed_data.py drives all generators off one
+        shared clock instead.
+        """
         logger.info("Starting congestion simulation")
         
-        while True:
-            current_timestamp = datetime.datetime.now()
-            current_hour = current_timestamp.hour
-            
-            congestion_updates = []
-            
-            for zone_name, zone_info in TRAFFIC_ZONES.items():
-                # Base congestion on time of day
-                base_congestion = get_traffic_volume_factor(current_hour) * 100
-                
-                # Add randomness
-                noise = random.normalvariate(0, 10)
-                congestion_level = max(0, min(100, int(base_congestion + noise)))
-                
-                # Add more congestion to certain zones during peak hours
-                if zone_name in ["Hitech City", "Gachibowli", "Madhapur"] and 17 <= current_hour < 20:
-                    # Evening peak in IT areas
-                    congestion_level = min(100, congestion_level + random.randint(10, 20))
-                elif zone_name in ["Jubilee Hills", "Banjara Hills"] and 7 <= current_hour < 10:
-                    # Morning peak in residential areas
-                    congestion_level = min(100, congestion_level + random.randint(10, 15))
-                elif zone_name == "NH65-ORR Interchange":
-                    # Highway interchanges are always busy during peaks
-                    if 7 <= current_hour < 10 or 17 <= current_hour < 20:
-                        congestion_level = min(100, congestion_level + random.randint(15, 25))
-                
-                # Create congestion record
-                congestion_record = {
-                    "zone_name": zone_name,
-                    "lat": zone_info["lat"],
-                    "lng": zone_info["lng"],
-                    "congestion_level": congestion_level,
-                    "updated_at": current_timestamp.isoformat(),
-                }
-                
-                congestion_updates.append(congestion_record)
-            
-            # Insert congestion updates into database
-            if congestion_updates:
-                await self.db.insert_data("zones_congestion", congestion_updates)
-                logger.info(f"Updated congestion levels for {len(congestion_updates)} zones")
-            
-            # Wait for next update interval
-            await asyncio.sleep(CONGESTION_UPDATE_INTERVAL)
+        scheduler = SimulationScheduler(clock or SimulationClock())
+        scheduler.every(CONGESTION_UPDATE_INTERVAL, self.tick, name="congestion")
+        await scheduler.run()
@@ -0,0 +1,142 @@
+
+import logging
+from typing import List, Dict, Any
+
+import numpy as np
+
+from ..config import (
+    DELTA_MIN_DISTANCE_M, DELTA_MIN_HEADING, DELTA_MIN_SPEED, DELTA_HEARTBEAT_INTERVAL, KM_PER_DEGREE
+)
+from .fleet import FleetStore
+
+logger = logging.getLogger("traffic_simulator.delta")
+
+class DeltaTracker:
+    """Class to turn fleet ticks into change-only vehicle upserts
+
+    Remembers what was last sent for every slot and queues only vehicles
+    that are new, moved at least ``min_distance`` metres, turned at least
+    ``min_heading`` degrees, changed speed by ``min_speed`` km/h, or have
+    been silent for ``heartbeat`` seconds. With ``partial_rows`` the queued
+    rows carry just ``vehicle_id``, ``timestamp`` and the changed columns
+    (a move also re-sends the ``location`` label);
+    otherwise (sinks that need complete rows) whole rows are queued.
+
+    Changes accumulate in ``pending`` until ``drain`` is called, so ticks
+    taken while an upload is still running coalesce into one upsert per
+    vehicle.
+    """
+
+    def __init__(self, fleet: FleetStore, partial_rows: bool = False,
+                 min_distance: float = DELTA_MIN_DISTANCE_M, min_heading: float = DELTA_MIN_HEADING,
+                 min_speed: float = DELTA_MIN_SPEED, heartbeat: float = DELTA_HEARTBEAT_INTERVAL):
+        self.fleet = fleet
+        self.partial_rows = partial_rows
+        self.min_distance = min_distance
+        self.min_heading = min_heading
+        self.min_speed = min_speed
+        self.heartbeat = heartbeat
+        self.pending: Dict[str, Dict[str, Any]] = {}
+
+        # Last sent state per fleet slot
+        self.sent_generation = np.zeros(0, dtype=np.int64)
+        self.sent_lat = np.zeros(0)
+        self.sent_lng = np.zeros(0)
+        self.sent_speed = np.zeros(0)
+        self.sent_heading = np.zeros(0)
+        self.sent_at = np.zeros(0)
+
+    def _ensure_capacity(self):
+        capacity = self.fleet.capacity
+        old = len(self.sent_generation)
+        if capacity <= old:
+            return
+        for name in ("sent_generation", "sent_lat", "sent_lng", "sent_speed", "sent_heading", "sent_at"):
+            column = getattr(self, name)
+            resized = np.zeros(capacity, dtype=column.dtype)
+            resized[:old] = column
+            setattr(self, name, resized)
+
+    def track(self, timestamp: str, now: float) -> int:
+        """Queue this tick's changes; ``now`` is in seconds. Returns vehicles queued"""
+        self._ensure_capacity()
+        fleet = self.fleet
+        slots = fleet.active_slots
+        if len(slots) == 0:
+            return 0
+
+        lat = fleet.lat[slots]
+        lng = fleet.lng[slots]
+        speed = fleet.speed[slots]
+        heading = fleet.heading[slots]
+
+        new = self.sent_generation[slots] != fleet.generation[slots]
+
+        # Equirectangular distance is plenty at tens-of-metres thresholds
+        dlat = lat - self.sent_lat[slots]
+        dlng = (lng - self.sent_lng[slots]) * np.cos(np.radians(lat))
+        moved = np.hypot(dlat, dlng) * KM_PER_DEGREE * 1000 >= self.min_distance
+        turn = np.abs(heading - self.sent_heading[slots]) % 360
+        turned = np.minimum(turn, 360 - turn) >= self.min_heading
+        sped = np.abs(speed - self.sent_speed[slots]) >= self.min_speed
+        stale = now - self.sent_at[slots] >= self.heartbeat
+        changed = ~new & (moved | turned | sped | stale)
+
+        if self.partial_rows:
+            full = new
+        else:
+            full = new | changed
+            changed = np.zeros_like(changed)
+
+        # Complete rows replace whatever is pending for those vehicles
+        for row in fleet.records(slots[full], timestamp):
+            self.pending[row["vehicle_id"]] = row
+
+        if changed.any():
+            self._queue_partial(slots[changed], timestamp, moved[changed], turned[changed], sped[changed])
+
+        # Remember what was sent; columns left out of a partial row keep their old value
+        sent_position = full | (changed & moved)
+        self.sent_lat[slots[sent_position]] = lat[sent_position]
+        self.sent_lng[slots[sent_position]] = lng[sent_position]
+        sent_heading = full | (changed & turned)
+        self.sent_heading[slots[sent_heading]] = heading[sent_heading]
+        sent_speed = full | (changed & sped)
+        self.sent_speed[slots[sent_speed]] = speed[sent_speed]
+        queued = full | changed
+        self.sent_at[slots[queued]] = now
+        self.sent_generation[slots[full]] = fleet.generation[slots[full]]
+        return int(queued.sum())
+
+    def _queue_partial(self, slots: np.ndarray, timestamp: str, moved: np.ndarray,
+                       turned: np.ndarray, sped: np.ndarray):
+        fleet = self.fleet
+        columns = zip(
+            fleet.vehicle_id[slots].tolist(), moved.tolist(), turned.tolist(), sped.tolist(),
+            fleet.lat[slots].tolist(), fleet.lng[slots].tolist(), fleet.location[slots].tolist(),
+            fleet.heading[slots].astype(np.int64).tolist(), np.round(fleet.speed[slots], 1).tolist()
+        )
+        for vehicle_id, has_moved, has_turned, has_sped, lat, lng, location, heading, speed in columns:
+            # Merging into a row still pending coalesces several ticks into one
+            row = self.pending.setdefault(vehicle_id, {"vehicle_id": vehicle_id})
+            row["timestamp"] = timestamp
+            if has_moved:
+                row["lat"] = lat
+                row["lng"] = lng
+                row["location"] = location
+            if has_turned:
+                row["heading"] = heading
+            if has_sped:
+                row["speed"] = speed
+
+    def drain(self) -> List[List[Dict[str, Any]]]:
+        """Take every pending row, grouped so each group shares one column set
+
+        PostgREST bulk inserts require all objects in a request to have the
+        same keys, so each group is meant to be sent as its own upsert.
+        """
+        groups: Dict[frozenset, List[Dict[str, Any]]] = {}
+        for row in self.pending.values():
+            groups.setdefault(frozenset(row), []).append(row)
+        self.pending = {}
+        return list(groups.values())
@@ -0,0 +1,132 @@
+
+import datetime
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+
+from ..config import (
+    VEHICLE_TYPES, VEHICLE_SPEED_LIMITS, DETECTED_ANOMALY_TYPES, OVERSPEED_WINDOW,
+    HARD_BRAKING_DECELERATION, GPS_MAX_SPEED, DETECTION_COOLDOWN, KM_PER_DEGREE
+)
+from .fleet import FleetStore
+
+logger = logging.getLogger("traffic_simulator.detector")
+
+OVERSPEED, BRAKING, SPOOFING = (DETECTED_ANOMALY_TYPES.index(kind)
+                                for kind in ("Overspeed", "Emergency Braking", "GPS Spoofing"))
+
+# Severity by how far a reading is past its threshold (ratio of the two)
+SEVERITY_RATIOS = [1.25, 1.5, 2.0]
+
+class TelemetryDetector:
+    """Class to flag anomalies in the live fleet's telemetry, one tick at a time
+
+    Per fleet slot it keeps the last ``window`` speeds (a ring buffer
+    shared by all slots), the previous position fix and when each anomaly
+    type was last raised, in compact NumPy columns (about 40 bytes per
+    vehicle). ``observe`` checks the whole fleet at once:
+
+    - Overspeed: every speed in the window is over the vehicle type's limit
+    - Emergency Braking: the speed dropped faster than
+      HARD_BRAKING_DECELERATION since the previous fix
+    - GPS Spoofing: the jump from the previous fix implies more than
+      GPS_MAX_SPEED
+
+    A vehicle raises each type at most once per ``cooldown`` seconds. Slots
+    taken over by a new vehicle (see ``FleetStore.generation``) start over.
+    """
+
+    def __init__(self, window: int = OVERSPEED_WINDOW, cooldown: float = DETECTION_COOLDOWN):
+        self.window = window
+        self.cooldown = cooldown
+        self.limits = np.array([VEHICLE_SPEED_LIMITS[kind] for kind in VEHICLE_TYPES], dtype=np.float32)
+        self.capacity = 0
+        self.ticks = 0  # Fixes observed so far; picks the ring buffer column
+        self.started: Optional[float] = None  # Epoch seconds of the first tick
+        self.last_time = 0.0  # Seconds since ``started`` of the previous tick
+
+        # Per-slot columns
+        self.generation = np.empty(0, dtype=np.int64)  # Occupant the state belongs to, 0 for none
+        self.samples = np.empty(0, dtype=np.int8)  # Speeds in the window so far
+        self.speeds = np.empty((0, window), dtype=np.float32)
+        self.lat = np.empty(0, dtype=np.float32)
+        self.lng = np.empty(0, dtype=np.float32)
+        self.raised = np.empty((0, len(DETECTED_ANOMALY_TYPES)), dtype=np.float32)  # Seconds since ``started``
+
+    def _grow(self, capacity: int):
+        """Resize every column to ``capacity`` slots"""
+        old = self.capacity
+        if capacity <= old:
+            return
+        for name in ("generation", "samples", "speeds", "lat", "lng", "raised"):
+            column = getattr(self, name)
+            resized = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            resized[:old] = column
+            setattr(self, name, resized)
+        self.raised[old:] = -np.inf
+        self.capacity = capacity
+
+    def observe(self, fleet: FleetStore, now: datetime.datetime) -> Dict[str, np.ndarray]:
+        """Take the fleet's current telemetry as the fix at ``now``; return the anomalies it shows
+
+        Returns columns: "slot", "type" (index into DETECTED_ANOMALY_TYPES),
+        "value" (km/h, m/s^2 or implied km/h) and "limit" (the threshold).
+        """
+        self._grow(fleet.capacity)
+        if self.started is None:
+            self.started = now.timestamp()
+        time = now.timestamp() - self.started
+        interval = time - self.last_time
+        self.last_time = time
+
+        slots = fleet.active_slots
+        speed = fleet.speed[slots].astype(np.float32)
+        lat = fleet.lat[slots].astype(np.float32)
+        lng = fleet.lng[slots].astype(np.float32)
+
+        # New occupants have no history yet
+        fresh = self.generation[slots] != fleet.generation[slots]
+        self.generation[slots] = fleet.generation[slots]
+        self.raised[slots[fresh]] = -np.inf
+        tracked = ~fresh & (self.samples[slots] > 0) & (interval > 0)
+
+        previous_speed = self.speeds[slots, (self.ticks - 1) % self.window]
+        self.speeds[slots, self.ticks % self.window] = speed
+        self.samples[slots] = np.where(fresh, 1, np.minimum(self.samples[slots] + 1, self.window))
+        self.ticks += 1
+
+        limit = self.limits[fleet.vehicle_type[slots]]
+        sustained = np.where(self.samples[slots] >= self.window, self.speeds[slots].min(axis=1), 0)
+
+        deceleration = np.zeros(len(slots), dtype=np.float32)
+        jump_speed = np.zeros(len(slots), dtype=np.float32)
+        if interval > 0:
+            deceleration = (previous_speed - speed) / 3.6 / interval
+            dy = (lat - self.lat[slots]) * KM_PER_DEGREE
+            dx = (lng - self.lng[slots]) * KM_PER_DEGREE * np.cos(np.radians(lat))
+            jump_speed = np.hypot(dx, dy) / (interval / 3600)
+        self.lat[slots] = lat
+        self.lng[slots] = lng
+
+        values = np.stack([sustained, deceleration, jump_speed], axis=1)
+        limits = np.stack([limit, np.full(len(slots), HARD_BRAKING_DECELERATION, dtype=np.float32),
+                           np.full(len(slots), GPS_MAX_SPEED, dtype=np.float32)], axis=1)
+        over = values > limits
+        over[:, BRAKING] &= tracked
+        over[:, SPOOFING] &= tracked
+        over &= self.raised[slots] <= time - self.cooldown
+
+        rows, kinds = np.nonzero(over)
+        self.raised[slots[rows], kinds] = time
+        return {
+            "slot": slots[rows],
+            "type": kinds,
+            "value": values[rows, kinds],
+            "limit": limits[rows, kinds],
+        }
+
+    @staticmethod
+    def severity(values: np.ndarray, limits: np.ndarray) -> np.ndarray:
+        """Severity level index (into ANOMALY_SEVERITY) of detections"""
+        return np.digitize(values / limits, SEVERITY_RATIOS)
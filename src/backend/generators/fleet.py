@@ -0,0 +1,371 @@
+
+import datetime
+import logging
+from typing import List, Dict, Any, Optional, Sequence, Union
+
+import numpy as np
+
+from ..config import (
+    VEHICLE_TYPES, KEY_JUNCTIONS, LICENSE_PLATE_SERIES, FIRST_NAMES, LAST_NAMES,
+    RANDOM_SEED, KM_PER_DEGREE
+)
+from .sampling import VEHICLE_TYPE_TABLE
+from ..spatial import SpatialIndex
+from ..roads import RoadGraph
+
+logger = logging.getLogger("traffic_simulator.fleet")
+
+PLATE_LETTERS = np.array(list("ABCDEFGHJKLMNPQRSTUVWXYZ"), dtype=object)
+MAX_HOPS = 32  # Edges a vehicle may cross in one step
+
+class FleetStore:
+    """Class to hold the live simulated fleet as NumPy column arrays
+
+    Each vehicle owns a slot (a row in every column). Freed slots go on a
+    free-list and are reused before the arrays grow. A dense index of the
+    occupied slots gives O(1) removal (swap with the last entry) and O(1)
+    uniform sampling, and lets ``step`` move the whole fleet in one
+    vectorised update.
+
+    Without a road graph vehicles drive straight along their headings.
+    With one (``use_roads``) every vehicle is on an edge, heading for a hub,
+    and ``step`` advances them all along their routes at once.
+    """
+
+    def __init__(self, capacity: int = 1024, seed: Union[int, Sequence[int], None] = RANDOM_SEED):
+        self.rng = np.random.default_rng(seed)
+        self.capacity = 0
+        self.count = 0
+        self.free_slots: List[int] = []
+        self.slot_of: Dict[str, int] = {}
+        self.spawned = 0  # Vehicles ever added; numbers each slot occupant
+
+        self.vehicle_types = list(VEHICLE_TYPES.keys())
+        self.type_names = np.array(self.vehicle_types, dtype=object)
+
+        self.junction_names = np.array(list(KEY_JUNCTIONS.keys()), dtype=object)
+        self.junction_lat = np.array([j["lat"] for j in KEY_JUNCTIONS.values()])
+        self.junction_lng = np.array([j["lng"] for j in KEY_JUNCTIONS.values()])
+        self.names = np.array([f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES], dtype=object)
+
+        # Per-slot columns
+        self.vehicle_id = np.empty(0, dtype=object)
+        self.owner_name = np.empty(0, dtype=object)
+        self.location = np.empty(0, dtype=object)
+        self.vehicle_type = np.empty(0, dtype=np.int8)
+        self.trust_score = np.empty(0, dtype=np.int16)
+        self.lat = np.empty(0)
+        self.lng = np.empty(0)
+        self.speed = np.empty(0)
+        self.heading = np.empty(0)
+        self.generation = np.empty(0, dtype=np.int64)  # Occupant number, 0 for never used
+
+        # Road-following state: current edge, km along it and destination hub number
+        self.roads: Optional[RoadGraph] = None
+        self.edge = np.empty(0, dtype=np.int64)
+        self.offset = np.empty(0)
+        self.hub = np.empty(0, dtype=np.int64)
+
+        # Dense list of occupied slots and each slot's position in it (-1 if free)
+        self.active = np.empty(0, dtype=np.int64)
+        self.position = np.empty(0, dtype=np.int64)
+
+        self._grow(capacity)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, vehicle_id: str) -> bool:
+        return vehicle_id in self.slot_of
+
+    @property
+    def active_slots(self) -> np.ndarray:
+        return self.active[:self.count]
+
+    def _grow(self, capacity: int):
+        """Resize every column to ``capacity`` slots, adding the new ones to the free-list"""
+        old = self.capacity
+        if capacity <= old:
+            return
+        for name in ("vehicle_id", "owner_name", "location", "vehicle_type", "trust_score",
+                     "lat", "lng", "speed", "heading", "generation", "active", "edge", "offset", "hub"):
+            column = getattr(self, name)
+            resized = np.zeros(capacity, dtype=column.dtype)
+            resized[:old] = column
+            setattr(self, name, resized)
+        position = np.full(capacity, -1, dtype=np.int64)
+        position[:old] = self.position
+        self.position = position
+        # Reversed so pop() hands out low slots first
+        self.free_slots.extend(range(capacity - 1, old - 1, -1))
+        self.capacity = capacity
+
+    def _take_slots(self, count: int) -> np.ndarray:
+        if count > len(self.free_slots):
+            self._grow(max(self.capacity * 2, self.count + count))
+        slots = np.array([self.free_slots.pop() for _ in range(count)], dtype=np.int64)
+        self.active[self.count:self.count + count] = slots
+        self.position[slots] = np.arange(self.count, self.count + count)
+        self.generation[slots] = np.arange(self.spawned + 1, self.spawned + count + 1)
+        self.count += count
+        self.spawned += count
+        return slots
+
+    def new_vehicle_ids(self, count: int) -> List[str]:
+        """Draw ``count`` plate numbers (see ``generate_vehicle_id``) not already in the fleet"""
+        ids: List[str] = []
+        seen = set()
+        while len(ids) < count:
+            n = count - len(ids)
+            series = self.rng.integers(0, len(LICENSE_PLATE_SERIES), n)
+            numbers = self.rng.integers(0, 10000, n)
+            letters = PLATE_LETTERS[self.rng.integers(0, len(PLATE_LETTERS), (n, 2))]
+            for s, number, (a, b) in zip(series.tolist(), numbers.tolist(), letters.tolist()):
+                vehicle_id = f"{LICENSE_PLATE_SERIES[s]}-{number:04d}-{a}{b}"
+                if vehicle_id not in self.slot_of and vehicle_id not in seen:
+                    seen.add(vehicle_id)
+                    ids.append(vehicle_id)
+        return ids
+
+    def spawn(self, count: int) -> np.ndarray:
+        """Add ``count`` random vehicles near key junctions; return their slots"""
+        if count <= 0:
+            return np.empty(0, dtype=np.int64)
+        rng = self.rng
+        ids = self.new_vehicle_ids(count)
+        slots = self._take_slots(count)
+        junctions = rng.integers(0, len(self.junction_names), count)
+
+        self.vehicle_id[slots] = ids
+        self.owner_name[slots] = self.names[rng.integers(0, len(self.names), count)]
+        self.location[slots] = self.junction_names[junctions]
+        self.vehicle_type[slots] = VEHICLE_TYPE_TABLE.draw_indices(count, rng)
+        self.trust_score[slots] = rng.integers(70, 101, count)
+        self.lat[slots] = self.junction_lat[junctions] + rng.uniform(-0.001, 0.001, count)
+        self.lng[slots] = self.junction_lng[junctions] + rng.uniform(-0.001, 0.001, count)
+        self.speed[slots] = rng.integers(0, 81, count)
+        self.heading[slots] = rng.integers(0, 360, count)
+        self.slot_of.update(zip(ids, slots.tolist()))
+        if self.roads is not None:
+            # Start somewhere along an edge leaving a random hub
+            roads = self.roads
+            self._route(slots, roads.hubs[rng.integers(0, len(roads.hubs), count)])
+            self.offset[slots] = rng.random(count) * roads.length[self.edge[slots]]
+            self.speed[slots] = roads.speed[self.edge[slots]] * rng.uniform(0.5, 1.0, count)
+            self._place(slots)
+        return slots
+
+    def add(self, vehicle: Dict[str, Any]) -> int:
+        """Add a vehicle record (as built by ``VehicleGenerator.generate_vehicle``)"""
+        vehicle_id = vehicle["vehicle_id"]
+        if vehicle_id in self.slot_of:
+            self.remove(vehicle_id)
+        slot = int(self._take_slots(1)[0])
+        self.vehicle_id[slot] = vehicle_id
+        self.owner_name[slot] = vehicle["owner_name"]
+        self.location[slot] = vehicle["location"]
+        self.vehicle_type[slot] = self.vehicle_types.index(vehicle["vehicle_type"])
+        self.trust_score[slot] = vehicle["trust_score"]
+        self.lat[slot] = vehicle["lat"]
+        self.lng[slot] = vehicle["lng"]
+        self.speed[slot] = vehicle["speed"]
+        self.heading[slot] = vehicle["heading"]
+        self.slot_of[vehicle_id] = slot
+        if self.roads is not None:
+            self._snap(np.array([slot]))
+        return slot
+
+    def remove(self, vehicle_id: str) -> bool:
+        """Remove a vehicle in O(1); return False if it is not in the fleet"""
+        slot = self.slot_of.pop(vehicle_id, None)
+        if slot is None:
+            return False
+        # Move the last active slot into the removed one's place in the dense index
+        index = self.position[slot]
+        last = self.active[self.count - 1]
+        self.active[index] = last
+        self.position[last] = index
+        self.position[slot] = -1
+        self.count -= 1
+        self.vehicle_id[slot] = None
+        self.free_slots.append(slot)
+        return True
+
+    def remove_random(self, count: int) -> List[str]:
+        """Remove up to ``count`` uniformly chosen vehicles; return their IDs"""
+        removed = []
+        for _ in range(min(count, self.count)):
+            slot = self.active[self.rng.integers(0, self.count)]
+            vehicle_id = self.vehicle_id[slot]
+            self.remove(vehicle_id)
+            removed.append(vehicle_id)
+        return removed
+
+    def step(self, interval: float, change_probability: float = 0.2):
+        """Advance every vehicle by ``interval`` seconds in one vectorised update
+
+        Vehicles move along their heading (0 = north, clockwise), then a
+        ``change_probability`` share of them adjust heading by up to ±30°
+        and speed by up to ±10 km/h (clamped to 0-80). With a road graph
+        vehicles follow their routes instead (see ``drive``).
+        """
+        if self.roads is not None:
+            self.drive(interval, change_probability)
+            return
+        slots = self.active_slots
+        n = len(slots)
+        if n == 0:
+            return
+        rng = self.rng
+        lat = self.lat[slots]
+        heading = np.radians(self.heading[slots])
+        distance_deg = self.speed[slots] * (interval / 3600) / KM_PER_DEGREE
+
+        self.lat[slots] = lat + distance_deg * np.cos(heading)
+        self.lng[slots] += distance_deg * np.sin(heading) / np.cos(np.radians(lat))
+
+        changing = slots[rng.random(n) < change_probability]
+        m = len(changing)
+        self.heading[changing] = (self.heading[changing] + rng.integers(-30, 31, m)) % 360
+        self.speed[changing] = np.clip(self.speed[changing] + rng.integers(-10, 11, m), 0, 80)
+
+    def disturb(self, brake_rate: float, glitch_rate: float):
+        """Make a few vehicles brake hard and a few report a bogus position fix
+
+        Each vehicle brakes with probability ``brake_rate`` (down to at most
+        10% of its speed) and its GPS glitches with probability
+        ``glitch_rate`` (the fix lands 2-10 km away in a random direction).
+        On roads the next ``step`` puts it back on its edge.
+        """
+        slots = self.active_slots
+        n = len(slots)
+        if n == 0:
+            return
+        rng = self.rng
+        braking = slots[rng.random(n) < brake_rate]
+        self.speed[braking] *= rng.uniform(0, 0.1, len(braking))
+        glitching = slots[rng.random(n) < glitch_rate]
+        m = len(glitching)
+        distance_deg = rng.uniform(2, 10, m) / KM_PER_DEGREE
+        bearing = rng.uniform(0, 2 * np.pi, m)
+        self.lat[glitching] += distance_deg * np.cos(bearing)
+        self.lng[glitching] += distance_deg * np.sin(bearing) / np.cos(np.radians(self.lat[glitching]))
+
+    def use_roads(self, roads: RoadGraph):
+        """Drive on ``roads`` from now on, snapping current vehicles to their nearest nodes"""
+        self.roads = roads
+        self._snap(self.active_slots)
+
+    def _snap(self, slots: np.ndarray):
+        """Put vehicles at the start of a route from their nearest road node"""
+        if len(slots):
+            self._route(slots, self.roads.nearest_node(self.lat[slots], self.lng[slots]))
+            self.offset[slots] = 0.0
+            self._place(slots)
+
+    def _pick_hubs(self, nodes: np.ndarray) -> np.ndarray:
+        """A random destination hub number for vehicles at ``nodes``, never the hub they are at"""
+        hubs = self.roads.hubs
+        here = np.searchsorted(hubs, nodes).clip(0, len(hubs) - 1)
+        here = np.where(hubs[here] == nodes, here, -1)
+        # Draw from one fewer hub and shift draws past the current one
+        hub = self.rng.integers(0, max(1, len(hubs) - 1), len(nodes))
+        return np.where((here >= 0) & (hub >= here) & (len(hubs) > 1), hub + 1, hub)
+
+    def _route(self, slots: np.ndarray, nodes: np.ndarray):
+        """Send vehicles at ``nodes`` off towards new random hubs"""
+        self.hub[slots] = self._pick_hubs(nodes)
+        self.edge[slots] = self._next_edges(nodes, self.hub[slots])
+
+    def _next_edges(self, nodes: np.ndarray, hubs: np.ndarray) -> np.ndarray:
+        """Edge to take from ``nodes`` towards ``hubs``, or a random way on where there is no route"""
+        edges = self.roads.next_edges(nodes, hubs)
+        stuck = np.flatnonzero(edges < 0)
+        if len(stuck):
+            edges[stuck] = self.roads.any_out_edge(nodes[stuck], self.rng)
+        return edges
+
+    def _place(self, slots: np.ndarray):
+        """Set position and heading from each vehicle's edge and offset"""
+        roads = self.roads
+        edge = self.edge[slots]
+        source, target = roads.source[edge], roads.target[edge]
+        along = self.offset[slots] / np.maximum(roads.length[edge], 1e-9)
+        self.lat[slots] = roads.lat[source] + (roads.lat[target] - roads.lat[source]) * along
+        self.lng[slots] = roads.lng[source] + (roads.lng[target] - roads.lng[source]) * along
+        self.heading[slots] = np.round(roads.bearing[edge]) % 360
+
+    def drive(self, interval: float, change_probability: float = 0.2):
+        """Advance every vehicle ``interval`` seconds along its route in one vectorised update
+
+        Speeds drift like in ``step`` but stay between 30% and 100% of the
+        edge's speed limit. Vehicles crossing the end of an edge carry the
+        remaining distance onto the next edge of their route (all of them in
+        one pass per hop); at their hub they pick a new destination.
+        """
+        slots = self.active_slots
+        n = len(slots)
+        if n == 0:
+            return
+        roads, rng = self.roads, self.rng
+        edge = self.edge[slots]
+        hub = self.hub[slots]
+
+        speed = self.speed[slots]
+        changing = rng.random(n) < change_probability
+        speed[changing] += rng.integers(-10, 11, int(changing.sum()))
+        limit = roads.speed[edge]
+        speed = np.clip(speed, 0.3 * limit, limit)
+        offset = self.offset[slots] + speed * (interval / 3600)
+
+        for _ in range(MAX_HOPS):
+            over = np.flatnonzero(offset >= roads.length[edge])
+            if len(over) == 0:
+                break
+            offset[over] -= roads.length[edge[over]]
+            node = roads.target[edge[over]]
+            arrived = node == roads.hubs[hub[over]]
+            if arrived.any():
+                hub[over[arrived]] = self._pick_hubs(node[arrived])
+            edge[over] = self._next_edges(node, hub[over])
+
+        self.edge[slots] = edge
+        self.hub[slots] = hub
+        self.offset[slots] = np.minimum(offset, roads.length[edge])
+        self.speed[slots] = np.minimum(speed, roads.speed[edge])
+        self._place(slots)
+
+    def relabel(self, index: SpatialIndex):
+        """Set every vehicle's ``location`` to its nearest junction, in one batched query"""
+        slots = self.active_slots
+        if len(slots):
+            self.location[slots] = index.junction_labels(self.lat[slots], self.lng[slots])
+
+    def records(self, slots: Optional[np.ndarray] = None,
+                timestamp: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return vehicle rows for ``slots`` (default: the whole fleet) as dicts"""
+        slots = self.active_slots if slots is None else slots
+        timestamp = timestamp or datetime.datetime.now().isoformat()
+        columns = {
+            "vehicle_id": self.vehicle_id[slots].tolist(),
+            "owner_name": self.owner_name[slots].tolist(),
+            "vehicle_type": self.type_names[self.vehicle_type[slots]].tolist(),
+            "trust_score": self.trust_score[slots].tolist(),
+            "lat": self.lat[slots].tolist(),
+            "lng": self.lng[slots].tolist(),
+            "speed": np.round(self.speed[slots], 1).tolist(),
+            "heading": self.heading[slots].astype(np.int64).tolist(),
+            "location": self.location[slots].tolist(),
+        }
+        names = list(columns)
+        return [
+            dict(zip(names, row), timestamp=timestamp, status="Active")
+            for row in zip(*columns.values())
+        ]
+
+    def get(self, vehicle_id: str) -> Optional[Dict[str, Any]]:
+        """Return one vehicle's current row, or None"""
+        slot = self.slot_of.get(vehicle_id)
+        if slot is None:
+            return None
+        return self.records(np.array([slot]))[0]
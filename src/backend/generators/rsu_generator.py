@@ -0,0 +1,190 @@
+import asyncio
+import datetime
+import logging
+from typing import List, Dict, Any, AsyncIterator, Optional
+
+import numpy as np
+
+from ..config import (
+    RSU_COUNT, RSU_UPDATE_INTERVAL, RSU_OFFLINE_ANOMALY, HISTORICAL_CHUNK_SIZE,
+    generate_vehicle_id
+)
+from ..clock import SimulationClock, SimulationScheduler
+from ..spatial import SpatialIndex, get_spatial_index, project
+from ..rng import RngStreams, get_streams
+from .fleet import FleetStore
+from .rsu_network import RsuNetwork
+
+logger = logging.getLogger("traffic_simulator.rsu_generator")
+
+class RsuGenerator:
+    """Class to simulate roadside units: heartbeats, outages and vehicle handoff
+
+    Every tick advances RSU outages, works out which online RSU serves each
+    vehicle of ``fleet`` (one batched spatial query) and counts handoffs
+    against the previous tick; a vehicle stays with its RSU for as long as
+    that RSU is online and still covers it. An RSU going down raises an
+    "RSU Offline" anomaly naming one of the vehicles it was serving; the
+    anomaly is upserted as resolved once the RSU comes back.
+    """
+
+    def __init__(self, db, count: int = RSU_COUNT, fleet: Optional[FleetStore] = None,
+                 index: Optional[SpatialIndex] = None, streams: Optional[RngStreams] = None):
+        self.db = db
+        self.streams = (streams or get_streams()).child("rsus")
+        self.network = RsuNetwork(count, seed=self.streams.sequence("network"))
+        self.random = self.streams.python("live")
+        self.fleet = fleet
+        self.index = index if index is not None else get_spatial_index()
+        self.index.set_rsus(self.network.rsu_id, self.network.lat, self.network.lng,
+                            self.network.coverage_radius)
+        self.x, self.y = project(self.network.lat, self.network.lng)
+        self.radius_km = self.network.coverage_radius / 1000
+
+        # Serving RSU per fleet slot as of the last tick (-1 for none), and the
+        # slot's occupant at the time, so reused slots do not count as handoffs
+        self.serving = np.empty(0, dtype=np.int64)
+        self.serving_generation = np.empty(0, dtype=np.int64)
+        self.load = np.zeros(count, dtype=np.int64)  # Vehicles served per RSU
+        self.outages: Dict[int, Dict[str, Any]] = {}  # Open anomaly row per RSU that is down
+        self.last_tick: Optional[datetime.datetime] = None
+
+    def __len__(self) -> int:
+        return len(self.network)
+
+    async def generate_historical_data(self) -> List[Dict[str, Any]]:
+        """Generate the rsus rows for the whole network, as last seen now"""
+        rsus = []
+        async for chunk in self.stream_historical_data():
+            rsus.extend(chunk)
+        logger.info(f"Generated {len(rsus)} RSU records")
+        return rsus
+
+    async def stream_historical_data(self, chunk_size: int = HISTORICAL_CHUNK_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield the rsus rows in chunks of at most ``chunk_size`` rows"""
+        now = datetime.datetime.now()
+        for start in range(0, len(self), chunk_size):
+            yield self.generate_chunk(start, min(len(self), start + chunk_size), None, now)
+            await asyncio.sleep(0)
+
+    def generate_chunk(self, start: int, stop: int, context: Any,
+                       now: datetime.datetime) -> List[Dict[str, Any]]:
+        """Generate the rsus rows for RSUs ``[start, stop)``, each heard from within the last interval"""
+        network = self.network
+        offsets = self.streams.draw_rows(start, stop, self.draw_heartbeats, "history").get("offset", np.empty(0))
+        network.last_seen[start:stop] = np.datetime64(now, "us") - (offsets * 1e6).astype("timedelta64[us]")
+        return network.records(np.arange(start, stop))
+
+    @staticmethod
+    def draw_heartbeats(rng: np.random.Generator, first: int, count: int) -> Dict[str, np.ndarray]:
+        """Seconds since each of ``count`` RSUs was last heard from"""
+        return {"row": np.arange(count), "offset": rng.uniform(0, RSU_UPDATE_INTERVAL, count)}
+
+    def assign(self) -> np.ndarray:
+        """Work out the serving RSU of every fleet slot; returns the previous assignment
+
+        Updates ``serving`` and ``load``. Vehicles still covered by their
+        online RSU keep it; the rest go to the best covering online RSU, so
+        vehicles of an RSU that went down hand off where coverage overlaps.
+        """
+        fleet = self.fleet
+        previous = np.full(fleet.capacity, -1, dtype=np.int64)
+        known = min(len(self.serving), fleet.capacity)
+        same = self.serving_generation[:known] == fleet.generation[:known]
+        previous[:known] = np.where(same, self.serving[:known], -1)
+
+        serving = np.full(fleet.capacity, -1, dtype=np.int64)
+        slots = fleet.active_slots
+        if len(slots):
+            x, y = project(fleet.lat[slots], fleet.lng[slots])
+            current = previous[slots]
+            rsu = np.maximum(current, 0)
+            kept = (current >= 0) & self.network.online[rsu] & (
+                np.hypot(x - self.x[rsu], y - self.y[rsu]) <= self.radius_km[rsu]
+            )
+            serving[slots[kept]] = current[kept]
+            lost = ~kept
+            serving[slots[lost]] = self.index.rsus.containing(x[lost], y[lost], self.network.online)
+        self.serving = serving
+        self.serving_generation = fleet.generation.copy()
+        covered = serving[slots]
+        self.load = np.bincount(covered[covered >= 0], minlength=len(self))
+        return previous
+
+    def outage_anomalies(self, failed: np.ndarray, recovered: np.ndarray, previous: np.ndarray,
+                         now: datetime.datetime) -> List[Dict[str, Any]]:
+        """Open an anomaly per failed RSU and resolve those of recovered RSUs"""
+        network = self.network
+        anomalies = []
+        for rsu in recovered.tolist():
+            anomaly = self.outages.pop(rsu, None)
+            if anomaly is not None:
+                anomalies.append(dict(anomaly, status="Resolved"))
+
+        if len(failed):
+            # Vehicles each failed RSU was serving until now
+            slots = np.flatnonzero(np.isin(previous, failed))
+            order = np.argsort(previous[slots], kind="stable")
+            slots = slots[order]
+            owners = previous[slots]
+            first = np.searchsorted(owners, failed)
+            affected = np.searchsorted(owners, failed, side="right") - first
+
+            for rsu, start, count, anomaly_id in zip(failed.tolist(), first.tolist(), affected.tolist(),
+                                                     self.streams.row_uuids(failed, "outages", now.isoformat())):
+                if count and self.fleet is not None:
+                    vehicle_id = self.fleet.vehicle_id[slots[start]]
+                else:
+                    vehicle_id = generate_vehicle_id(self.random)
+                severity = "Low" if count == 0 else "Medium" if count < 10 else "High" if count < 100 else "Critical"
+                message = f"{network.rsu_id[rsu]} offline in {network.location[rsu]}"
+                if count:
+                    message += f"; {count} vehicles lost coverage, including {vehicle_id}"
+                anomaly = {
+                    "id": anomaly_id,
+                    "timestamp": now.isoformat(),
+                    "vehicle_id": vehicle_id,
+                    "type": RSU_OFFLINE_ANOMALY,
+                    "severity": severity,
+                    "message": message,
+                    "status": "Detected",
+                }
+                self.outages[rsu] = anomaly
+                anomalies.append(anomaly)
+        return anomalies
+
+    async def tick(self, now: datetime.datetime):
+        """Advance heartbeats and outages to virtual time ``now`` and reassign vehicles"""
+        interval = RSU_UPDATE_INTERVAL if self.last_tick is None else (now - self.last_tick).total_seconds()
+        self.last_tick = now
+        failed, recovered = self.network.step(now, interval)
+
+        previous = np.empty(0, dtype=np.int64)
+        if self.fleet is not None:
+            previous = self.assign()
+            moved = (previous >= 0) & (self.serving >= 0) & (previous != self.serving)
+            logger.info(
+                f"RSUs serve {int(self.load.sum())}/{len(self.fleet)} vehicles "
+                f"({int(np.count_nonzero(moved))} handoffs)"
+            )
+
+        anomalies = self.outage_anomalies(failed, recovered, previous, now)
+
+        # Heartbeats refresh every online RSU, so the whole table is upserted
+        await self.db.insert_data("rsus", self.network.records())
+        if anomalies:
+            await self.db.insert_data("anomalies", anomalies)
+            logger.info(f"{len(failed)} RSUs went offline, {len(recovered)} came back")
+
+    async def simulate(self, clock: Optional[SimulationClock] = None):
+        """Run continuous simulation of RSU heartbeats and outages
+
+        Runs ``tick`` every RSU_UPDATE_INTERVAL on its own scheduler;
+        ``run_simulations`` in seed_data.py drives all generators off one
+        shared clock instead.
+        """
+        logger.info("Starting RSU simulation")
+
+        scheduler = SimulationScheduler(clock or SimulationClock())
+        scheduler.every(RSU_UPDATE_INTERVAL, self.tick, name="rsus")
+        await scheduler.run()
@@ -0,0 +1,96 @@
+import datetime
+import logging
+from typing import List, Dict, Any, Optional, Sequence, Union
+
+import numpy as np
+
+from ..config import (
+    TRAFFIC_ZONES, KM_PER_DEGREE, RANDOM_SEED, RSU_COUNT, RSU_COVERAGE_RADIUS_M,
+    RSU_OUTAGE_RATE, RSU_OUTAGE_DURATION
+)
+
+logger = logging.getLogger("traffic_simulator.rsu_network")
+
+ACTIVE = "Active"
+INACTIVE = "Inactive"
+
+def rsu_ids(count: int, rng: np.random.Generator) -> List[str]:
+    """``count`` distinct RSU IDs in the ``generate_rsu_id`` format (wider numbers beyond 9000 RSUs)"""
+    if count <= 9000:
+        return [f"RSU-{n}" for n in (rng.permutation(9000)[:count] + 1000).tolist()]
+    return [f"RSU-{n:05d}" for n in range(count)]
+
+class RsuNetwork:
+    """Class to hold the simulated roadside units as NumPy column arrays
+
+    RSUs are placed uniformly inside the zone circles, with zones picked in
+    proportion to their area, so the layout only depends on ``seed``. The
+    network tracks each RSU's outage state and last heartbeat; ``step``
+    advances outages for every RSU in one vectorised update.
+    """
+
+    def __init__(self, count: int = RSU_COUNT, seed: Union[int, Sequence[int], None] = RANDOM_SEED,
+                 zones: Dict[str, Dict[str, float]] = TRAFFIC_ZONES):
+        rng = np.random.default_rng(seed)
+        self.rng = rng
+        self.count = count
+
+        zone_names = np.array(list(zones.keys()), dtype=object)
+        zone_lat = np.array([z["lat"] for z in zones.values()])
+        zone_lng = np.array([z["lng"] for z in zones.values()])
+        zone_radius = np.array([z["radius"] for z in zones.values()])
+        area = zone_radius ** 2
+        zone = rng.choice(len(zone_names), size=count, p=area / area.sum())
+
+        # Uniform over each zone's disc: the radius goes with the square root
+        r = zone_radius[zone] * np.sqrt(rng.random(count))
+        theta = rng.random(count) * 2 * np.pi
+        self.lat = zone_lat[zone] + r * np.cos(theta) / KM_PER_DEGREE
+        self.lng = zone_lng[zone] + r * np.sin(theta) / (KM_PER_DEGREE * np.cos(np.radians(zone_lat[zone])))
+        low, high = RSU_COVERAGE_RADIUS_M
+        self.coverage_radius = rng.integers(low, high + 1, count)
+        self.rsu_id = np.array(rsu_ids(count, rng), dtype=object)
+        self.location = zone_names[zone]
+
+        self.online = np.ones(count, dtype=bool)
+        self.down_until = np.zeros(count, dtype="datetime64[us]")  # When each outage ends
+        self.last_seen = np.zeros(count, dtype="datetime64[us]")  # Last heartbeat
+
+    def __len__(self) -> int:
+        return self.count
+
+    def step(self, now: datetime.datetime, interval: float, outage_rate: float = RSU_OUTAGE_RATE):
+        """Advance outages to ``now``; returns the (failed, recovered) RSU indices
+
+        Outages end once their time is up; each active RSU then fails with
+        probability ``1 - exp(-outage_rate * hours)`` over the interval, for
+        a duration drawn from RSU_OUTAGE_DURATION. Active RSUs heartbeat.
+        """
+        moment = np.datetime64(now, "us")
+        recovered = np.flatnonzero(~self.online & (self.down_until <= moment))
+        self.online[recovered] = True
+
+        chance = -np.expm1(-outage_rate * interval / 3600)
+        failed = np.flatnonzero(self.online & (self.rng.random(self.count) < chance))
+        low, high = RSU_OUTAGE_DURATION
+        self.online[failed] = False
+        duration = (self.rng.uniform(low, high, len(failed)) * 1e6).astype("timedelta64[us]")
+        self.down_until[failed] = moment + duration
+
+        self.last_seen[self.online] = moment
+        return failed, recovered
+
+    def records(self, indices: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Return rsus rows for ``indices`` (default: every RSU) as dicts"""
+        indices = np.arange(self.count) if indices is None else indices
+        columns = {
+            "rsu_id": self.rsu_id[indices].tolist(),
+            "location": self.location[indices].tolist(),
+            "status": np.where(self.online[indices], ACTIVE, INACTIVE).tolist(),
+            "coverage_radius": self.coverage_radius[indices].tolist(),
+            "lat": self.lat[indices].tolist(),
+            "lng": self.lng[indices].tolist(),
+            "last_seen": np.datetime_as_string(self.last_seen[indices], unit="us").tolist(),
+        }
+        names = list(columns)
+        return [dict(zip(names, row)) for row in zip(*columns.values())]
@@ -0,0 +1,136 @@
+
+import logging
+import random
+from typing import List, Dict, Any, Sequence
+
+import numpy as np
+
+from ..config import (
+    ANOMALY_TYPES, ANOMALY_SEVERITY, ANOMALY_SEVERITY_WEIGHTS, ANOMALY_MESSAGES,
+    VEHICLE_TYPES, RSU_OFFLINE_ANOMALY, DETECTED_ANOMALY_TYPES
+)
+
+logger = logging.getLogger("traffic_simulator.sampling")
+
+class AliasTable:
+    """Class to draw weighted categories in O(1) with Vose's alias method
+
+    Built once per distribution; every draw is then one uniform index plus
+    one coin flip, instead of ``random.choices`` re-scanning the weights.
+    ``draw`` takes a ``random.Random`` stream (the ``random`` module by
+    default); ``draw_indices`` / ``draw_many`` draw whole batches from a
+    NumPy generator.
+    """
+
+    def __init__(self, labels: Sequence[Any], weights: Sequence[float]):
+        if len(labels) != len(weights) or not labels:
+            raise ValueError("labels and weights must be non-empty and of equal length")
+        total = float(sum(weights))
+        if total <= 0 or min(weights) < 0:
+            raise ValueError("weights must be non-negative with a positive sum")
+
+        n = len(weights)
+        self.labels = list(labels)
+        self.label_array = np.array(self.labels, dtype=object)
+        prob = [w * n / total for w in weights]
+        alias = list(range(n))
+        small = [i for i, p in enumerate(prob) if p < 1.0]
+        large = [i for i, p in enumerate(prob) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            alias[s] = l
+            prob[l] -= 1.0 - prob[s]
+            (small if prob[l] < 1.0 else large).append(l)
+        # Leftovers are 1.0 up to rounding error
+        for i in small + large:
+            prob[i] = 1.0
+
+        self.prob = np.array(prob)
+        self.alias = np.array(alias, dtype=np.int64)
+        self._prob = prob
+        self._alias = alias
+
+    @classmethod
+    def from_dict(cls, weights: Dict[Any, float]) -> "AliasTable":
+        return cls(list(weights.keys()), list(weights.values()))
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def draw_index(self, rng: Any = random) -> int:
+        i = int(rng.random() * len(self._prob))
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+    def draw(self, rng: Any = random) -> Any:
+        return self.labels[self.draw_index(rng)]
+
+    def draw_indices(self, count: int, rng: np.random.Generator) -> np.ndarray:
+        i = rng.integers(0, len(self.labels), count)
+        return np.where(rng.random(count) < self.prob[i], i, self.alias[i])
+
+    def draw_many(self, count: int, rng: np.random.Generator) -> np.ndarray:
+        return self.label_array[self.draw_indices(count, rng)]
+
+class MessageTemplates:
+    """Class to hold per-category message templates, formatted on demand
+
+    Templates are ``str.format`` patterns compiled to bound ``format``
+    methods once, so only the chosen message is ever built. Categories
+    without templates fall back to ``default``.
+    """
+
+    def __init__(self, templates: Dict[str, List[str]], default: str = "{kind} alert for {vehicle_id}"):
+        self.kinds = list(templates.keys())
+        self.formatters = {kind: [t.format for t in options] for kind, options in templates.items()}
+        self.default = default.format
+
+    def render(self, kind: str, vehicle_id: str, rng: Any = random) -> str:
+        options = self.formatters.get(kind)
+        if not options:
+            return self.default(kind=kind, vehicle_id=vehicle_id)
+        return options[int(rng.random() * len(options))](vehicle_id=vehicle_id)
+
+    def render_many(self, kinds: Sequence[str], vehicle_ids: Sequence[str],
+                    rng: np.random.Generator) -> List[str]:
+        picks = rng.random(len(kinds)).tolist()
+        messages = []
+        for kind, vehicle_id, u in zip(kinds, vehicle_ids, picks):
+            options = self.formatters.get(kind)
+            if options:
+                messages.append(options[int(u * len(options))](vehicle_id=vehicle_id))
+            else:
+                messages.append(self.default(kind=kind, vehicle_id=vehicle_id))
+        return messages
+
+# Tables built once at import from config
+ANOMALY_TYPE_TABLE = AliasTable.from_dict(ANOMALY_TYPES)
+# Live RSU outages are raised by RsuGenerator, so the live simulation never draws them
+LIVE_ANOMALY_TYPE_TABLE = AliasTable.from_dict(
+    {kind: weight for kind, weight in ANOMALY_TYPES.items() if kind != RSU_OFFLINE_ANOMALY}
+)
+# With a telemetry detector attached, the detected types are not drawn either
+UNDETECTED_ANOMALY_TYPE_TABLE = AliasTable.from_dict(
+    {kind: weight for kind, weight in ANOMALY_TYPES.items()
+     if kind != RSU_OFFLINE_ANOMALY and kind not in DETECTED_ANOMALY_TYPES}
+)
+ANOMALY_SEVERITY_TABLE = AliasTable(ANOMALY_SEVERITY, ANOMALY_SEVERITY_WEIGHTS)
+VEHICLE_TYPE_TABLE = AliasTable.from_dict(VEHICLE_TYPES)
+ANOMALY_MESSAGE_TEMPLATES = MessageTemplates(ANOMALY_MESSAGES)
+
+def draw_anomalies(count: int, vehicle_ids: Sequence[str], rng: np.random.Generator,
+                   detected_share: float = 0.7) -> Dict[str, List[Any]]:
+    """Draw ``count`` anomalies as columns: vehicle_id, type, severity, message, status
+
+    Everything except the message text is drawn as one NumPy batch.
+    """
+    ids = np.asarray(vehicle_ids, dtype=object)
+    chosen = ids[rng.integers(0, len(ids), count)].tolist()
+    types = ANOMALY_TYPE_TABLE.draw_many(count, rng).tolist()
+    return {
+        "vehicle_id": chosen,
+        "type": types,
+        "severity": ANOMALY_SEVERITY_TABLE.draw_many(count, rng).tolist(),
+        "message": ANOMALY_MESSAGE_TEMPLATES.render_many(types, chosen, rng),
+        "status": np.where(rng.random(count) < detected_share, "Detected", "Resolved").tolist(),
+    }
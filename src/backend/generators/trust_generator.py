@@ -2,216 +2,277 @@
 import asyncio
 import datetime
 import logging
-import random
-from typing import List, Dict, Any
-import uuid
+from typing import List, Dict, Any, AsyncIterator, Optional
+
+import numpy as np
 
 from ..config import (
-    TRUST_ACTIONS, get_traffic_volume_factor,
-    TRUST_UPDATE_INTERVAL, get_timestamp_hours_ago
+    TRUST_ACTIONS, TRUST_SCORE_CHANGES, TRUST_ACTION_AMOUNTS, TRUST_INITIAL_SCORES, get_traffic_volume_factor,
+    TRUST_UPDATE_INTERVAL, HISTORICAL_CHUNK_SIZE, get_timestamp_hours_ago, generate_vehicle_id
 )
+from ..clock import SimulationClock, SimulationScheduler
+from ..registry import VehicleRegistry
+from ..rng import RngStreams, get_streams
+from ..ledger import TrustLedger
+from .trust_engine import TrustEngine, ACTION_CODES, RENEWAL, encode_ids, hash_ids
 
 logger = logging.getLogger("traffic_simulator.trust_generator")
 
+# Span of the historical ledger, ending at the seeding time
+HISTORY_SECONDS = 24 * 3600
+
+def format_tx_id(timestamp: datetime.datetime, key: int) -> str:
+    """Transaction ID: the second it happened plus a unique 62-bit key (see ``RngStreams.row_keys``)
+
+    The key replaces a 4-digit random suffix that collided on the UNIQUE
+    tx_id column whenever two transactions fell in the same second.
+    """
+    return f"TX{timestamp.strftime('%Y%m%d%H%M%S')}-{key:016X}"
+
+def draw_amounts(rng: np.random.Generator, actions: np.ndarray) -> np.ndarray:
+    """Draw the amount of each transaction (score change or tokens) for its action code"""
+    changes = np.array(TRUST_SCORE_CHANGES)
+    amounts = changes[rng.integers(0, len(changes), len(actions))]
+    for action, (low, high) in TRUST_ACTION_AMOUNTS.items():
+        amounts = np.where(actions == ACTION_CODES[action], rng.integers(low, high + 1, len(actions)), amounts)
+    return np.where(actions == RENEWAL, 0, amounts)
+
 class TrustGenerator:
-    """Class to generate realistic trust ledger data"""
+    """Class to generate realistic trust ledger data
     
-    def __init__(self, db):
+    Transactions are applied to a ``TrustEngine`` holding every vehicle's
+    score and stake, and only the ones it accepts become ledger entries,
+    recording the values before and after.
+    """
+    
+    def __init__(self, db, registry: Optional[VehicleRegistry] = None, streams: Optional[RngStreams] = None):
         self.db = db
+        self.registry = registry if registry is not None else VehicleRegistry()
+        self.streams = (streams or get_streams()).child("trust_ledger")
+        self.random = self.streams.python("live")  # Live ticks
+        self.live_rng = self.streams.generator("live_transactions")
+        self.state = TrustEngine()  # Scores and stakes of every vehicle seen so far
+        self.ledger = TrustLedger()  # Blocks and hash chain of the entries
+        self.ledger_resumed = False
         
-    async def generate_historical_data(self, count: int = 1000) -> List[Dict[str, Any]]:
+    async def generate_historical_data(self, count: int = 1000,
+                                       vehicle_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """Generate historical trust ledger data for the past 24 hours"""
         logger.info(f"Generating {count} historical trust ledger records")
         
         trust_entries = []
+        async for chunk in self.stream_historical_data(count, vehicle_ids=vehicle_ids):
+            trust_entries.extend(chunk)
+                
+        logger.info(f"Generated {len(trust_entries)} historical trust ledger records")
+        return trust_entries
+        
+    async def stream_historical_data(self, count: int = 1000, chunk_size: int = HISTORICAL_CHUNK_SIZE,
+                                     vehicle_ids: Optional[List[str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield historical trust ledger records in chunks of at most ``chunk_size`` rows
+        
+        Entries refer to ``vehicle_ids`` when given, otherwise to vehicles
+        (and their scores) in the shared registry.
+        """
+        if vehicle_ids is None:
+            await self.registry.refresh(self.db, force=True)
+            vehicle_ids = self.registry.ids()
+            if not vehicle_ids:
+                logger.warning("No known vehicles, using random IDs")
+            self.state = self.initial_state(vehicle_ids, self.known_scores(vehicle_ids))
+        else:
+            self.state = self.initial_state(vehicle_ids)
         now = datetime.datetime.now()
         
-        # Get active vehicles first to reference in trust ledger
-        async with self.db.client.get(
-            f"{self.db.base_url}/rest/v1/vehicles?select=vehicle_id,trust_score&limit=1000",
-            headers=self.db.headers
-        ) as response:
-            if response.status_code == 200:
-                vehicles = await response.json()
-            else:
-                # Fallback to generating random vehicle IDs with trust scores
-                vehicles = [
-                    {"vehicle_id": f"TS0{random.randint(7, 9)}-{random.randint(1000, 9999)}", "trust_score": random.randint(70, 95)}
-                    for _ in range(100)
-                ]
-        
-        vehicle_map = {v["vehicle_id"]: v.get("trust_score", random.randint(70, 95)) for v in vehicles}
-        vehicle_ids = list(vehicle_map.keys())
-        
-        # Generate trust entries across 24 hours
-        for i in range(count):
-            # Random time in the last 24 hours
-            hours_ago = random.uniform(0, 24)
-            minutes_ago = int(hours_ago * 60)
-            timestamp = now - datetime.timedelta(minutes=minutes_ago)
-            
-            # Trust activity is higher during business hours
-            hour_of_day = timestamp.hour
-            activity_factor = 1.0
-            
-            # More activity during business hours (9 AM - 5 PM)
-            if 9 <= hour_of_day < 17:
-                activity_factor = 1.5
-            # Less activity late night (11 PM - 6 AM)
-            elif hour_of_day < 6 or hour_of_day >= 23:
-                activity_factor = 0.3
-                
-            # Skip some timestamps during low activity times
-            if random.random() > activity_factor and i % 3 != 0:
-                continue
-                
-            # Select random action
-            action = random.choice(TRUST_ACTIONS)
-            
-            # Get a random vehicle
-            vehicle_id = random.choice(vehicle_ids)
-            current_score = vehicle_map.get(vehicle_id, random.randint(70, 95))
-            
-            # Handle trust score changes
-            old_value = current_score
-            
-            if action == "Trust Score Update":
-                change = random.choice([-5, -3, -2, -1, 1, 2, 3, 5])
-                new_value = max(0, min(100, old_value + change))
-            elif action == "Stake Token":
-                tokens = random.randint(1, 100)
-                old_value = tokens
-                new_value = tokens
-            elif action == "Unstake Token":
-                tokens = random.randint(1, 50)
-                old_value = tokens
-                new_value = 0
-            elif action == "Penalize":
-                change = -random.randint(5, 15)
-                new_value = max(0, old_value + change)
-            elif action == "Reward":
-                change = random.randint(1, 10)
-                new_value = min(100, old_value + change)
-            else:  # Certificate Renewal
-                old_value = 0
-                new_value = 0
-                
-            # Update the stored trust score
-            vehicle_map[vehicle_id] = new_value
-            
-            # Generate transaction ID
-            tx_id = f"TX{timestamp.strftime('%Y%m%d%H%M%S')}-{random.randint(1000, 9999)}"
-            
-            trust_entry = {
+        for start in range(0, count, chunk_size):
+            stop = min(count, start + chunk_size)
+            chunk = self.generate_chunk(start, stop, self.state, now, count)
+            logger.info(f"Generated {stop}/{count} historical trust ledger records")
+            if chunk:
+                yield chunk
+            # Give in-flight uploads a chance to run between chunks
+            await asyncio.sleep(0)
+        
+    def starting_scores(self, vehicle_ids: List[str]) -> np.ndarray:
+        """Starting trust scores of vehicles that have no recorded score
+        
+        A score is a hash of the vehicle ID under the "initial_scores"
+        stream, so it is the same whichever subset of vehicles (e.g. a
+        shard's) is scored, without a random stream per vehicle.
+        """
+        low, high = TRUST_INITIAL_SCORES
+        if not vehicle_ids:
+            return np.empty(0, dtype=np.int64)
+        hashes = hash_ids(encode_ids(vehicle_ids), self.streams.seed_int("initial_scores"))
+        return low + (hashes % np.uint64(high - low + 1)).astype(np.int64)
+        
+    def known_scores(self, vehicle_ids: List[str]) -> np.ndarray:
+        """Trust scores recorded in the registry, or starting scores for vehicles without one"""
+        scores = self.starting_scores(vehicle_ids).tolist()
+        return np.array([self.registry.trust_scores.get(vehicle_id, score)
+                         for vehicle_id, score in zip(vehicle_ids, scores)], dtype=np.int64)
+        
+    def initial_state(self, vehicle_ids: List[str], scores: Optional[np.ndarray] = None) -> TrustEngine:
+        """A trust state holding ``vehicle_ids`` (slots in list order) with ``scores`` or starting scores"""
+        if not vehicle_ids:
+            # Fallback to generating random vehicle IDs
+            rng = self.streams.python("fallback_ids")
+            vehicle_ids = [generate_vehicle_id(rng) for _ in range(100)]
+            scores = None
+        state = TrustEngine(capacity=len(vehicle_ids))
+        state.add(vehicle_ids, self.starting_scores(vehicle_ids) if scores is None else scores)
+        return state
+        
+    def generate_chunk(self, start: int, stop: int, state: TrustEngine,
+                       now: datetime.datetime, total: int) -> List[Dict[str, Any]]:
+        """Generate the trust rows for candidate indices ``[start, stop)`` of ``total``
+        
+        Candidates are spread over the 24 hours before ``now`` in index
+        order (see ``draw_block``), so candidate order is time order: the
+        transactions are applied to ``state`` in the order they happened,
+        consecutive chunks continue from the same scores and stakes, and a
+        row only depends on its index and the transactions before it, not
+        on the chunk size. Transactions the state rejects (e.g. unstaking
+        more than is staked) are dropped.
+        """
+        columns = self.streams.draw_rows(
+            start, stop, lambda rng, first, count: self.draw_block(rng, first, count, len(state), now, total), "history"
+        )
+        if not columns:
+            return []
+        
+        times = now.timestamp() - columns["seconds_ago"]
+        accepted, old, new = state.apply(columns["vehicle"], columns["action"], columns["amount"], times)
+        kept = np.flatnonzero(accepted)
+        rows = columns["row"][kept]
+        
+        # Transaction keys by candidate index, unique across chunks, workers and shards
+        tx_keys = self.streams.row_keys(rows, "tx", now.isoformat()).tolist()
+        stamps = [now - datetime.timedelta(seconds=seconds) for seconds in columns["seconds_ago"][kept].tolist()]
+        tx_ids = [format_tx_id(stamp, key) for stamp, key in zip(stamps, tx_keys)]
+        trust_entries = self.ledger_entries(tx_ids, [stamp.isoformat() for stamp in stamps],
+                                            state.ids(columns["vehicle"][kept]),
+                                            columns["action"][kept], old[kept], new[kept])
+        
+        # Blocks are cut by candidate index, so chunks tag their rows independently
+        self.ledger.tag_history(trust_entries, rows.tolist())
+        return trust_entries
+        
+    def draw_block(self, rng: np.random.Generator, first: int, count: int, vehicle_count: int,
+                   now: datetime.datetime, total: int) -> Dict[str, np.ndarray]:
+        """Draw the transactions of ``count`` candidates starting at index ``first``, of ``total``"""
+        # Candidate i falls at a random point of its 1/total share of the last 24 hours, so
+        # times increase with the index; whole microseconds, as timestamps keep them
+        position = (first + np.arange(count) + rng.random(count)) / max(1, total)
+        seconds_ago = np.round((1 - position) * HISTORY_SECONDS * 1e6) / 1e6
+        minute_of_day = (now.hour * 60 + now.minute - seconds_ago // 60).astype(np.int64)
+        hour_of_day = minute_of_day // 60 % 24
+        
+        # Trust activity is higher during business hours (9 AM - 5 PM) and lower
+        # late at night (11 PM - 6 AM); some candidates at low activity times are skipped
+        activity_factor = np.where((9 <= hour_of_day) & (hour_of_day < 17), 1.5,
+                                   np.where((hour_of_day < 6) | (hour_of_day >= 23), 0.3, 1.0))
+        keep = (rng.random(count) <= activity_factor) | ((first + np.arange(count)) % 3 == 0)
+        
+        actions = rng.integers(0, len(TRUST_ACTIONS), count)
+        vehicles = rng.integers(0, vehicle_count, count)
+        amounts = draw_amounts(rng, actions)
+        
+        rows = np.flatnonzero(keep)
+        return {
+            "row": rows,
+            "seconds_ago": seconds_ago[rows],
+            "action": actions[rows],
+            "vehicle": vehicles[rows],
+            "amount": amounts[rows],
+        }
+        
+    def ledger_entries(self, tx_ids: List[str], timestamps: List[str], vehicle_ids: List[str], actions: np.ndarray,
+                       old_values: np.ndarray, new_values: np.ndarray) -> List[Dict[str, Any]]:
+        """trust_ledger rows for applied transactions, each stamped with the time it happened"""
+        return [
+            {
                 "tx_id": tx_id,
-                "timestamp": timestamp.isoformat(),
+                "timestamp": timestamp,
                 "vehicle_id": vehicle_id,
-                "action": action,
+                "action": TRUST_ACTIONS[action],
                 "old_value": old_value,
                 "new_value": new_value,
-                "details": f"{action} for vehicle {vehicle_id}"
+                "details": f"{TRUST_ACTIONS[action]} for vehicle {vehicle_id}"
             }
+            for tx_id, timestamp, vehicle_id, action, old_value, new_value
+            in zip(tx_ids, timestamps, vehicle_ids, actions.tolist(), old_values.tolist(), new_values.tolist())
+        ]
+        
+    async def tick(self, now: datetime.datetime):
+        """Generate one round of trust ledger entries at virtual time ``now``"""
+        # Continue the chain already in the database; until its tip has been
+        # read, skip the round rather than start a second chain at genesis
+        if not self.ledger_resumed:
+            if self.ledger.height == 0:
+                try:
+                    await self.ledger.resume_from(self.db)
+                except Exception as e:
+                    logger.error(f"Could not read the trust ledger tip, skipping this round: {str(e)}")
+                    return
+            self.ledger_resumed = True
+        
+        current_hour = now.hour
+        
+        # Trust activity is higher during business hours
+        activity_factor = 1.0
+        
+        # More activity during business hours (9 AM - 5 PM)
+        if 9 <= current_hour < 17:
+            activity_factor = 1.5
+        # Less activity late night (11 PM - 6 AM)
+        elif current_hour < 6 or current_hour >= 23:
+            activity_factor = 0.3
             
-            trust_entries.append(trust_entry)
-            
-            if i % 100 == 0:
-                logger.info(f"Generated {i+1}/{count} historical trust ledger records")
-                
-        logger.info(f"Generated {len(trust_entries)} historical trust ledger records")
-        return trust_entries
+        # Number of trust updates to generate
+        num_updates = max(1, int(self.random.randint(1, 5) * activity_factor))
+        
+        # Pick the vehicles involved from the shared registry (no per-cycle fetch)
+        await self.registry.refresh(self.db)
+        vehicle_ids = self.registry.sample(num_updates, self.random)
+        if not vehicle_ids:
+            # Fallback to generating random vehicle IDs
+            vehicle_ids = [generate_vehicle_id(self.random) for _ in range(num_updates)]
+        
+        # Vehicles new to the trust state start from their registry score
+        slots = self.state.add(vehicle_ids, self.known_scores(vehicle_ids))
+        actions = self.live_rng.integers(0, len(TRUST_ACTIONS), len(slots))
+        amounts = draw_amounts(self.live_rng, actions)
+        accepted, old, new = self.state.apply(slots, actions, amounts, np.full(len(slots), now.timestamp()))
+        kept = np.flatnonzero(accepted)
+        
+        tx_keys = self.streams.row_keys(np.arange(len(kept)), "live_tx", now.isoformat()).tolist()
+        trust_updates = self.ledger_entries([format_tx_id(now, key) for key in tx_keys], [now.isoformat()] * len(kept),
+                                            self.state.ids(slots[kept]), actions[kept], old[kept], new[kept])
+        
+        # Update the shared trust score (token and certificate actions do not change it)
+        for update in trust_updates:
+            if update["action"] in ("Trust Score Update", "Penalize", "Reward"):
+                self.registry.set_trust_score(update["vehicle_id"], update["new_value"])
+        
+        # Seal the round into a block, continuing the chain already in the database
+        headers = self.ledger.append(trust_updates, now.isoformat())
         
-    async def simulate(self):
-        """Run continuous simulation of trust ledger updates"""
+        # Insert trust updates into database, then the headers that commit to them
+        if trust_updates:
+            await self.db.insert_data("trust_ledger", trust_updates)
+            await self.db.insert_data("trust_blocks", headers)
+            logger.info(f"Generated {len(trust_updates)} new trust ledger entries in block {headers[-1]['height']}")
+        
+    async def simulate(self, clock: Optional[SimulationClock] = None):
+        """Run continuous simulation of trust ledger updates
+        
+        Runs ``tick`` every TRUST_UPDATE_INTERVAL on its own scheduler;
+        ``run_simulations`` in seed_data.py drives all generators off one
+        shared clock instead.
+        """
         logger.info("Starting trust ledger simulation")
         
-        while True:
-            current_hour = datetime.datetime.now().hour
-            
-            # Trust activity is higher during business hours
-            activity_factor = 1.0
-            
-            # More activity during business hours (9 AM - 5 PM)
-            if 9 <= current_hour < 17:
-                activity_factor = 1.5
-            # Less activity late night (11 PM - 6 AM)
-            elif current_hour < 6 or current_hour >= 23:
-                activity_factor = 0.3
-                
-            # Number of trust updates to generate
-            num_updates = max(1, int(random.randint(1, 5) * activity_factor))
-            
-            # Get active vehicles to reference in trust ledger
-            async with self.db.client.get(
-                f"{self.db.base_url}/rest/v1/vehicles?select=vehicle_id,trust_score&limit=1000",
-                headers=self.db.headers
-            ) as response:
-                if response.status_code == 200:
-                    vehicles = await response.json()
-                    vehicle_map = {v["vehicle_id"]: v.get("trust_score", random.randint(70, 95)) for v in vehicles}
-                    vehicle_ids = list(vehicle_map.keys())
-                else:
-                    # Fallback to generating random vehicle IDs with trust scores
-                    vehicle_ids = [f"TS0{random.randint(7, 9)}-{random.randint(1000, 9999)}" for _ in range(100)]
-                    vehicle_map = {vid: random.randint(70, 95) for vid in vehicle_ids}
-            
-            trust_updates = []
-            
-            for _ in range(num_updates):
-                # Select random action
-                action = random.choice(TRUST_ACTIONS)
-                
-                # Get a random vehicle
-                vehicle_id = random.choice(vehicle_ids)
-                current_score = vehicle_map.get(vehicle_id, random.randint(70, 95))
-                
-                # Handle trust score changes
-                old_value = current_score
-                
-                if action == "Trust Score Update":
-                    change = random.choice([-5, -3, -2, -1, 1, 2, 3, 5])
-                    new_value = max(0, min(100, old_value + change))
-                elif action == "Stake Token":
-                    tokens = random.randint(1, 100)
-                    old_value = tokens
-                    new_value = tokens
-                elif action == "Unstake Token":
-                    tokens = random.randint(1, 50)
-                    old_value = tokens
-                    new_value = 0
-                elif action == "Penalize":
-                    change = -random.randint(5, 15)
-                    new_value = max(0, old_value + change)
-                elif action == "Reward":
-                    change = random.randint(1, 10)
-                    new_value = min(100, old_value + change)
-                else:  # Certificate Renewal
-                    old_value = 0
-                    new_value = 0
-                    
-                # Update the stored trust score
-                vehicle_map[vehicle_id] = new_value
-                
-                # Generate transaction ID
-                timestamp = datetime.datetime.now()
-                tx_id = f"TX{timestamp.strftime('%Y%m%d%H%M%S')}-{random.randint(1000, 9999)}"
-                
-                trust_update = {
-                    "tx_id": tx_id,
-                    "timestamp": timestamp.isoformat(),
-                    "vehicle_id": vehicle_id,
-                    "action": action,
-                    "old_value": old_value,
-                    "new_value": new_value,
-                    "details": f"{action} for vehicle {vehicle_id}"
-                }
-                
-                trust_updates.append(trust_update)
-            
-            # Insert trust updates into database
-            if trust_updates:
-                await self.db.insert_data("trust_ledger", trust_updates)
-                logger.info(f"Generated {len(trust_updates)} new trust ledger entries")
-                
-            # Wait for next update interval with some randomness
-            wait_time = TRUST_UPDATE_INTERVAL + random.randint(-300, 300)
-            await asyncio.sleep(max(60, wait_time))  # At least 1 minute
+        scheduler = SimulationScheduler(clock or SimulationClock())
+        scheduler.every(TRUST_UPDATE_INTERVAL, self.tick, name="trust")
+        await scheduler.run()
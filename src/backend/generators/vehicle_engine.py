@@ -0,0 +1,115 @@
+
+import datetime
+import logging
+from typing import List, Dict, Any, Optional, Sequence, Union
+
+import numpy as np
+
+from ..config import (
+    VEHICLE_TYPES, VEHICLE_BASE_SPEEDS, KEY_JUNCTIONS, FIRST_NAMES, LAST_NAMES,
+    RANDOM_SEED
+)
+from ..traffic_profile import get_traffic_profile
+from .sampling import VEHICLE_TYPE_TABLE
+
+logger = logging.getLogger("traffic_simulator.vehicle_engine")
+
+# Record columns in the order the per-row generator emits them
+VEHICLE_COLUMNS = [
+    "vehicle_id", "owner_name", "vehicle_type", "trust_score", "lat", "lng",
+    "speed", "heading", "location", "timestamp", "status"
+]
+
+def hour_speed_factors() -> np.ndarray:
+    """Speed multiplier for each hour of day (faster at night, slower at peaks)"""
+    factors = np.ones(24)
+    for hour in range(24):
+        if 23 <= hour or hour < 5:  # Late night
+            factors[hour] = 1.2
+        elif 7 <= hour < 10 or 17 <= hour < 20:  # Peak hours
+            factors[hour] = 0.7
+    return factors
+
+def hour_of_day(timestamps: np.ndarray) -> np.ndarray:
+    """Hour of day (0-23) for an array of datetime64 timestamps"""
+    return (timestamps.astype("datetime64[h]") - timestamps.astype("datetime64[D]")).astype(np.int64)
+
+def random_timestamps(rng: np.random.Generator, now: datetime.datetime, count: int,
+                      hours: float = 24.0) -> np.ndarray:
+    """Draw ``count`` uniform timestamps in the ``hours`` before ``now``"""
+    offsets = (rng.uniform(0, hours, count) * 3600e6).astype("timedelta64[us]")
+    return np.datetime64(now, "us") - offsets
+
+class VehicleHistoryEngine:
+    """Columnar engine for historical vehicle records
+
+    Draws every column for a whole request as NumPy arrays in one pass,
+    with the same distributions as ``VehicleGenerator``'s per-row loop.
+    """
+
+    def __init__(self, seed: Union[int, Sequence[int], None] = RANDOM_SEED):
+        self.rng = np.random.default_rng(seed)
+
+        # Lookup tables built once, indexed by the drawn category codes
+        self.vehicle_types = np.array(list(VEHICLE_TYPES.keys()), dtype=object)
+        self.base_speeds = np.array([VEHICLE_BASE_SPEEDS[t] for t in VEHICLE_TYPES], dtype=float)
+        self.speed_factors = hour_speed_factors()
+
+        self.junction_names = np.array(list(KEY_JUNCTIONS.keys()), dtype=object)
+        self.junction_lat = np.array([j["lat"] for j in KEY_JUNCTIONS.values()])
+        self.junction_lng = np.array([j["lng"] for j in KEY_JUNCTIONS.values()])
+
+        self.names = np.array([f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES], dtype=object)
+
+    def generate_columns(self, count: int, vehicle_ids: List[str],
+                         now: Optional[datetime.datetime] = None,
+                         rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+        """Generate up to ``count`` records as a dict of equal-length column arrays
+
+        As in the per-row path, candidate timestamps are thinned by the
+        traffic volume factor of their hour, so fewer than ``count`` rows
+        are returned; the extra "row" column holds each record's candidate
+        index. Draws from ``rng`` when given, otherwise the engine's own.
+        """
+        rng = rng if rng is not None else self.rng
+        now = now or datetime.datetime.now()
+
+        # Candidate timestamps and the traffic-factor rejection mask
+        timestamps = random_timestamps(rng, now, count)
+        hours = hour_of_day(timestamps)
+        keep = rng.random(count) <= get_traffic_profile().factors(timestamps)
+        timestamps = timestamps[keep]
+        hours = hours[keep]
+        n = len(timestamps)
+
+        ids = np.asarray(vehicle_ids, dtype=object)
+        junctions = rng.integers(0, len(self.junction_names), n)
+        types = VEHICLE_TYPE_TABLE.draw_indices(n, rng)
+        speeds = self.base_speeds[types] * self.speed_factors[hours] * rng.uniform(0.8, 1.2, n)
+
+        return {
+            "vehicle_id": ids[rng.integers(0, len(ids), n)],
+            "owner_name": self.names[rng.integers(0, len(self.names), n)],
+            "vehicle_type": self.vehicle_types[types],
+            "trust_score": rng.integers(60, 101, n),
+            "lat": self.junction_lat[junctions] + rng.uniform(-0.001, 0.001, n),
+            "lng": self.junction_lng[junctions] + rng.uniform(-0.001, 0.001, n),
+            "speed": np.round(speeds, 1),
+            "heading": rng.integers(0, 360, n),
+            "location": self.junction_names[junctions],
+            "timestamp": np.datetime_as_string(timestamps, unit="us"),
+            "status": np.full(n, "Active", dtype=object),
+            "row": np.flatnonzero(keep),
+        }
+
+    @staticmethod
+    def to_records(columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+        """Convert column arrays into the list-of-dicts rows the database layer expects"""
+        names = [name for name in VEHICLE_COLUMNS if name in columns]
+        values = [columns[name].tolist() for name in names]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+    def generate_records(self, count: int, vehicle_ids: List[str],
+                         now: Optional[datetime.datetime] = None) -> List[Dict[str, Any]]:
+        """Generate historical vehicle records as row dicts"""
+        return self.to_records(self.generate_columns(count, vehicle_ids, now))
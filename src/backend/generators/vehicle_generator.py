@@ -3,84 +3,150 @@ import asyncio
 import datetime
 import json
 import logging
-import random
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, AsyncIterator
 import uuid
 
 from ..config import (
-    VEHICLE_TYPES, LICENSE_PLATE_SERIES, get_traffic_volume_factor, 
+    VEHICLE_TYPES, VEHICLE_BASE_SPEEDS, LICENSE_PLATE_SERIES, 
     get_random_junction_location, generate_vehicle_id, get_random_name,
-    VEHICLE_UPDATE_INTERVAL, get_timestamp_hours_ago
+    VEHICLE_UPDATE_INTERVAL, get_timestamp_hours_ago, HISTORICAL_ENGINE, HISTORICAL_CHUNK_SIZE,
+    MAX_ACTIVE_VEHICLES, VEHICLE_MOVEMENT_MODEL, TELEMETRY_HARD_BRAKE_RATE, TELEMETRY_GPS_GLITCH_RATE
 )
+from .vehicle_engine import VehicleHistoryEngine
+from .sampling import VEHICLE_TYPE_TABLE
+from .fleet import FleetStore
+from .delta import DeltaTracker
+from ..clock import SimulationClock, SimulationScheduler
+from ..registry import VehicleRegistry
+from ..traffic_profile import get_traffic_profile
+from ..spatial import get_spatial_index
+from ..roads import get_road_graph
+from ..rng import RngStreams, get_streams
 
 logger = logging.getLogger("traffic_simulator.vehicle_generator")
 
 class VehicleGenerator:
     """Class to generate realistic vehicle data"""
     
-    def __init__(self, db):
+    def __init__(self, db, registry: Optional[VehicleRegistry] = None, streams: Optional[RngStreams] = None):
         self.db = db
-        self.active_vehicles = {}  # Store currently active vehicles
+        self.registry = registry if registry is not None else VehicleRegistry()
+        self.streams = (streams or get_streams()).child("vehicles")
+        self.random = self.streams.python("live")  # Single live vehicles
+        self.fleet = FleetStore(seed=self.streams.sequence("fleet"))  # Currently active vehicles, stored column-wise
+        self.vehicle_types = list(VEHICLE_TYPES.keys())
+        self._engine = None  # Columnar engine, created on first use
+        self.tracker: Optional[DeltaTracker] = None  # Change tracking for the live simulation
+        self._upload: Optional[asyncio.Task] = None  # Vehicle upload still in flight, if any
         
-    async def generate_historical_data(self, count: int = 10000) -> List[Dict[str, Any]]:
-        """Generate historical vehicle data for the past 24 hours"""
+    def get_engine(self) -> VehicleHistoryEngine:
+        """Return the columnar history engine"""
+        if self._engine is None:
+            self._engine = VehicleHistoryEngine(seed=self.streams.sequence("engine"))
+        return self._engine
+        
+    async def generate_historical_data(self, count: int = 10000, engine: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Generate historical vehicle data for the past 24 hours
+        
+        ``engine`` selects the columnar NumPy path ("numpy") or the per-row
+        loop ("python"); it defaults to HISTORICAL_ENGINE.
+        """
         logger.info(f"Generating {count} historical vehicle records")
         
         vehicles = []
+        async for chunk in self.stream_historical_data(count, engine=engine):
+            vehicles.extend(chunk)
+                
+        logger.info(f"Generated {len(vehicles)} historical vehicle records")
+        return vehicles
         
-        # Create a set of unique vehicle IDs
-        unique_vehicle_ids = set()
+    async def stream_historical_data(self, count: int = 10000, chunk_size: int = HISTORICAL_CHUNK_SIZE,
+                                     engine: Optional[str] = None,
+                                     vehicle_ids: Optional[List[str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield historical vehicle records in chunks of at most ``chunk_size`` rows
+        
+        Only one chunk is held at a time, so a consumer that uploads chunks
+        as they arrive keeps memory bounded regardless of ``count``.
+        """
+        vehicle_id_list = vehicle_ids if vehicle_ids is not None else self.create_vehicle_ids(count)
+        
+        # Generate historical entries across 24 hours
+        now = datetime.datetime.now()
+        
+        for start in range(0, count, chunk_size):
+            stop = min(count, start + chunk_size)
+            chunk = self.generate_chunk(start, stop, vehicle_id_list, now, engine)
+            logger.info(f"Generated {stop}/{count} historical vehicle records")
+            if chunk:
+                yield chunk
+            # Give in-flight uploads a chance to run between chunks
+            await asyncio.sleep(0)
+        
+    def create_vehicle_ids(self, count: int) -> List[str]:
+        """Create the set of unique vehicle IDs that ``count`` history rows refer to"""
+        rng = self.streams.python("ids")
+        
+        # Create a set of unique vehicle IDs, in draw order so the list is reproducible
+        unique_vehicle_ids = {}
         
         # Generate unique vehicles first
         num_unique_vehicles = min(count // 10, 1000)  # Each vehicle will have ~10 records
         
         for _ in range(num_unique_vehicles):
-            vehicle_id = generate_vehicle_id()
-            unique_vehicle_ids.add(vehicle_id)
+            vehicle_id = generate_vehicle_id(rng)
+            unique_vehicle_ids[vehicle_id] = None
             
         # Convert to list for random.choices
-        vehicle_id_list = list(unique_vehicle_ids)
+        vehicle_ids = list(unique_vehicle_ids)
+        self.registry.add_many(vehicle_ids)
+        return vehicle_ids
         
-        # Generate historical entries across 24 hours
-        now = datetime.datetime.now()
+    def generate_chunk(self, start: int, stop: int, vehicle_id_list: List[str],
+                       now: datetime.datetime, engine: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Generate the history rows for candidate indices ``[start, stop)``
+        
+        Rows come from the "history" streams (in blocks for the NumPy path,
+        one per row for the loop), so they are the same however the
+        candidates are split into chunks or across worker processes.
+        """
+        if (engine or HISTORICAL_ENGINE) == "numpy":
+            history = self.get_engine()
+            return history.to_records(self.streams.draw_rows(
+                start, stop, lambda rng, first, count: history.generate_columns(count, vehicle_id_list, now, rng),
+                "history"
+            ))
+        
+        vehicles = []
+        profile = get_traffic_profile()
         
-        for i in range(count):
+        for i, rng in self.streams.python_rows(start, stop, "history"):
             # Random time in the last 24 hours
-            hours_ago = random.uniform(0, 24)
+            hours_ago = rng.uniform(0, 24)
             timestamp = now - datetime.timedelta(hours=hours_ago)
             
             # Traffic volume affects how many vehicles are active
-            hour_of_day = timestamp.hour
-            traffic_factor = get_traffic_volume_factor(hour_of_day)
+            traffic_factor = profile.factor(timestamp)
             
-            if random.random() > traffic_factor:
+            if rng.random() > traffic_factor:
                 continue  # Skip this iteration based on traffic factor
                 
             # Choose vehicle from our unique set, more activity for some vehicles
-            vehicle_id = random.choice(vehicle_id_list)
+            vehicle_id = rng.choice(vehicle_id_list)
             
             # Get a random location near a junction
-            lat, lng, location = get_random_junction_location()
+            lat, lng, location = get_random_junction_location(rng)
             
             # Determine vehicle type based on configured distribution
-            vehicle_type = random.choices(
-                list(VEHICLE_TYPES.keys()),
-                weights=list(VEHICLE_TYPES.values())
-            )[0]
+            vehicle_type = VEHICLE_TYPE_TABLE.draw(rng)
             
             # Random trust score between 60 and 100
-            trust_score = random.randint(60, 100)
+            trust_score = rng.randint(60, 100)
             
             # Calculate a speed based on vehicle type and time of day
-            base_speed = {
-                "Car": 45,
-                "Truck": 35, 
-                "Bus": 30,
-                "Ambulance": 55,
-                "Two-Wheeler": 50
-            }[vehicle_type]
+            base_speed = VEHICLE_BASE_SPEEDS[vehicle_type]
             
             # Adjust speed based on time of day
+            hour_of_day = timestamp.hour
             if 23 <= hour_of_day or hour_of_day < 5:  # Late night
                 speed_factor = 1.2  # Faster at night due to less traffic
             elif 7 <= hour_of_day < 10 or 17 <= hour_of_day < 20:  # Peak hours
@@ -88,50 +154,43 @@ class VehicleGenerator:
             else:
                 speed_factor = 1.0  # Normal
                 
-            speed = base_speed * speed_factor * random.uniform(0.8, 1.2)
+            speed = base_speed * speed_factor * rng.uniform(0.8, 1.2)
             
             vehicle = {
                 "vehicle_id": vehicle_id,
-                "owner_name": get_random_name(),
+                "owner_name": get_random_name(rng),
                 "vehicle_type": vehicle_type,
                 "trust_score": trust_score,
                 "lat": lat,
                 "lng": lng,
                 "speed": round(speed, 1),
-                "heading": random.randint(0, 359),
+                "heading": rng.randint(0, 359),
                 "location": location,
                 "timestamp": timestamp.isoformat(),
                 "status": "Active",
             }
             
             vehicles.append(vehicle)
-            
-            if i % 1000 == 0:
-                logger.info(f"Generated {i+1}/{count} historical vehicle records")
                 
-        logger.info(f"Generated {len(vehicles)} historical vehicle records")
         return vehicles
         
     def generate_vehicle(self) -> Dict[str, Any]:
         """Generate a single random vehicle"""
-        vehicle_id = generate_vehicle_id()
-        lat, lng, location = get_random_junction_location()
+        vehicle_id = generate_vehicle_id(self.random)
+        lat, lng, location = get_random_junction_location(self.random)
         
         # Get a weighted random vehicle type
-        vehicle_type = random.choices(
-            list(VEHICLE_TYPES.keys()),
-            weights=list(VEHICLE_TYPES.values())
-        )[0]
+        vehicle_type = VEHICLE_TYPE_TABLE.draw(self.random)
         
         vehicle = {
             "vehicle_id": vehicle_id,
-            "owner_name": get_random_name(),
+            "owner_name": get_random_name(self.random),
             "vehicle_type": vehicle_type,
-            "trust_score": random.randint(70, 100),
+            "trust_score": self.random.randint(70, 100),
             "lat": lat,
             "lng": lng,
-            "speed": random.randint(0, 80),
-            "heading": random.randint(0, 359),
+            "speed": self.random.randint(0, 80),
+            "heading": self.random.randint(0, 359),
             "location": location,
             "timestamp": datetime.datetime.now().isoformat(),
             "status": "Active"
@@ -139,83 +198,82 @@ class VehicleGenerator:
         
         return vehicle
     
-    def update_vehicle_position(self, vehicle: Dict[str, Any]) -> Dict[str, Any]:
-        """Update an existing vehicle's position based on its speed and heading"""
-        speed_km_per_hour = vehicle["speed"]
-        heading_degrees = vehicle["heading"]
-        
-        # Convert speed to degrees latitude/longitude per interval
-        # Very rough approximation: 111km per degree
-        km_per_degree = 111.0
-        speed_deg_per_hour = speed_km_per_hour / km_per_degree
-        speed_deg_per_interval = speed_deg_per_hour * (VEHICLE_UPDATE_INTERVAL / 3600)
-        
-        # Convert heading to radians
-        heading_rad = heading_degrees * 3.14159 / 180
-        
-        # Calculate new position
-        lat_change = speed_deg_per_interval * -1 * (0 if heading_rad == 0 else (heading_rad / abs(heading_rad))) * abs(heading_rad ** 0.5)
-        lng_change = speed_deg_per_interval * (0 if heading_rad == 0 else (heading_rad / abs(heading_rad)))
-        
-        # Update position
-        vehicle["lat"] += lat_change
-        vehicle["lng"] += lng_change
-        vehicle["timestamp"] = datetime.datetime.now().isoformat()
-        
-        # Occasionally change heading and speed
-        if random.random() < 0.2:
-            # Change heading slightly
-            vehicle["heading"] = (vehicle["heading"] + random.randint(-30, 30)) % 360
+    async def upload_changes(self, groups: List[List[Dict[str, Any]]]):
+        """Upsert drained vehicle changes, one request stream per column set"""
+        for rows in groups:
+            await self.db.insert_data("vehicles", rows)
+        logger.info(f"Updated {sum(len(rows) for rows in groups)} vehicles")
+        
+    async def tick(self, now: datetime.datetime):
+        """Advance the fleet one update interval to virtual time ``now``
+        
+        Only vehicles that changed enough since they were last sent are
+        upserted (see ``DeltaTracker``). While an upload is still running,
+        further ticks are merged into the next one instead of queueing up.
+        """
+        if self.tracker is None:
+            self.tracker = DeltaTracker(self.fleet, partial_rows=self.db.supports_partial_rows)
+            if VEHICLE_MOVEMENT_MODEL == "roads":
+                self.fleet.use_roads(get_road_graph())
+            # Initialize with some vehicles
+            self.fleet.spawn(100)
             
-            # Change speed slightly
-            vehicle["speed"] = max(0, min(80, vehicle["speed"] + random.randint(-10, 10)))
+        traffic_factor = get_traffic_profile().factor(now)
         
-        return vehicle
+        # Determine how many vehicles should be active based on time of day
+        target_active_vehicles = int(MAX_ACTIVE_VEHICLES * traffic_factor)
+        current_active_count = len(self.fleet)
         
-    async def simulate(self):
-        """Run continuous simulation of vehicle movements"""
-        logger.info("Starting vehicle simulation")
+        # Add or remove vehicles to match target, ramping in proportion to fleet size
+        if current_active_count < target_active_vehicles:
+            vehicles_to_add = min(max(10, target_active_vehicles // 50), target_active_vehicles - current_active_count)
+            self.fleet.spawn(vehicles_to_add)
+                
+        elif current_active_count > target_active_vehicles:
+            vehicles_to_remove = min(max(5, target_active_vehicles // 100), current_active_count - target_active_vehicles)
+            self.registry.remove_many(self.fleet.remove_random(vehicles_to_remove))
         
-        # Initialize with some vehicles
-        for _ in range(100):
-            vehicle = self.generate_vehicle()
-            self.active_vehicles[vehicle["vehicle_id"]] = vehicle
+        # Update positions of all active vehicles in one vectorised step (along
+        # their routes on the road graph), with the odd hard brake or GPS glitch,
+        # then re-label each with its nearest junction
+        self.fleet.step(VEHICLE_UPDATE_INTERVAL)
+        self.fleet.disturb(TELEMETRY_HARD_BRAKE_RATE, TELEMETRY_GPS_GLITCH_RATE)
+        self.fleet.relabel(get_spatial_index())
+        self.tracker.track(now.isoformat(), now.timestamp())
             
-        while True:
-            current_hour = datetime.datetime.now().hour
-            traffic_factor = get_traffic_volume_factor(current_hour)
+        # Upsert the changes, unless the previous upload is still in flight
+        if self._upload is None or self._upload.done():
+            groups = self.tracker.drain()
+            if groups:
+                # New and moving vehicles become (or stay) known to the other generators;
+                # rows queued before a vehicle left the fleet are still uploaded, not registered
+                for rows in groups:
+                    self.registry.add_rows(row for row in rows if row["vehicle_id"] in self.fleet)
+                self._upload = asyncio.create_task(self.upload_changes(groups))
+        else:
+            logger.info(f"Vehicle upload still running; coalescing {len(self.tracker.pending)} pending changes")
             
-            # Determine how many vehicles should be active based on time of day
-            target_active_vehicles = int(500 * traffic_factor)
-            current_active_count = len(self.active_vehicles)
-            
-            # Add or remove vehicles to match target
-            if current_active_count < target_active_vehicles:
-                # Add some new vehicles
-                vehicles_to_add = min(10, target_active_vehicles - current_active_count)
-                for _ in range(vehicles_to_add):
-                    vehicle = self.generate_vehicle()
-                    self.active_vehicles[vehicle["vehicle_id"]] = vehicle
-                    
-            elif current_active_count > target_active_vehicles:
-                # Remove some vehicles
-                vehicles_to_remove = min(5, current_active_count - target_active_vehicles)
-                for _ in range(vehicles_to_remove):
-                    if self.active_vehicles:
-                        vehicle_id = random.choice(list(self.active_vehicles.keys()))
-                        del self.active_vehicles[vehicle_id]
-            
-            # Update positions of all active vehicles
-            updated_vehicles = []
-            for vehicle_id, vehicle in list(self.active_vehicles.items()):
-                updated_vehicle = self.update_vehicle_position(vehicle)
-                self.active_vehicles[vehicle_id] = updated_vehicle
-                updated_vehicles.append(updated_vehicle)
-                
-            # Insert updated vehicles into database
-            if updated_vehicles:
-                await self.db.insert_data("vehicles", updated_vehicles)
-                logger.info(f"Updated {len(updated_vehicles)} vehicles")
-                
-            # Wait for next update interval
-            await asyncio.sleep(VEHICLE_UPDATE_INTERVAL)
+    async def flush(self):
+        """Wait for the in-flight upload, then upload whatever is still pending"""
+        if self._upload is not None:
+            await self._upload
+        if self.tracker is not None:
+            groups = self.tracker.drain()
+            if groups:
+                await self.upload_changes(groups)
+        
+    async def simulate(self, clock: Optional[SimulationClock] = None):
+        """Run continuous simulation of vehicle movements
+        
+        Runs ``tick`` every VEHICLE_UPDATE_INTERVAL on its own scheduler;
+        ``run_simulations`` in seed_data.py drives all generators off one
+        shared clock instead.
+        """
+        logger.info("Starting vehicle simulation")
+        
+        scheduler = SimulationScheduler(clock or SimulationClock())
+        scheduler.every(VEHICLE_UPDATE_INTERVAL, self.tick, name="vehicles")
+        try:
+            await scheduler.run()
+        finally:
+            await self.flush()
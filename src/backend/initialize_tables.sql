@@ -47,7 +47,24 @@ CREATE TABLE IF NOT EXISTS public.trust_ledger (
   action VARCHAR(50) NOT NULL,
   old_value INTEGER NOT NULL,
   new_value INTEGER NOT NULL,
-  details TEXT
+  details TEXT,
+  block_height INTEGER,
+  block_position INTEGER
+);
+
+-- Ledgers created before blocks existed
+ALTER TABLE public.trust_ledger ADD COLUMN IF NOT EXISTS block_height INTEGER;
+ALTER TABLE public.trust_ledger ADD COLUMN IF NOT EXISTS block_position INTEGER;
+
+-- Create trust ledger block headers table (hash chain of Merkle roots, see ledger.py)
+CREATE TABLE IF NOT EXISTS public.trust_blocks (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  height INTEGER NOT NULL UNIQUE,
+  prev_hash CHAR(64) NOT NULL,
+  merkle_root CHAR(64) NOT NULL,
+  entry_count INTEGER NOT NULL,
+  timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  block_hash CHAR(64) NOT NULL UNIQUE
 );
 
 -- Create congestion zones table
@@ -67,6 +84,7 @@ CREATE INDEX IF NOT EXISTS idx_anomalies_timestamp ON public.anomalies(timestamp
 CREATE INDEX IF NOT EXISTS idx_anomalies_vehicle_id ON public.anomalies(vehicle_id);
 CREATE INDEX IF NOT EXISTS idx_trust_ledger_timestamp ON public.trust_ledger(timestamp);
 CREATE INDEX IF NOT EXISTS idx_trust_ledger_vehicle_id ON public.trust_ledger(vehicle_id);
+CREATE INDEX IF NOT EXISTS idx_trust_ledger_block ON public.trust_ledger(block_height, block_position);
 CREATE INDEX IF NOT EXISTS idx_zones_congestion_zone_name ON public.zones_congestion(zone_name);
 CREATE INDEX IF NOT EXISTS idx_zones_congestion_updated_at ON public.zones_congestion(updated_at);
 
@@ -75,6 +93,7 @@ ALTER TABLE public.vehicles ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.rsus ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.anomalies ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.trust_ledger ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.trust_blocks ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.zones_congestion ENABLE ROW LEVEL SECURITY;
 
 -- Set default policies to allow all access (these can be restricted later)
@@ -82,6 +101,7 @@ CREATE POLICY IF NOT EXISTS all_access_policy ON public.vehicles FOR ALL USING (
 CREATE POLICY IF NOT EXISTS all_access_policy ON public.rsus FOR ALL USING (true);
 CREATE POLICY IF NOT EXISTS all_access_policy ON public.anomalies FOR ALL USING (true);
 CREATE POLICY IF NOT EXISTS all_access_policy ON public.trust_ledger FOR ALL USING (true);
+CREATE POLICY IF NOT EXISTS all_access_policy ON public.trust_blocks FOR ALL USING (true);
 CREATE POLICY IF NOT EXISTS all_access_policy ON public.zones_congestion FOR ALL USING (true);
 
 -- Add realtime support
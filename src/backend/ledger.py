@@ -0,0 +1,237 @@
+import datetime
+import hashlib
+import logging
+from typing import List, Dict, Any, Tuple, Iterable
+
+from .config import LEDGER_BLOCK_SIZE, LEDGER_GENESIS_HASH
+
+logger = logging.getLogger("traffic_simulator.ledger")
+
+# trust_ledger columns covered by an entry's leaf hash
+LEAF_COLUMNS = ["tx_id", "timestamp", "vehicle_id", "action", "old_value", "new_value", "details"]
+
+# A verified point of the chain: (height of the last verified block, its block hash)
+Checkpoint = Tuple[int, str]
+GENESIS_CHECKPOINT: Checkpoint = (-1, LEDGER_GENESIS_HASH)
+
+class LedgerError(Exception):
+    """Raised when a block, chain or proof does not verify"""
+
+def canonical_timestamp(value: Any) -> str:
+    """One spelling of a timestamp, however it was written or read back
+
+    Databases return TIMESTAMPTZ values with an offset (and sometimes a
+    different precision), so hashes are taken over UTC with microseconds;
+    naive timestamps are taken to be UTC, as the database stores them.
+    """
+    stamp = value
+    if not isinstance(stamp, datetime.datetime):
+        stamp = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return stamp.isoformat(timespec="microseconds")
+
+def leaf_hash(row: Dict[str, Any]) -> bytes:
+    """Hash of one trust_ledger entry (0x00-prefixed, so a leaf can never pass for an inner node)"""
+    values = [canonical_timestamp(row[column]) if column == "timestamp" else str(row[column])
+              for column in LEAF_COLUMNS]
+    data = "\x1f".join(values).encode("utf-8")
+    return hashlib.sha256(b"\x00" + data).digest()
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def merkle_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    """Every level of the Merkle tree over ``leaves``, leaves first and the root last
+
+    An odd node out is promoted to the next level unchanged rather than
+    paired with a copy of itself, so no two leaf lists share a root.
+    """
+    levels = [list(leaves) or [hashlib.sha256(b"").digest()]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+def merkle_root(leaves: List[bytes]) -> bytes:
+    return merkle_levels(leaves)[-1][0]
+
+def block_hash(height: int, prev_hash: str, root: str, entry_count: int, timestamp: str) -> str:
+    """Hash of a block header, which chains it to the block before"""
+    header = f"{height}|{prev_hash}|{root}|{entry_count}|{canonical_timestamp(timestamp)}".encode("utf-8")
+    return hashlib.sha256(header).hexdigest()
+
+def block_order(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """A block's entries in leaf order"""
+    return sorted(rows, key=lambda row: row["block_position"])
+
+class TrustLedger:
+    """Class to group trust ledger entries into hash-chained, Merkle-rooted blocks
+
+    Entries are tagged with ``block_height`` and ``block_position`` (their
+    leaf order), and each block's header (a trust_blocks row) carries the
+    Merkle root of its entries and the hash of the previous header. An
+    entry is proven with its O(log block size) Merkle path plus its
+    block's header, and an audit only rehashes the headers added since the
+    last checkpoint, not the entries.
+
+    History blocks are cut by candidate index: block k holds the kept
+    entries among candidates ``[k * block_size, (k + 1) * block_size)``, so
+    any chunk, worker or shard tags its rows without knowing the rest, and
+    ``summarise`` turns the rows into per-block roots that ``chain`` links
+    in order. Live entries go through ``append``, one block per batch.
+    """
+
+    def __init__(self, block_size: int = LEDGER_BLOCK_SIZE):
+        self.block_size = block_size
+        self.height = 0  # Height of the next block
+        self.tip = LEDGER_GENESIS_HASH  # Hash of the last block
+        self._open: Dict[int, List[bytes]] = {}  # Leaves of history blocks still being summarised
+        self._open_height = -1
+
+    def resume(self, header: Dict[str, Any]):
+        """Continue the chain after ``header`` (e.g. the newest trust_blocks row)"""
+        self.height = int(header["height"]) + 1
+        self.tip = header["block_hash"]
+
+    async def resume_from(self, db) -> bool:
+        """Continue the chain after the newest block stored in ``db``; False if there is none
+
+        A failed read raises (see ``Sink.fetch_rows``): starting over at the
+        genesis block would overwrite the stored chain.
+        """
+        rows = await db.fetch_rows("trust_blocks", ["height", "block_hash"], since_column="height",
+                                   limit=1, newest_first=True)
+        if not rows:
+            return False
+        self.resume(rows[0])
+        logger.info(f"Resuming the trust ledger at block {self.height}")
+        return True
+
+    def tag_history(self, rows: List[Dict[str, Any]], indices: List[int]):
+        """Tag history entries with their block (counted from the start of the history) and position"""
+        for row, index in zip(rows, indices):
+            row["block_height"] = index // self.block_size
+            row["block_position"] = index % self.block_size
+
+    def summarise(self, rows: List[Dict[str, Any]], final: bool = False) -> List[Tuple[int, str, int]]:
+        """Merkle roots of the history blocks completed by ``rows``, as (height, root, entry count)
+
+        Rows must arrive in candidate order (chunks in order); a block is
+        complete once a later block has started, or with ``final``.
+        """
+        for row in rows:
+            height = row["block_height"]
+            self._open.setdefault(height, []).append(leaf_hash(row))
+            self._open_height = max(self._open_height, height)
+        done = sorted(h for h in self._open if final or h < self._open_height)
+        summaries = []
+        for height in done:
+            leaves = self._open.pop(height)
+            summaries.append((height, merkle_root(leaves).hex(), len(leaves)))
+        return summaries
+
+    def chain(self, summaries: List[Tuple[int, str, int]], timestamp: str) -> List[Dict[str, Any]]:
+        """Link block roots (in height order, continuing from ``height``) into trust_blocks rows"""
+        headers = []
+        for height, root, entry_count in summaries:
+            if height < self.height:
+                raise LedgerError(f"Block {height} is already chained (next block is {self.height})")
+            # Candidate ranges with no kept entries leave gaps in the heights; the chain skips them
+            headers.append(self._seal(height, root, entry_count, timestamp))
+        return headers
+
+    def append(self, rows: List[Dict[str, Any]], timestamp: str) -> List[Dict[str, Any]]:
+        """Tag live entries and seal them into blocks of at most ``block_size``; return the headers"""
+        headers = []
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            for position, row in enumerate(block):
+                row["block_height"] = self.height
+                row["block_position"] = position
+            root = merkle_root([leaf_hash(row) for row in block]).hex()
+            headers.append(self._seal(self.height, root, len(block), timestamp))
+        return headers
+
+    def _seal(self, height: int, root: str, entry_count: int, timestamp: str) -> Dict[str, Any]:
+        header = {
+            "height": height,
+            "prev_hash": self.tip,
+            "merkle_root": root,
+            "entry_count": entry_count,
+            "timestamp": timestamp,
+            "block_hash": block_hash(height, self.tip, root, entry_count, timestamp),
+        }
+        self.height = height + 1
+        self.tip = header["block_hash"]
+        return header
+
+def prove(block_rows: List[Dict[str, Any]], tx_id: str) -> Dict[str, Any]:
+    """Inclusion proof of entry ``tx_id`` in the block holding ``block_rows``
+
+    The proof is the entry's block height and its Merkle path: one
+    (sibling hash, sibling is on the left) pair per tree level.
+    """
+    rows = block_order(block_rows)
+    index = next((i for i, row in enumerate(rows) if row["tx_id"] == tx_id), None)
+    if index is None:
+        raise LedgerError(f"{tx_id} is not in the block")
+    path = []
+    for level in merkle_levels([leaf_hash(row) for row in rows])[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            path.append((level[sibling].hex(), sibling < index))
+        index //= 2
+    return {"tx_id": tx_id, "block_height": rows[0]["block_height"], "path": path}
+
+def verify_proof(row: Dict[str, Any], proof: Dict[str, Any], header: Dict[str, Any]) -> bool:
+    """Check that ``row`` is in the block of ``header``, hashing only the proof path"""
+    if row["tx_id"] != proof["tx_id"] or int(header["height"]) != proof["block_height"]:
+        return False
+    node = leaf_hash(row)
+    for sibling, on_left in proof["path"]:
+        node = node_hash(bytes.fromhex(sibling), node) if on_left else node_hash(node, bytes.fromhex(sibling))
+    return node.hex() == header["merkle_root"]
+
+def verify_block(header: Dict[str, Any], block_rows: List[Dict[str, Any]]) -> bool:
+    """Rehash one block's entries and check them against its header"""
+    rows = block_order(block_rows)
+    return (len(rows) == int(header["entry_count"])
+            and merkle_root([leaf_hash(row) for row in rows]).hex() == header["merkle_root"])
+
+def verify_chain(headers: Iterable[Dict[str, Any]], checkpoint: Checkpoint = GENESIS_CHECKPOINT) -> Checkpoint:
+    """Verify the headers after ``checkpoint`` (in height order); return the new checkpoint
+
+    Each header must hash to its ``block_hash`` and point at the one
+    before. Raises ``LedgerError`` at the first block that does not.
+    """
+    height, tip = checkpoint
+    for header in headers:
+        expected = block_hash(int(header["height"]), header["prev_hash"], header["merkle_root"],
+                              int(header["entry_count"]), str(header["timestamp"]))
+        if header["prev_hash"] != tip or int(header["height"]) <= height:
+            raise LedgerError(f"Block {header['height']} does not follow block {height}")
+        if header["block_hash"] != expected:
+            raise LedgerError(f"Block {header['height']} has been altered")
+        height, tip = int(header["height"]), header["block_hash"]
+    return height, tip
+
+async def audit(db, checkpoint: Checkpoint = GENESIS_CHECKPOINT, page_size: int = 1000) -> Checkpoint:
+    """Verify the trust_blocks chain stored in ``db`` from ``checkpoint`` on; return the new checkpoint
+
+    Only headers are read and hashed: ``verify_block`` and ``verify_proof``
+    check individual blocks and entries against the verified headers.
+    """
+    columns = ["height", "prev_hash", "merkle_root", "entry_count", "timestamp", "block_hash"]
+    start = checkpoint
+    while True:
+        headers = await db.fetch_rows("trust_blocks", columns, since=checkpoint[0], since_column="height",
+                                      limit=page_size)
+        if not headers:
+            break
+        checkpoint = verify_chain(headers, checkpoint)
+    logger.info(f"Verified trust ledger blocks {start[0] + 1}-{checkpoint[0]}")
+    return checkpoint
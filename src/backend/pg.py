@@ -0,0 +1,253 @@
+import asyncio
+import datetime
+import logging
+import os
+import time
+import uuid
+from typing import List, Dict, Any, Optional, AsyncIterable, Callable
+
+from .config import DATABASE_URL, PG_POOL_SIZE, PG_COPY_BATCH_ROWS
+from .sinks import Sink
+from .schema import TABLE_COLUMNS, column_names, merge_sql
+
+try:
+    import asyncpg
+except ImportError:  # Optional dependency, only needed for the direct Postgres backend
+    asyncpg = None
+
+logger = logging.getLogger("traffic_simulator.pg")
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "initialize_tables.sql")
+
+def _to_timestamp(value: Any) -> Optional[datetime.datetime]:
+    if value is None or isinstance(value, datetime.datetime):
+        moment = value
+    else:
+        moment = datetime.datetime.fromisoformat(str(value))
+    if moment is not None and moment.tzinfo is None:
+        # Naive timestamps are read as UTC, like PostgREST does with Supabase's default time zone
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment
+
+def _to_uuid(value: Any) -> Optional[uuid.UUID]:
+    if value is None or isinstance(value, uuid.UUID):
+        return value
+    return uuid.UUID(str(value))
+
+def _optional(cast: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    return lambda value: None if value is None else cast(value)
+
+# Python-side conversions so binary COPY gets the types the columns expect
+CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "text": _optional(str),
+    "int": _optional(int),
+    "float": _optional(float),
+    "timestamp": _to_timestamp,
+    "uuid": _to_uuid,
+}
+
+def schema_statements(path: str = SCHEMA_FILE) -> List[str]:
+    """Return the CREATE TABLE / CREATE INDEX / ADD COLUMN statements of initialize_tables.sql
+
+    Supabase-specific statements (RLS, policies, publications) are skipped
+    so the schema can be created on a plain local PostgreSQL.
+    """
+    with open(path, encoding="utf-8") as f:
+        sql = f.read()
+
+    statements = []
+    for statement in sql.split(";"):
+        lines = [line for line in statement.splitlines() if line.strip() and not line.strip().startswith("--")]
+        text = "\n".join(lines).strip()
+        upper = text.upper()
+        if upper.startswith(("CREATE TABLE", "CREATE INDEX")) or (upper.startswith("ALTER TABLE") and "ADD COLUMN" in upper):
+            statements.append(text + ";")
+    return statements
+
+class PostgresDatabase(Sink):
+    """Class to load records directly into PostgreSQL, bypassing PostgREST
+
+    Each batch is streamed with binary ``COPY`` into a temporary staging
+    table and merged into the real table with one set-based
+    ``INSERT ... ON CONFLICT`` (see ``schema.merge_sql``), all in a single
+    transaction. Partial rows (change-only updates) are merged with an
+    UPDATE of the columns they carry. Requires ``asyncpg``; point ``DATABASE_URL`` at any
+    PostgreSQL, e.g. the local Supabase database on port 54322.
+    """
+
+    name = "postgres"
+    supports_partial_rows = True
+
+    def __init__(self, dsn: str = DATABASE_URL, concurrency: int = PG_POOL_SIZE,
+                 copy_batch_rows: int = PG_COPY_BATCH_ROWS):
+        if asyncpg is None:
+            raise RuntimeError("The postgres backend requires asyncpg (pip install asyncpg)")
+        super().__init__()
+        self.dsn = dsn
+        self.concurrency = max(1, concurrency)
+        self.copy_batch_rows = copy_batch_rows
+        self._pool = None
+
+    async def _get_pool(self):
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=self.concurrency)
+        return self._pool
+
+    async def __aenter__(self) -> "PostgresDatabase":
+        await self._get_pool()
+        return self
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def create_tables(self) -> bool:
+        """Create the tables and indexes from initialize_tables.sql if missing"""
+        logger.info("Creating tables if they don't exist...")
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            for statement in schema_statements():
+                await conn.execute(statement)
+        logger.info("Tables verified.")
+        return True
+
+    def _records(self, table_name: str, data: List[Dict[str, Any]]):
+        """Return the column list present in ``data`` and the converted row tuples"""
+        types = dict(TABLE_COLUMNS[table_name])
+        columns = [c for c in column_names(table_name) if c in data[0]]
+        converters = [CONVERTERS[types[c]] for c in columns]
+        records = [tuple(convert(row.get(c)) for c, convert in zip(columns, converters)) for row in data]
+        return columns, records
+
+    async def _copy_and_merge(self, table_name: str, data: List[Dict[str, Any]]) -> int:
+        columns, records = self._records(table_name, data)
+        staging = f"staging_{table_name}"
+        column_list = ", ".join(f'"{c}"' for c in columns)
+
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                # Staging copies column types only, without constraints or defaults
+                await conn.execute(
+                    f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                    f"SELECT {column_list} FROM public.{table_name} WITH NO DATA"
+                )
+                await conn.copy_records_to_table(staging, records=records, columns=columns)
+                await conn.execute(merge_sql(table_name, staging, columns))
+        return len(records)
+
+    async def insert_data(self, table_name: str, data: List[Dict[str, Any]]) -> bool:
+        """Insert data into specified table via COPY + merge"""
+        if not data:
+            logger.warning(f"No data to insert into {table_name}")
+            return False
+
+        stats = self._get_throughput(table_name)
+        started = time.perf_counter()
+        inserted = 0
+        for i in range(0, len(data), self.copy_batch_rows):
+            batch = data[i:i + self.copy_batch_rows]
+            try:
+                inserted += await self._copy_and_merge(table_name, batch)
+                stats.batches += 1
+            except Exception as e:
+                logger.error(f"Error copying {len(batch)} records into {table_name}: {str(e)}")
+                stats.failed_rows += len(batch)
+
+        stats.rows += inserted
+        stats.elapsed += time.perf_counter() - started
+        logger.info(f"Successfully inserted {inserted}/{len(data)} records into {table_name}")
+        return inserted > 0
+
+    async def insert_stream(self, table_name: str, chunks: AsyncIterable[List[Dict[str, Any]]]) -> int:
+        """Copy chunks as they arrive, keeping up to ``concurrency`` COPYs in flight"""
+        stats = self._get_throughput(table_name)
+        slots = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        pending = set()
+        inserted = 0
+        buffer: List[Dict[str, Any]] = []
+
+        async def copy(batch: List[Dict[str, Any]]) -> int:
+            try:
+                count = await self._copy_and_merge(table_name, batch)
+                stats.batches += 1
+                return count
+            except Exception as e:
+                logger.error(f"Error copying {len(batch)} records into {table_name}: {str(e)}")
+                stats.failed_rows += len(batch)
+                return 0
+            finally:
+                slots.release()
+
+        def on_done(task: asyncio.Task):
+            nonlocal inserted
+            pending.discard(task)
+            inserted += task.result()
+
+        async def dispatch(batch: List[Dict[str, Any]]):
+            await slots.acquire()
+            task = asyncio.create_task(copy(batch))
+            pending.add(task)
+            task.add_done_callback(on_done)
+
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                if len(buffer) >= self.copy_batch_rows:
+                    await dispatch(buffer)
+                    buffer = []
+            if buffer:
+                await dispatch(buffer)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            stats.rows += inserted
+            stats.elapsed += time.perf_counter() - started
+
+        logger.info(f"Successfully inserted {inserted} streamed records into {table_name}")
+        return inserted
+
+    async def fetch_rows(self, table_name: str, columns: List[str], since: Optional[str] = None,
+                         since_column: str = "timestamp", limit: int = 1000,
+                         newest_first: bool = False) -> List[Dict[str, Any]]:
+        """Read rows back with a plain SELECT (see ``Sink.fetch_rows``)"""
+        column_list = ", ".join(f'"{c}"' for c in columns)
+        query = f"SELECT {column_list} FROM public.{table_name}"
+        args: List[Any] = []
+        if since is not None:
+            query += f' WHERE "{since_column}" > $1'
+            args.append(_to_timestamp(since) if dict(TABLE_COLUMNS[table_name]).get(since_column) == "timestamp" else since)
+        query += f' ORDER BY "{since_column}" {"DESC" if newest_first else "ASC"} LIMIT {int(limit)}'
+
+        pool = await self._get_pool()
+        records = await pool.fetch(query, *args)
+        # Same shape PostgREST returns: JSON-style values, ISO timestamps
+        return [
+            {k: (v.isoformat() if isinstance(v, datetime.datetime) else v) for k, v in record.items()}
+            for record in records
+        ]
+
+    async def get_count(self, table_name: str) -> int:
+        """Get count of records in a table"""
+        try:
+            pool = await self._get_pool()
+            count = await pool.fetchval(f"SELECT count(*) FROM public.{table_name}")
+            logger.info(f"Table {table_name} has {count} records")
+            return count
+        except Exception as e:
+            logger.error(f"Error getting count for {table_name}: {str(e)}")
+            return 0
+
+    async def clear_table(self, table_name: str) -> bool:
+        """Clear all data from a table"""
+        logger.warning(f"Clearing all data from {table_name}")
+        try:
+            pool = await self._get_pool()
+            await pool.execute(f"TRUNCATE public.{table_name}")
+            logger.info(f"Successfully cleared table {table_name}")
+            return True
+        except Exception as e:
+            logger.error(f"Error clearing table {table_name}: {str(e)}")
+            return False
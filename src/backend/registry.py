@@ -0,0 +1,171 @@
+import logging
+import random
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Iterable
+
+from .config import (
+    REGISTRY_MAX_VEHICLES, REGISTRY_TTL, REGISTRY_REFRESH_INTERVAL, REGISTRY_FETCH_LIMIT
+)
+
+logger = logging.getLogger("traffic_simulator.registry")
+
+class VehicleRegistry:
+    """Class to cache known vehicles in-process for every generator
+
+    ``VehicleGenerator`` registers vehicles as it creates and moves them;
+    ``AnomalyGenerator`` and ``TrustGenerator`` sample from the registry
+    instead of querying the vehicles table each cycle. Vehicles written by
+    other processes are picked up by ``refresh``, which only asks the sink
+    for rows newer than the last one it saw.
+
+    Entries unseen for ``ttl`` seconds expire and the least recently seen
+    are evicted beyond ``max_size``. IDs are also kept in a dense list so
+    ``sample`` and removal are O(1).
+    """
+
+    def __init__(self, max_size: int = REGISTRY_MAX_VEHICLES, ttl: float = REGISTRY_TTL,
+                 refresh_interval: float = REGISTRY_REFRESH_INTERVAL, fetch_limit: int = REGISTRY_FETCH_LIMIT):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.fetch_limit = fetch_limit
+
+        self._seen: "OrderedDict[str, float]" = OrderedDict()  # vehicle_id -> last seen, oldest first
+        self._ids: List[str] = []
+        self._position: Dict[str, int] = {}
+        self.trust_scores: Dict[str, int] = {}
+        self.vehicle_types: Dict[str, str] = {}
+
+        self.high_water: Optional[str] = None  # Newest vehicles.timestamp fetched from the sink
+        self._refreshed_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, vehicle_id: str) -> bool:
+        return vehicle_id in self._position
+
+    def add(self, vehicle_id: str, trust_score: Optional[int] = None, vehicle_type: Optional[str] = None):
+        """Register or refresh one vehicle, marking it as just seen"""
+        if vehicle_id in self._position:
+            self._seen.move_to_end(vehicle_id)
+        else:
+            self._position[vehicle_id] = len(self._ids)
+            self._ids.append(vehicle_id)
+        self._seen[vehicle_id] = time.monotonic()
+        if trust_score is not None:
+            # Scores changed in-process (see TrustGenerator) win over re-sent vehicle rows
+            self.trust_scores.setdefault(vehicle_id, trust_score)
+        if vehicle_type is not None:
+            self.vehicle_types[vehicle_id] = vehicle_type
+
+    def add_many(self, vehicle_ids: Iterable[str]):
+        for vehicle_id in vehicle_ids:
+            self.add(vehicle_id)
+        self._evict()
+
+    def add_rows(self, rows: Iterable[Dict[str, Any]]):
+        """Register vehicles from vehicle records (full or partial rows)"""
+        for row in rows:
+            self.add(row["vehicle_id"], row.get("trust_score"), row.get("vehicle_type"))
+        self._evict()
+
+    def remove(self, vehicle_id: str) -> bool:
+        index = self._position.pop(vehicle_id, None)
+        if index is None:
+            return False
+        # Move the last ID into the freed position so the list stays dense
+        last = self._ids.pop()
+        if last != vehicle_id:
+            self._ids[index] = last
+            self._position[last] = index
+        del self._seen[vehicle_id]
+        self.trust_scores.pop(vehicle_id, None)
+        self.vehicle_types.pop(vehicle_id, None)
+        return True
+
+    def remove_many(self, vehicle_ids: Iterable[str]):
+        for vehicle_id in vehicle_ids:
+            self.remove(vehicle_id)
+
+    def expire(self):
+        """Drop vehicles unseen for longer than the TTL"""
+        cutoff = time.monotonic() - self.ttl
+        expired = 0
+        while self._seen:
+            vehicle_id, seen = next(iter(self._seen.items()))
+            if seen >= cutoff:
+                break
+            self.remove(vehicle_id)
+            expired += 1
+        if expired:
+            logger.info(f"Expired {expired} vehicles from the registry")
+
+    def _evict(self):
+        while len(self._ids) > self.max_size:
+            self.remove(next(iter(self._seen)))
+
+    def ids(self) -> List[str]:
+        return list(self._ids)
+
+    def sample(self, count: int, rng: Any = random) -> List[str]:
+        """Draw ``count`` vehicle IDs uniformly, with replacement, from ``rng``"""
+        if not self._ids:
+            return []
+        ids = self._ids
+        return [ids[rng.randrange(len(ids))] for _ in range(count)]
+
+    def trust_score(self, vehicle_id: str, rng: Any = random) -> int:
+        """Known trust score of a vehicle, assigning a starting score from ``rng`` if it has none"""
+        score = self.trust_scores.get(vehicle_id)
+        if score is None:
+            score = rng.randint(70, 95)
+            self.set_trust_score(vehicle_id, score)
+        return score
+
+    def set_trust_score(self, vehicle_id: str, score: int):
+        """Record a vehicle's new trust score (ignored for unknown vehicles)"""
+        if vehicle_id in self._position:
+            self.trust_scores[vehicle_id] = score
+
+    async def refresh(self, db, force: bool = False) -> int:
+        """Pull vehicles written since the last refresh; return how many were fetched
+
+        Runs at most once per ``refresh_interval`` unless ``force``. The
+        first refresh loads the newest ``fetch_limit`` vehicles, later ones
+        page forward from the high-water timestamp.
+        """
+        now = time.monotonic()
+        if not force and self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+            return 0
+        self._refreshed_at = now
+        self.expire()
+
+        columns = ["vehicle_id", "vehicle_type", "trust_score", "timestamp"]
+        fetched = 0
+        try:
+            if self.high_water is None:
+                rows = await db.fetch_rows("vehicles", columns, limit=self.fetch_limit, newest_first=True)
+                self._take(rows)
+                fetched += len(rows)
+            else:
+                while True:
+                    rows = await db.fetch_rows("vehicles", columns, since=self.high_water, limit=self.fetch_limit)
+                    self._take(rows)
+                    fetched += len(rows)
+                    if len(rows) < self.fetch_limit or fetched >= self.max_size:
+                        break
+        except Exception as e:
+            logger.error(f"Error refreshing vehicle registry: {str(e)}")
+
+        if fetched:
+            logger.info(f"Vehicle registry refreshed with {fetched} vehicles ({len(self)} known)")
+        return fetched
+
+    def _take(self, rows: List[Dict[str, Any]]):
+        self.add_rows(rows)
+        for row in rows:
+            timestamp = row.get("timestamp")
+            if timestamp is not None and (self.high_water is None or str(timestamp) > self.high_water):
+                self.high_water = str(timestamp)
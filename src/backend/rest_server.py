@@ -0,0 +1,403 @@
+
+import asyncio
+import argparse
+import datetime
+import json
+import logging
+import random
+import uuid
+from collections import Counter
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+from .config import (
+    LOCAL_REST_HOST, LOCAL_REST_PORT, LOCAL_REST_LATENCY, LOCAL_REST_ERROR_RATE, LOCAL_REST_THROTTLE_RATE,
+    LOCAL_REST_RETRY_AFTER, LOCAL_REST_MAX_BODY_BYTES, RANDOM_SEED
+)
+from .schema import TABLE_COLUMNS, CONFLICT_KEYS
+
+logger = logging.getLogger("traffic_simulator.rest_server")
+
+# Query parameters that are not column filters
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+REASONS = {
+    200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 401: "Unauthorized",
+    404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 411: "Length Required",
+    413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+}
+
+class RestError(Exception):
+    """An error response, with a PostgREST-style JSON body"""
+
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+def _to_timestamp(value: Any) -> datetime.datetime:
+    moment = value if isinstance(value, datetime.datetime) else datetime.datetime.fromisoformat(str(value))
+    if moment.tzinfo is None:
+        # Naive timestamps are read as UTC, like PostgREST does with Supabase's default time zone
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment
+
+# Conversions applied to stored values and filter operands before comparing them, by column type
+CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "text": str,
+    "uuid": str,
+    "int": int,
+    "float": float,
+    "timestamp": _to_timestamp,
+}
+
+class MemoryTable:
+    """Class to hold one table's rows in memory, keyed by its unique column
+
+    The unique column is the table's natural key from ``CONFLICT_KEYS``
+    (the one uploads are merged on), or the ``id`` primary key for tables
+    without one; rows inserted without an ``id`` get a random UUID, as
+    the ``gen_random_uuid()`` default would give them.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.types = {"id": "uuid"}
+        self.types.update(TABLE_COLUMNS[name])
+        self.key = CONFLICT_KEYS.get(name, "id")
+        self.rows: Dict[Any, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def insert(self, rows: List[Dict[str, Any]], merge: bool, on_conflict: Optional[str]) -> int:
+        """Insert (or with ``merge``, upsert) ``rows`` as one statement: all of them or none"""
+        if on_conflict is not None and on_conflict != self.key:
+            raise RestError(400, "42P10", f"there is no unique or exclusion constraint matching the ON CONFLICT specification ({on_conflict})")
+        keys = []
+        seen = set()
+        for row in rows:
+            if not isinstance(row, dict):
+                raise RestError(400, "PGRST102", "All object keys must match")
+            for column in row:
+                if column not in self.types:
+                    raise RestError(400, "PGRST204", f"Could not find the '{column}' column of '{self.name}' in the schema cache")
+            key = row.get(self.key) if self.key != "id" else row.get("id") or str(uuid.uuid4())
+            if key is None:
+                raise RestError(400, "23502", f'null value in column "{self.key}" of relation "{self.name}" violates not-null constraint')
+            if key in seen:
+                if merge:
+                    raise RestError(500, "21000", "ON CONFLICT DO UPDATE command cannot affect row a second time")
+                raise RestError(409, "23505", f'duplicate key value violates unique constraint "{self.name}_{self.key}_key"')
+            if not merge and key in self.rows:
+                raise RestError(409, "23505", f'duplicate key value violates unique constraint "{self.name}_{self.key}_key"')
+            seen.add(key)
+            keys.append(key)
+
+        for key, row in zip(keys, rows):
+            stored = self.rows.get(key)
+            if stored is None:
+                stored = self.rows[key] = {"id": str(uuid.uuid4())}
+                stored[self.key] = key
+            stored.update(row)
+        return len(rows)
+
+    def match(self, filters: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Rows passing every PostgREST filter (``column``, ``op.operand``)"""
+        rows = list(self.rows.values())
+        for column, expression in filters:
+            if column not in self.types:
+                raise RestError(400, "42703", f"column {self.name}.{column} does not exist")
+            test = self._predicate(column, expression)
+            rows = [row for row in rows if test(row.get(column))]
+        return rows
+
+    def _predicate(self, column: str, expression: str) -> Callable[[Any], bool]:
+        convert = CONVERTERS[self.types[column]]
+        negate = expression.startswith("not.")
+        if negate:
+            expression = expression[4:]
+        op, _, operand = expression.partition(".")
+        try:
+            if op == "is":
+                wanted = {"null": None, "true": True, "false": False}[operand.lower()]
+                test = lambda value: value is wanted
+            elif op == "in":
+                options = {convert(option.strip().strip('"')) for option in operand.strip("()").split(",") if option}
+                test = lambda value: value is not None and convert(value) in options
+            elif op in COMPARISONS:
+                target = convert(operand)
+                compare = COMPARISONS[op]
+                test = lambda value: value is not None and compare(convert(value), target)
+            else:
+                raise RestError(400, "PGRST100", f'"failed to parse filter ({op}.{operand})"')
+        except (ValueError, KeyError):
+            raise RestError(400, "22P02", f'invalid input syntax for {self.types[column]}: "{operand}"')
+        return (lambda value: not test(value)) if negate else test
+
+    def order(self, rows: List[Dict[str, Any]], order: str) -> List[Dict[str, Any]]:
+        """Sort rows by a PostgREST ``order`` value such as ``timestamp.desc,vehicle_id``"""
+        # Stable sorts from the last term to the first sort by all terms
+        for term in reversed(order.split(",")):
+            column, *modifiers = term.split(".")
+            if column not in self.types:
+                raise RestError(400, "42703", f"column {self.name}.{column} does not exist")
+            convert = CONVERTERS[self.types[column]]
+            descending = "desc" in modifiers
+            # Postgres puts nulls last ascending and first descending, unless told otherwise
+            nulls_first = "nullsfirst" in modifiers or (descending and "nullslast" not in modifiers)
+            present = [row for row in rows if row.get(column) is not None]
+            missing = [row for row in rows if row.get(column) is None]
+            present.sort(key=lambda row: convert(row[column]), reverse=descending)
+            rows = missing + present if nulls_first else present + missing
+        return rows
+
+    def delete(self, filters: List[Tuple[str, str]]) -> int:
+        doomed = self.match(filters) if filters else list(self.rows.values())
+        if len(doomed) == len(self.rows):
+            self.rows.clear()
+        else:
+            for row in doomed:
+                del self.rows[row[self.key]]
+        return len(doomed)
+
+COMPARISONS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+class LocalRestServer:
+    """Class to serve the subset of PostgREST that ``Database`` uses, from in-memory tables
+
+    Tables match ``schema.TABLE_COLUMNS`` (and so initialize_tables.sql).
+    It answers:
+
+    - POST /rest/v1/<table>: bulk insert of a JSON array, upserting on
+      ``on_conflict`` with ``Prefer: resolution=merge-duplicates``
+    - GET /rest/v1/<table>: ``select`` (columns, or ``count``), column
+      filters (eq, neq, gt, gte, lt, lte, in, is, not.), ``order``,
+      ``limit`` and ``offset``, with a ``content-range`` header that
+      carries the total under ``Prefer: count=exact``
+    - DELETE /rest/v1/<table>: removes the rows matching the filters
+
+    Faults can be injected to exercise the client's retry and backoff:
+    extra ``latency`` per response (varied by +-50%), a fraction of
+    requests answered with 500 (``error_rate``) or with 429 and a
+    Retry-After header (``throttle_rate``), and 413 for bodies over
+    ``max_body_bytes``. With ``store`` False, POSTs are acknowledged
+    without parsing their body, so load tests measure the client alone.
+
+    Requests are parsed on keep-alive connections straight off asyncio
+    streams, so one process answers thousands of small requests per second.
+    """
+
+    def __init__(self, host: str = LOCAL_REST_HOST, port: int = LOCAL_REST_PORT,
+                 latency: float = LOCAL_REST_LATENCY, error_rate: float = LOCAL_REST_ERROR_RATE,
+                 throttle_rate: float = LOCAL_REST_THROTTLE_RATE, retry_after: float = LOCAL_REST_RETRY_AFTER,
+                 max_body_bytes: int = LOCAL_REST_MAX_BODY_BYTES, key: Optional[str] = None,
+                 store: bool = True, seed: int = RANDOM_SEED):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.max_body_bytes = max_body_bytes
+        self.key = key  # apikey every request must carry (None accepts any)
+        self.store = store
+        self.random = random.Random(seed)  # Drives the injected latency and faults
+        self.tables = {name: MemoryTable(name) for name in TABLE_COLUMNS}
+        self.responses: Counter = Counter()  # Responses sent, by status code
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to give ``Database``"""
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "LocalRestServer":
+        """Start listening (on a free port, if ``port`` is 0)"""
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"PostgREST stand-in listening on {self.url}")
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "LocalRestServer":
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer requests on one keep-alive connection until the client closes it"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await self._read_body(reader, headers)
+
+                status, response_headers, payload = await self.handle(method, target, headers, body)
+                self.responses[status] += 1
+                head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"content-length: {len(payload)}"]
+                if payload:
+                    head.append("content-type: application/json; charset=utf-8")
+                head.extend(f"{name}: {value}" for name, value in response_headers.items())
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_body(self, reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                chunks.append(chunk[:-2])
+            return b"".join(chunks)
+        return await reader.readexactly(int(headers.get("content-length", 0)))
+
+    async def handle(self, method: str, target: str, headers: Dict[str, str],
+                     body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        """Answer one request; return (status, headers, body)"""
+        if self.latency > 0:
+            await asyncio.sleep(self.latency * self.random.uniform(0.5, 1.5))
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            return self._error(RestError(429, "PGRST429", "Too many requests (injected)"),
+                               {"retry-after": f"{self.retry_after:g}"})
+        if roll < self.throttle_rate + self.error_rate:
+            return self._error(RestError(500, "XX000", "Internal error (injected)"))
+
+        try:
+            if self.key is not None and headers.get("apikey") != self.key:
+                raise RestError(401, "PGRST301", "Invalid API key")
+            parts = urlsplit(target)
+            path = unquote(parts.path)
+            if not path.startswith("/rest/v1/"):
+                raise RestError(404, "PGRST125", f"Invalid path {path}")
+            table = self.tables.get(path[len("/rest/v1/"):].strip("/"))
+            if table is None:
+                raise RestError(404, "42P01", f'relation "public.{path[len("/rest/v1/"):]}" does not exist')
+            params = parse_qsl(parts.query, keep_blank_values=True)
+            prefer = {item.strip() for item in headers.get("prefer", "").split(",")}
+
+            if method == "POST":
+                return self._post(table, params, prefer, body)
+            if method == "GET":
+                return self._get(table, params, prefer)
+            if method == "DELETE":
+                table.delete([(name, value) for name, value in params if name not in RESERVED_PARAMS])
+                return 204, {}, b""
+            raise RestError(405, "PGRST117", f"Unsupported HTTP method: {method}")
+        except RestError as e:
+            return self._error(e)
+
+    def _post(self, table: MemoryTable, params: List[Tuple[str, str]], prefer: set,
+              body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        if len(body) > self.max_body_bytes:
+            raise RestError(413, "PGRST413", f"Request body larger than {self.max_body_bytes} bytes")
+        if self.store:
+            try:
+                rows = json.loads(body)
+            except ValueError as e:
+                raise RestError(400, "PGRST102", f"Empty or invalid json ({e})")
+            if isinstance(rows, dict):
+                rows = [rows]
+            table.insert(rows, "resolution=merge-duplicates" in prefer, dict(params).get("on_conflict"))
+        return 201, {}, b""
+
+    def _get(self, table: MemoryTable, params: List[Tuple[str, str]],
+             prefer: set) -> Tuple[int, Dict[str, str], bytes]:
+        options = dict(params)
+        rows = table.match([(name, value) for name, value in params if name not in RESERVED_PARAMS])
+        total = str(len(rows)) if "count=exact" in prefer else "*"
+        select = [column.strip() for column in options.get("select", "*").split(",") if column.strip()]
+
+        if select == ["count"]:
+            return 200, {"content-range": f"0-0/{total}"}, json.dumps([{"count": len(rows)}]).encode("utf-8")
+
+        for column in select:
+            if column != "*" and column not in table.types:
+                raise RestError(400, "42703", f"column {table.name}.{column} does not exist")
+        if "order" in options:
+            rows = table.order(rows, options["order"])
+        try:
+            offset = int(options.get("offset", 0))
+            limit = int(options["limit"]) if "limit" in options else None
+        except ValueError:
+            raise RestError(400, "PGRST100", "limit and offset must be integers")
+        rows = rows[offset:offset + limit if limit is not None else None]
+        if "*" not in select:
+            rows = [{column: row.get(column) for column in select} for row in rows]
+
+        content_range = f"{offset}-{offset + len(rows) - 1}/{total}" if rows else f"*/{total}"
+        return 200, {"content-range": content_range}, json.dumps(rows, default=str).encode("utf-8")
+
+    def _error(self, error: RestError, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        payload = {"code": error.code, "message": error.message, "details": None, "hint": None}
+        return error.status, headers or {}, json.dumps(payload).encode("utf-8")
+
+    def summary(self) -> str:
+        counts = ", ".join(f"{name} {len(table)}" for name, table in self.tables.items())
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(self.responses.items()))
+        return f"Rows: {counts}; responses by status: {statuses or 'none'}"
+
+async def serve(args: argparse.Namespace):
+    server = LocalRestServer(args.host, args.port, latency=args.latency, error_rate=args.error_rate,
+                             throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+                             key=args.key, store=not args.discard)
+    try:
+        await server.serve_forever()
+    finally:
+        logger.info(server.summary())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local PostgREST stand-in for offline runs and load tests of the seeder")
+
+    parser.add_argument("--host", default=LOCAL_REST_HOST, help="Address to listen on")
+    parser.add_argument("--port", type=int, default=LOCAL_REST_PORT, help="Port to listen on (0 picks a free one)")
+    parser.add_argument("--latency", type=float, default=LOCAL_REST_LATENCY, help="Seconds added to every response (varied by +-50%%)")
+    parser.add_argument("--error-rate", type=float, default=LOCAL_REST_ERROR_RATE, help="Fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=LOCAL_REST_THROTTLE_RATE, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=LOCAL_REST_RETRY_AFTER, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--key", default=None, help="Only accept requests with this apikey header")
+    parser.add_argument("--discard", action="store_true", help="Acknowledge inserts without parsing or storing them")
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
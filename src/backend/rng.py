@@ -0,0 +1,141 @@
+import hashlib
+import random
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple
+
+import numpy as np
+
+from .config import RANDOM_SEED, RNG_BLOCK_ROWS
+
+# A block drawer takes (rng, first candidate row, candidate count) and returns
+# column arrays plus a "row" column: each output row's candidate index within the block
+BlockDrawer = Callable[[np.random.Generator, int, int], Dict[str, np.ndarray]]
+
+def stream_key(*parts: Any) -> Tuple[int, ...]:
+    """Integer key for a stream name; strings are hashed stably (not with ``hash``, which is salted per process)"""
+    key = []
+    for part in parts:
+        if isinstance(part, (int, np.integer)):
+            key.append(int(part))
+        else:
+            key.append(int.from_bytes(hashlib.blake2b(str(part).encode(), digest_size=8).digest(), "little"))
+    return tuple(key)
+
+KEY_BITS = 62
+KEY_MASK = np.uint64((1 << KEY_BITS) - 1)
+
+def mix_keys(values: np.ndarray) -> np.ndarray:
+    """Scramble 62-bit integers with a bijection, so distinct inputs give distinct keys
+
+    Xor-shifts and multiplications by odd constants are each invertible
+    modulo 2**62; the result looks random but never collides.
+    """
+    x = np.asarray(values, dtype=np.uint64) & KEY_MASK
+    x ^= x >> np.uint64(31)
+    x = (x * np.uint64(0x7FB5D329728EA185)) & KEY_MASK
+    x ^= x >> np.uint64(27)
+    x = (x * np.uint64(0x81DADEF4BC2DD44D)) & KEY_MASK
+    x ^= x >> np.uint64(33)
+    return x
+
+class RngStreams:
+    """Class to derive independent, reproducible random streams from one root seed
+
+    A stream is addressed by a key such as ``("vehicles", "history")`` and
+    derived with NumPy's ``SeedSequence`` spawning scheme, so every
+    generator, table and worker process gets the same stream whatever asks
+    for it, in whatever order. Historical rows are drawn in blocks of
+    ``block`` candidates, one stream per block: a shard generating rows
+    ``[k, k + n)`` jumps straight to the block holding row k, and the rows
+    come out identical however the range is split across chunks or workers.
+    """
+
+    def __init__(self, seed: int = RANDOM_SEED, key: Tuple[int, ...] = (), block: int = RNG_BLOCK_ROWS):
+        self.seed = seed
+        self.key = key
+        self.block = block
+
+    def child(self, *key: Any) -> "RngStreams":
+        """Streams under ``key``, e.g. one set per generator or per table"""
+        return RngStreams(self.seed, self.key + stream_key(*key), self.block)
+
+    def sequence(self, *key: Any) -> np.random.SeedSequence:
+        return np.random.SeedSequence(self.seed, spawn_key=self.key + stream_key(*key))
+
+    def generator(self, *key: Any) -> np.random.Generator:
+        return np.random.Generator(np.random.PCG64(self.sequence(*key)))
+
+    def seed_int(self, *key: Any) -> int:
+        """A 63-bit integer seed, for code that takes a plain seed"""
+        return int(self.sequence(*key).generate_state(1, np.uint64)[0] >> np.uint64(1))
+
+    def python(self, *key: Any) -> random.Random:
+        """A ``random.Random`` stream, for code written against the ``random`` module API"""
+        return random.Random(self.seed_int(*key))
+
+    def row_keys(self, rows: np.ndarray, *key: Any) -> np.ndarray:
+        """Unique 62-bit keys for row indices under ``key``
+
+        A bijection of the row index salted by the stream, so rows never
+        share a key however they are sharded, while keys of other streams
+        (and seeds) only collide by 62-bit chance.
+        """
+        salt = self.sequence(*key).generate_state(1, np.uint64)[0] & KEY_MASK
+        return mix_keys(np.asarray(rows, dtype=np.uint64) ^ salt)
+
+    def row_uuids(self, rows: np.ndarray, *key: Any) -> List[str]:
+        """UUID strings for row indices under ``key``, unique per row (see ``row_keys``)
+
+        The high half identifies the stream and the low half is the row key,
+        marked as version 8 (custom) UUIDs.
+        """
+        rows = np.asarray(rows, dtype=np.uint64)
+        high = self.sequence("uuid", *key).generate_state(1, np.uint64)[0]
+        high = (high & ~np.uint64(0xF000)) | np.uint64(0x8000)  # Version 8
+        low = self.row_keys(rows, *key) | np.uint64(1 << 63)  # RFC 4122 variant
+        raw = np.empty((len(rows), 2), dtype=">u8")
+        raw[:, 0] = high
+        raw[:, 1] = low
+        h = raw.tobytes().hex()
+        return [
+            f"{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}"
+            for i in range(0, 32 * len(rows), 32)
+        ]
+
+    def draw_rows(self, start: int, stop: int, draw: BlockDrawer, *key: Any) -> Dict[str, np.ndarray]:
+        """Columns for candidate rows ``[start, stop)``, drawn block by block
+
+        ``draw`` produces one whole block from the block's own stream; rows
+        of partial blocks outside the range are dropped, and the "row"
+        column comes back as absolute candidate indices.
+        """
+        parts = []
+        for first in range(start - start % self.block, stop, self.block):
+            count = self.block
+            columns = draw(self.generator(*key, first // self.block), first, count)
+            row = np.asarray(columns["row"]) + first
+            inside = (row >= start) & (row < stop)
+            columns = {name: np.asarray(values)[inside] for name, values in columns.items()}
+            columns["row"] = row[inside]
+            parts.append(columns)
+        if not parts:
+            return {}
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def python_rows(self, start: int, stop: int, *key: Any) -> Iterator[Tuple[int, random.Random]]:
+        """Yield ``(row, rng)`` for rows ``[start, stop)``, each row with its own ``random.Random``
+
+        For per-row loops: seeding a ``Random`` per row is cheap next to the
+        row itself, and lets any row be generated without the ones before.
+        """
+        base = self.seed_int(*key)
+        for row in range(start, stop):
+            yield row, random.Random(base + row)
+
+_streams: Optional[RngStreams] = None
+
+def get_streams() -> RngStreams:
+    """Root streams seeded from RANDOM_SEED"""
+    global _streams
+    if _streams is None:
+        _streams = RngStreams()
+    return _streams
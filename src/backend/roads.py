@@ -0,0 +1,268 @@
+import heapq
+import logging
+import math
+import xml.etree.ElementTree as ET
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+from .config import (
+    KEY_JUNCTIONS, TRAFFIC_ZONES, ROAD_NETWORK_FILE, ROAD_GRAPH_NEIGHBOURS, ROAD_DETOUR_FACTOR,
+    ROAD_ARTERIAL_KM, ROAD_SPEED_LIMITS
+)
+from .spatial import PointIndex, project
+
+logger = logging.getLogger("traffic_simulator.roads")
+
+def landmarks(junctions: Dict[str, Dict[str, float]] = KEY_JUNCTIONS,
+              zones: Dict[str, Dict[str, float]] = TRAFFIC_ZONES) -> Dict[str, Dict[str, float]]:
+    """Key junctions and zone centres, the places trips start and end at (junctions win on name clashes)"""
+    places = {name: {"lat": zone["lat"], "lng": zone["lng"]} for name, zone in zones.items()}
+    places.update(junctions)
+    return places
+
+class RoadGraph:
+    """Class to hold a directed road graph and route vehicles across it
+
+    Edges are stored as arrays (source, target, length in km, speed limit in
+    km/h) with a CSR index of each node's outgoing edges. Trips run between
+    a fixed set of hub nodes; for each hub a shortest-time tree is computed
+    once, on first use, and cached as one column of ``toward`` (the edge to
+    take from every node). Routing a whole fleet is then one gather.
+    """
+
+    def __init__(self, names: Sequence[str], lat: Sequence[float], lng: Sequence[float],
+                 source: Sequence[int], target: Sequence[int], length_km: Sequence[float],
+                 speed_kmh: Sequence[float], hubs: Optional[Sequence[int]] = None):
+        self.names = np.array(list(names), dtype=object)
+        self.lat = np.asarray(lat, dtype=float)
+        self.lng = np.asarray(lng, dtype=float)
+        self.source = np.asarray(source, dtype=np.int64)
+        self.target = np.asarray(target, dtype=np.int64)
+        self.length = np.asarray(length_km, dtype=float)
+        self.speed = np.asarray(speed_kmh, dtype=float)
+        self.travel_time = self.length / np.maximum(self.speed, 1.0) * 3600  # seconds
+        nodes = len(self.lat)
+
+        # Compass bearing of each edge (0 = north, clockwise)
+        x, y = project(self.lat, self.lng)
+        self.bearing = np.degrees(np.arctan2(x[self.target] - x[self.source], y[self.target] - y[self.source])) % 360
+
+        order = np.argsort(self.source, kind="stable")
+        self.out_edges = order
+        self.out_offsets = np.concatenate([[0], np.cumsum(np.bincount(self.source, minlength=nodes))])
+        order = np.argsort(self.target, kind="stable")
+        self.in_edges = order
+        self.in_offsets = np.concatenate([[0], np.cumsum(np.bincount(self.target, minlength=nodes))])
+
+        self.hubs = np.arange(nodes) if hubs is None else np.asarray(hubs, dtype=np.int64)
+        self.toward = np.full((nodes, len(self.hubs)), -1, dtype=np.int64)
+        self.routed = np.zeros(len(self.hubs), dtype=bool)
+        self._nodes: Optional[PointIndex] = None
+        logger.info(f"Road graph with {nodes} nodes, {len(self.source)} edges and {len(self.hubs)} hubs")
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    @classmethod
+    def from_places(cls, places: Optional[Dict[str, Dict[str, float]]] = None,
+                    neighbours: int = ROAD_GRAPH_NEIGHBOURS, detour: float = ROAD_DETOUR_FACTOR) -> "RoadGraph":
+        """Build a two-way graph linking each place to its ``neighbours`` nearest places
+
+        A minimum spanning tree is added so the graph is always connected.
+        Links are ``detour`` times the straight-line distance; long links
+        (ROAD_ARTERIAL_KM and over) are trunk roads, the rest primary.
+        """
+        places = landmarks() if places is None else places
+        names = list(places.keys())
+        lat = np.array([p["lat"] for p in places.values()])
+        lng = np.array([p["lng"] for p in places.values()])
+        x, y = project(lat, lng)
+        distance = np.hypot(x[:, None] - x[None, :], y[:, None] - y[None, :])
+        n = len(names)
+
+        links = set()
+        for i, row in enumerate(distance):
+            for j in np.argsort(row)[1:neighbours + 1].tolist():
+                links.add((min(i, j), max(i, j)))
+        # Prim's algorithm over the complete graph
+        connected = np.zeros(n, dtype=bool)
+        connected[0] = True
+        best = distance[0].copy()
+        parent = np.zeros(n, dtype=np.int64)
+        for _ in range(n - 1):
+            j = int(np.argmin(np.where(connected, np.inf, best)))
+            links.add((min(j, int(parent[j])), max(j, int(parent[j]))))
+            connected[j] = True
+            closer = distance[j] < best
+            best = np.where(closer, distance[j], best)
+            parent = np.where(closer, j, parent)
+
+        pairs = np.array(sorted(links), dtype=np.int64).reshape(-1, 2)
+        source = np.concatenate([pairs[:, 0], pairs[:, 1]])
+        target = np.concatenate([pairs[:, 1], pairs[:, 0]])
+        length = distance[source, target] * detour
+        speed = np.where(length >= ROAD_ARTERIAL_KM, ROAD_SPEED_LIMITS["trunk"], ROAD_SPEED_LIMITS["primary"])
+        return cls(names, lat, lng, source, target, length, speed)
+
+    @classmethod
+    def from_osm(cls, path: str, places: Optional[Dict[str, Dict[str, float]]] = None) -> "RoadGraph":
+        """Load the drivable roads of an OSM XML extract
+
+        Ways tagged with a highway class in ROAD_SPEED_LIMITS (or its
+        ``_link``) are kept, honouring ``oneway`` and numeric ``maxspeed``.
+        Nodes are collapsed to way ends and intersections. Hubs are the
+        nodes nearest to each of ``places``, and the graph is cut down to
+        the part the first hub can both reach and be reached from, so no
+        vehicle can get stuck.
+        """
+        coordinates: Dict[str, tuple] = {}
+        ways = []
+        for _, element in ET.iterparse(path, events=("end",)):
+            if element.tag == "node":
+                coordinates[element.get("id")] = (float(element.get("lat")), float(element.get("lon")))
+            elif element.tag == "way":
+                tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+                highway = (tags.get("highway") or "").replace("_link", "")
+                if highway in ROAD_SPEED_LIMITS:
+                    refs = [nd.get("ref") for nd in element.iter("nd")]
+                    maxspeed = tags.get("maxspeed", "")
+                    try:
+                        speed = float(maxspeed.split()[0]) * (1.609 if "mph" in maxspeed else 1.0)
+                    except (ValueError, IndexError):
+                        speed = ROAD_SPEED_LIMITS[highway]
+                    oneway = tags.get("oneway")
+                    if oneway == "-1":
+                        refs.reverse()
+                    ways.append((refs, speed, oneway in ("yes", "true", "1", "-1")))
+            if element.tag in ("node", "way", "relation"):
+                element.clear()
+
+        # Graph nodes are way ends and nodes shared by several ways
+        uses: Dict[str, int] = {}
+        for refs, _, _ in ways:
+            for ref in refs:
+                uses[ref] = uses.get(ref, 0) + 1
+        index: Dict[str, int] = {}
+        source, target, length, speed = [], [], [], []
+        for refs, limit, oneway in ways:
+            refs = [ref for ref in refs if ref in coordinates]
+            if len(refs) < 2:
+                continue
+            x, y = project([coordinates[r][0] for r in refs], [coordinates[r][1] for r in refs])
+            walked = np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))])
+            start = 0
+            for i in range(1, len(refs)):
+                if i == len(refs) - 1 or uses[refs[i]] > 1:
+                    a = index.setdefault(refs[start], len(index))
+                    b = index.setdefault(refs[i], len(index))
+                    if a != b:
+                        source.append(a)
+                        target.append(b)
+                        length.append(walked[i] - walked[start])
+                        speed.append(limit)
+                        if not oneway:
+                            source.append(b)
+                            target.append(a)
+                            length.append(walked[i] - walked[start])
+                            speed.append(limit)
+                    start = i
+        if not index:
+            raise ValueError(f"no drivable roads in {path}")
+
+        ids = list(index.keys())
+        lat = np.array([coordinates[i][0] for i in ids])
+        lng = np.array([coordinates[i][1] for i in ids])
+        source = np.array(source, dtype=np.int64)
+        target = np.array(target, dtype=np.int64)
+
+        # Snap the places to their nearest nodes and keep what the first one can reach and return from
+        places = landmarks() if places is None else places
+        hubs = PointIndex(*project(lat, lng)).nearest(*project(
+            [p["lat"] for p in places.values()], [p["lng"] for p in places.values()]
+        ))
+        keep = _reachable(hubs[0], source, target, len(ids)) & _reachable(hubs[0], target, source, len(ids))
+        renumber = np.cumsum(keep) - 1
+        kept_edges = keep[source] & keep[target]
+        hubs = np.unique(renumber[hubs[keep[hubs]]])
+        names = [f"OSM node {i}" for i in np.array(ids, dtype=object)[keep].tolist()]
+        logger.info(f"Loaded {int(keep.sum())} of {len(ids)} road nodes from {path}")
+        return cls(names, lat[keep], lng[keep], renumber[source[kept_edges]], renumber[target[kept_edges]],
+                   np.array(length)[kept_edges], np.array(speed)[kept_edges], hubs=hubs)
+
+    def nearest_node(self, lat: Any, lng: Any) -> np.ndarray:
+        """Graph node nearest to each position"""
+        if self._nodes is None:
+            self._nodes = PointIndex(*project(self.lat, self.lng))
+        return self._nodes.nearest(*project(lat, lng))
+
+    def _route_to(self, hub: int):
+        """Fill the ``toward`` column of hub number ``hub``: Dijkstra over incoming edges"""
+        destination = int(self.hubs[hub])
+        time = [math.inf] * len(self)
+        time[destination] = 0.0
+        column = [-1] * len(self)
+        heap = [(0.0, destination)]
+        in_edges, in_offsets = self.in_edges.tolist(), self.in_offsets.tolist()
+        source, travel_time = self.source.tolist(), self.travel_time.tolist()
+        while heap:
+            t, node = heapq.heappop(heap)
+            if t > time[node]:
+                continue
+            for edge in in_edges[in_offsets[node]:in_offsets[node + 1]]:
+                before = source[edge]
+                arrival = t + travel_time[edge]
+                if arrival < time[before]:
+                    time[before] = arrival
+                    column[before] = edge
+                    heapq.heappush(heap, (arrival, before))
+        self.toward[:, hub] = column
+        self.routed[hub] = True
+
+    def next_edges(self, nodes: np.ndarray, hubs: np.ndarray) -> np.ndarray:
+        """Edge to take from each of ``nodes`` towards hub numbers ``hubs`` (-1 there or if unreachable)"""
+        for hub in np.unique(hubs[~self.routed[hubs]]).tolist():
+            self._route_to(hub)
+        return self.toward[nodes, hubs]
+
+    def any_out_edge(self, nodes: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """A random outgoing edge of each node (-1 for dead ends)"""
+        start = self.out_offsets[nodes]
+        degree = self.out_offsets[nodes + 1] - start
+        pick = start + (rng.random(len(nodes)) * degree).astype(np.int64)
+        return np.where(degree > 0, self.out_edges[np.minimum(pick, len(self.out_edges) - 1)], -1)
+
+    def route(self, origin: int, hub: int) -> List[int]:
+        """Nodes of the shortest-time route from node ``origin`` to hub number ``hub``"""
+        nodes = [origin]
+        destination = int(self.hubs[hub])
+        while nodes[-1] != destination:
+            edge = int(self.next_edges(np.array([nodes[-1]]), np.array([hub]))[0])
+            if edge < 0:
+                return []
+            nodes.append(int(self.target[edge]))
+        return nodes
+
+def _reachable(start: int, source: np.ndarray, target: np.ndarray, count: int) -> np.ndarray:
+    """Nodes reachable from ``start`` along edges ``source -> target`` (a breadth-first sweep)"""
+    order = np.argsort(source, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(source, minlength=count))])
+    targets = target[order]
+    seen = np.zeros(count, dtype=bool)
+    seen[start] = True
+    frontier = np.array([start])
+    while len(frontier):
+        spans = [targets[offsets[n]:offsets[n + 1]] for n in frontier.tolist()]
+        following = np.unique(np.concatenate(spans)) if spans else np.empty(0, dtype=np.int64)
+        frontier = following[~seen[following]]
+        seen[frontier] = True
+    return seen
+
+_graph: Optional[RoadGraph] = None
+
+def get_road_graph() -> RoadGraph:
+    """Shared road graph, built on first use from ROAD_NETWORK_FILE or the configured places"""
+    global _graph
+    if _graph is None:
+        _graph = RoadGraph.from_osm(ROAD_NETWORK_FILE) if ROAD_NETWORK_FILE else RoadGraph.from_places()
+    return _graph
@@ -0,0 +1,151 @@
+from typing import List, Dict, Any, Tuple, Optional
+
+# Columns written by the generators for each table, mirroring
+# initialize_tables.sql. Types use a small neutral vocabulary that each
+# sink maps onto its own format: text, int, float, timestamp, uuid.
+TABLE_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "vehicles": [
+        ("vehicle_id", "text"),
+        ("owner_name", "text"),
+        ("vehicle_type", "text"),
+        ("trust_score", "int"),
+        ("lat", "float"),
+        ("lng", "float"),
+        ("speed", "float"),
+        ("heading", "int"),
+        ("location", "text"),
+        ("timestamp", "timestamp"),
+        ("status", "text"),
+    ],
+    "rsus": [
+        ("rsu_id", "text"),
+        ("location", "text"),
+        ("status", "text"),
+        ("coverage_radius", "int"),
+        ("lat", "float"),
+        ("lng", "float"),
+        ("last_seen", "timestamp"),
+    ],
+    "anomalies": [
+        ("id", "uuid"),
+        ("timestamp", "timestamp"),
+        ("vehicle_id", "text"),
+        ("type", "text"),
+        ("severity", "text"),
+        ("message", "text"),
+        ("status", "text"),
+    ],
+    "trust_ledger": [
+        ("tx_id", "text"),
+        ("timestamp", "timestamp"),
+        ("vehicle_id", "text"),
+        ("action", "text"),
+        ("old_value", "int"),
+        ("new_value", "int"),
+        ("details", "text"),
+        ("block_height", "int"),
+        ("block_position", "int"),
+    ],
+    "trust_blocks": [
+        ("height", "int"),
+        ("prev_hash", "text"),
+        ("merkle_root", "text"),
+        ("entry_count", "int"),
+        ("timestamp", "timestamp"),
+        ("block_hash", "text"),
+    ],
+    "zones_congestion": [
+        ("zone_name", "text"),
+        ("lat", "float"),
+        ("lng", "float"),
+        ("congestion_level", "int"),
+        ("updated_at", "timestamp"),
+    ],
+}
+
+# Natural keys that uploads are merged on (PostgREST "resolution=merge-duplicates")
+CONFLICT_KEYS: Dict[str, str] = {
+    "vehicles": "vehicle_id",
+    "rsus": "rsu_id",
+    "trust_ledger": "tx_id",
+    "trust_blocks": "height",
+    "anomalies": "id",
+}
+
+# Column used to keep the newest row when a batch repeats a key
+RECENCY_COLUMNS: Dict[str, str] = {
+    "vehicles": "timestamp",
+    "rsus": "last_seen",
+    "trust_ledger": "timestamp",
+    "trust_blocks": "timestamp",
+    "anomalies": "timestamp",
+}
+
+# NOT NULL columns without a default: an INSERT must supply them, even one
+# that ends up as an ON CONFLICT update
+REQUIRED_COLUMNS: Dict[str, List[str]] = {
+    "vehicles": ["vehicle_id", "owner_name", "vehicle_type", "trust_score", "lat", "lng"],
+    "rsus": ["rsu_id", "location", "status", "coverage_radius", "lat", "lng"],
+    "anomalies": ["vehicle_id", "type", "severity"],
+    "trust_ledger": ["tx_id", "vehicle_id", "action", "old_value", "new_value"],
+    "trust_blocks": ["height", "prev_hash", "merkle_root", "entry_count", "block_hash"],
+    "zones_congestion": ["zone_name", "lat", "lng", "congestion_level"],
+}
+
+def column_names(table_name: str) -> List[str]:
+    """Return the generator-written column names for a table"""
+    return [name for name, _ in TABLE_COLUMNS[table_name]]
+
+def latest_per_key(table_name: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Collapse rows that repeat the table's natural key, keeping the newest
+
+    The in-memory counterpart of the DISTINCT ON in ``merge_sql``, for
+    destinations that upsert a whole batch in one statement.
+    """
+    key = CONFLICT_KEYS.get(table_name)
+    if key is None or not rows or key not in rows[0]:
+        return rows
+    recency = RECENCY_COLUMNS.get(table_name)
+    latest: Dict[Any, Dict[str, Any]] = {}
+    for row in rows:
+        current = latest.get(row[key])
+        # ISO-8601 strings of the same format compare chronologically
+        if current is None or recency not in row or str(row[recency]) >= str(current.get(recency, "")):
+            latest[row[key]] = row
+    return list(latest.values()) if len(latest) < len(rows) else rows
+
+def merge_sql(table_name: str, staging_table: str, columns: Optional[List[str]] = None) -> str:
+    """Build a set-based merge from a staging table into ``public.<table_name>``
+
+    Tables with a natural key are upserted (newest row per key wins, since
+    one INSERT ... ON CONFLICT cannot touch the same row twice); the others
+    are appended. Partial rows that lack a required column (change-only
+    updates) can only refer to existing rows, so they become an UPDATE.
+    """
+    columns = columns or column_names(table_name)
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    key = CONFLICT_KEYS.get(table_name)
+
+    if key is None or key not in columns:
+        return f"INSERT INTO public.{table_name} ({column_list}) SELECT {column_list} FROM {staging_table};"
+
+    recency = RECENCY_COLUMNS.get(table_name)
+    order = f'"{key}"' + (f', "{recency}" DESC' if recency in columns else "")
+    latest = f'SELECT DISTINCT ON ("{key}") {column_list} FROM {staging_table} ORDER BY {order}'
+
+    if not set(REQUIRED_COLUMNS.get(table_name, [])) <= set(columns):
+        assignments = ", ".join(f'"{c}" = s."{c}"' for c in columns if c != key)
+        if not assignments:
+            return "SELECT 1;"
+        return (
+            f"UPDATE public.{table_name} AS t SET {assignments} "
+            f'FROM ({latest}) AS s WHERE t."{key}" = s."{key}";'
+        )
+
+    updates = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in columns if c != key)
+    conflict_action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+    return (
+        f"INSERT INTO public.{table_name} ({column_list}) "
+        f"{latest} "
+        f'ON CONFLICT ("{key}") {conflict_action};'
+    )
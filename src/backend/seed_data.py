@@ -1,16 +1,30 @@
 
 import asyncio
 import argparse
+import datetime
 import logging
+import os
 import sys
-from typing import Dict, Any, List
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
 
-from config import logger
-from db import Database
-from generators.vehicle_generator import VehicleGenerator
-from generators.congestion_generator import CongestionGenerator
-from generators.anomaly_generator import AnomalyGenerator
-from generators.trust_generator import TrustGenerator
+from .config import (
+    logger, DB_UPLOAD_CONCURRENCY, HISTORICAL_CHUNK_SIZE, SINK_OUTPUT_DIR, SIMULATION_SPEED,
+    VEHICLE_UPDATE_INTERVAL, CONGESTION_UPDATE_INTERVAL, ANOMALY_UPDATE_INTERVAL, TRUST_UPDATE_INTERVAL,
+    RSU_UPDATE_INTERVAL, RSU_COUNT,
+    CONGESTION_HISTORY_HOURS, CONGESTION_HISTORY_RESOLUTION, CONGESTION_SYNTHETIC_ZONES
+)
+from .sinks import FileSink, create_sink, SINK_NAMES
+from .clock import SimulationClock, SimulationScheduler
+from .registry import VehicleRegistry
+from .ledger import TrustLedger
+from .generators.vehicle_generator import VehicleGenerator
+from .generators.congestion_generator import CongestionGenerator
+from .generators.anomaly_generator import AnomalyGenerator
+from .generators.trust_generator import TrustGenerator
+from .generators.rsu_generator import RsuGenerator
 
 async def create_tables(db):
     """Create necessary tables if they don't exist"""
@@ -18,51 +32,422 @@ async def create_tables(db):
     await db.create_tables()
     logger.info("Database tables verified.")
 
-async def seed_historical_data(db, generators: Dict[str, Any], counts: Dict[str, int]):
-    """Seed historical data for all data types"""
-    logger.info("Seeding historical data...")
+def sink_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """Keyword arguments for the database sinks"""
+    options = {"concurrency": args.concurrency}
+    if args.sink == "supabase" and args.url:
+        options["base_url"] = args.url
+    return options
+
+# Generator classes by stage kind, used to rebuild generators inside worker processes
+GENERATOR_CLASSES = {
+    'vehicle': VehicleGenerator,
+    'congestion': CongestionGenerator,
+    'anomaly': AnomalyGenerator,
+    'trust': TrustGenerator,
+    'rsu': RsuGenerator,
+}
+
+def run_chunk(generator, kind: str, start: int, stop: int, now: datetime.datetime, context: Any,
+              total: int) -> List[Dict[str, Any]]:
+    """Call a generator's synchronous chunk method with the context its stage needs
     
-    # Vehicle data
-    logger.info(f"Seeding {counts['vehicles']} historical vehicle records...")
-    vehicle_data = await generators['vehicle'].generate_historical_data(counts['vehicles'])
-    if vehicle_data:
-        success = await db.insert_data("vehicles", vehicle_data)
-        if success:
-            logger.info(f"✓ Successfully seeded {len(vehicle_data)} vehicle records")
-        else:
-            logger.error("✗ Failed to seed vehicle data")
+    ``total`` is the stage's number of candidate rows (over all shards).
+    """
+    if kind == 'congestion':
+        # Congestion takes the parent's engine, which fixes the zones and the history grid
+        return generator.generate_chunk(start, stop, now, context)
+    if kind == 'trust':
+        # Trust takes the running trust state, and the total to spread candidates over the history
+        return generator.generate_chunk(start, stop, context, now, total)
+    # Vehicles and anomalies take the vehicle-ID list and RSUs the network size
+    # (the layout itself is fixed by the seed)
+    return generator.generate_chunk(start, stop, context, now)
+
+def generate_chunk_in_worker(kind: str, start: int, stop: int, now: datetime.datetime,
+                             context: Any, total: int) -> Tuple[List[Dict[str, Any]], Any, float]:
+    """Generate one chunk of historical rows inside a worker process
     
-    # Congestion data
-    logger.info(f"Seeding {counts['congestion']} historical congestion records...")
-    congestion_data = await generators['congestion'].generate_historical_data(counts['congestion'])
-    if congestion_data:
-        success = await db.insert_data("zones_congestion", congestion_data)
-        if success:
-            logger.info(f"✓ Successfully seeded {len(congestion_data)} congestion records")
-        else:
-            logger.error("✗ Failed to seed congestion data")
+    Returns the rows, the updated trust state (trust stage only) and
+    the seconds spent generating.
+    """
+    # Generators draw chunk rows from streams keyed by the row indices
+    # (see rng.py), so a worker produces exactly what the parent would
+    if kind == 'rsu':
+        generator = RsuGenerator(None, count=context)
+    else:
+        generator = GENERATOR_CLASSES[kind](None)
     
-    # Anomaly data
-    logger.info(f"Seeding {counts['anomalies']} historical anomaly records...")
-    anomaly_data = await generators['anomaly'].generate_historical_data(counts['anomalies'])
-    if anomaly_data:
-        success = await db.insert_data("anomalies", anomaly_data)
-        if success:
-            logger.info(f"✓ Successfully seeded {len(anomaly_data)} anomaly records")
-        else:
-            logger.error("✗ Failed to seed anomaly data")
+    started = time.perf_counter()
+    rows = run_chunk(generator, kind, start, stop, now, context, total)
+    return rows, (context if kind == 'trust' else None), time.perf_counter() - started
+
+class SeedStage:
+    """One table's historical seeding work and its timing breakdown"""
+    
+    def __init__(self, kind: str, label: str, table_name: str, count: int):
+        self.kind = kind
+        self.label = label
+        self.table_name = table_name
+        self.count = count
+        self.rows = 0
+        self.wait = 0.0  # Blocked on dependencies
+        self.generate = 0.0  # Summed chunk generation time
+        self.upload = 0.0  # Wall time of the upload call
+        self.total = 0.0
+
+class SeedScheduler:
+    """Run the seeding stages concurrently, respecting their data dependencies
+    
+    Congestion and RSUs have no dependencies and run alongside vehicles.
+    Anomalies and trust only need the vehicle-ID set, so they start as soon
+    as it has been drawn rather than after every vehicle row is uploaded. With ``jobs > 1``
+    chunk generation runs in a process pool so CPU-bound work does not stall
+    upload I/O on the event loop.
+    
+    ``shard`` (index, count) restricts every stage to that shard's slice
+    of the rows, and the vehicle, anomaly and trust stages to the shard's
+    slice of the vehicle-ID set (see ``seed_sharded``).
+    
+    Trust entries are grouped into ledger blocks as they stream past, and
+    the chained block headers are written once the entries are, unless
+    some entries failed to store (``ledger_complete``). A shard only
+    collects its block roots (``block_roots``), starting at
+    ``ledger_base``; the parent chains them.
+    """
+    
+    def __init__(self, db, generators: Dict[str, Any], counts: Dict[str, int],
+                 jobs: int = 1, stream: bool = False, chunk_size: int = HISTORICAL_CHUNK_SIZE,
+                 now: Optional[datetime.datetime] = None, shard: Tuple[int, int] = (0, 1),
+                 ledger_base: Optional[int] = None):
+        self.db = db
+        self.generators = generators
+        self.now = now  # End of the history (the current time if None)
+        self.shard = shard
+        self.ledger_base = ledger_base  # Height of the first history block (the ledger's next block if None)
+        self.block_roots: List[Tuple[int, str, int]] = []
+        self.ledger_complete = True  # False once any trust entry failed to store
+        self.jobs = max(1, jobs)
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.stages = [
+            SeedStage('vehicle', "vehicle", "vehicles", counts['vehicles']),
+            SeedStage('congestion', "congestion", "zones_congestion", counts['congestion']),
+            SeedStage('anomaly', "anomaly", "anomalies", counts['anomalies']),
+            SeedStage('trust', "trust ledger", "trust_ledger", counts['trust']),
+            SeedStage('rsu', "RSU", "rsus", len(generators['rsu'])),
+        ]
+        self.vehicle_ids: List[str] = []
+        self.vehicle_ids_ready = asyncio.Event()
+        self.executor: Optional[ProcessPoolExecutor] = None
     
-    # Trust ledger data
-    logger.info(f"Seeding {counts['trust']} historical trust ledger records...")
-    trust_data = await generators['trust'].generate_historical_data(counts['trust'])
-    if trust_data:
-        success = await db.insert_data("trust_ledger", trust_data)
+    async def run(self):
+        """Run every stage and log the per-stage timing breakdown"""
+        if self.jobs > 1:
+            self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+        try:
+            await asyncio.gather(*(self.run_stage(stage) for stage in self.stages))
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+        self.log_timings()
+    
+    async def run_stage(self, stage: SeedStage):
+        """Wait for a stage's dependencies, then generate and upload its rows"""
+        started = time.perf_counter()
+        
+        if stage.kind == 'vehicle':
+            # Drawing the ID set is cheap; publish it before generating any rows. Every
+            # shard draws the same set and keeps its own slice, so no two shards share a vehicle
+            vehicle_ids = self.generators['vehicle'].create_vehicle_ids(stage.count)
+            index, shards = self.shard
+            self.vehicle_ids = vehicle_ids[index::shards]
+            if vehicle_ids and not self.vehicle_ids:
+                # Borrowing other shards' vehicles would break the disjoint split
+                raise ValueError(f"Shard {index} of {shards} has no vehicles ({len(vehicle_ids)} vehicle IDs in total)")
+            self.vehicle_ids_ready.set()
+        elif stage.kind in ('anomaly', 'trust'):
+            await self.vehicle_ids_ready.wait()
+        stage.wait = time.perf_counter() - started
+        
+        logger.info(f"Seeding {stage.count} historical {stage.label} records...")
+        chunks = self.produce(stage)
+        if stage.kind == 'trust':
+            chunks = self.link_blocks(chunks)
+        
+        # Count what the sink actually stored, not what was handed to it
+        stored, failed = self.stored_rows(stage.table_name)
+        if self.stream:
+            # Generation and upload overlap, so upload time includes generation
+            upload_started = time.perf_counter()
+            await self.db.insert_stream(stage.table_name, chunks)
+        else:
+            data = []
+            async for chunk in chunks:
+                data.extend(chunk)
+            upload_started = time.perf_counter()
+            if data:
+                await self.db.insert_data(stage.table_name, data)
+        now_stored, now_failed = self.stored_rows(stage.table_name)
+        stage.rows, failed = now_stored - stored, now_failed - failed
+        success = stage.rows > 0
+        
+        if stage.kind == 'trust' and failed:
+            # A header would commit to entries that were never stored
+            logger.error(f"{failed} trust ledger entries were not stored; not chaining their blocks")
+            self.block_roots = []
+            self.ledger_complete = False
+        elif success and stage.kind == 'trust' and self.shard[1] == 1:
+            # Headers go in after the entries they commit to
+            now = (self.now or datetime.datetime.now()).isoformat()
+            headers = self.generators['trust'].ledger.chain(self.block_roots, now)
+            success = await self.db.insert_data("trust_blocks", headers)
+            logger.info(f"Chained {len(headers)} trust ledger blocks")
+        
+        stage.upload = time.perf_counter() - upload_started
+        stage.total = time.perf_counter() - started
+        
         if success:
-            logger.info(f"✓ Successfully seeded {len(trust_data)} trust ledger records")
+            logger.info(f"✓ Successfully seeded {stage.rows} {stage.label} records")
         else:
-            logger.error("✗ Failed to seed trust ledger data")
+            logger.error(f"✗ Failed to seed {stage.label} data")
+    
+    def stage_context(self, stage: SeedStage) -> Any:
+        """Build the per-stage state passed to every chunk"""
+        if stage.kind in ('vehicle', 'anomaly'):
+            return self.vehicle_ids
+        if stage.kind == 'trust':
+            # The live simulation continues from the seeded scores and stakes
+            trust = self.generators['trust']
+            trust.state = trust.initial_state(self.vehicle_ids)
+            return trust.state
+        if stage.kind == 'congestion':
+            return self.generators['congestion'].engine
+        if stage.kind == 'rsu':
+            return len(self.generators['rsu'])
+        return None
+    
+    async def link_blocks(self, chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Pass trust chunks through, placing their blocks after the ledger's tip and collecting block roots"""
+        ledger = self.generators['trust'].ledger
+        base = self.ledger_base
+        if base is None:
+            # Continue an existing chain rather than overwrite its first blocks
+            if ledger.height == 0:
+                await ledger.resume_from(self.db)
+            base = ledger.height
+        
+        async for rows in chunks:
+            if base:
+                for row in rows:
+                    row["block_height"] += base
+            self.block_roots.extend(ledger.summarise(rows))
+            yield rows
+        self.block_roots.extend(ledger.summarise([], final=True))
+    
+    async def produce(self, stage: SeedStage) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield a stage's rows chunk by chunk, generated inline or in the process pool"""
+        generator = self.generators[stage.kind]
+        total = generator.history_size() if stage.kind == 'congestion' else stage.count
+        # Trust shards own whole ledger blocks
+        first, last = self.row_range(total, self.generators['trust'].ledger.block_size if stage.kind == 'trust' else 1)
+        # Cut chunks at multiples of the chunk size, so only a shard's edges split a random block
+        cuts = range(first - first % self.chunk_size + self.chunk_size, last, self.chunk_size)
+        bounds = list(zip([first, *cuts], [*cuts, last])) if first < last else []
+        now = self.now or datetime.datetime.now()
+        context = self.stage_context(stage)
+        
+        if self.executor is None:
+            for start, stop in bounds:
+                chunk_started = time.perf_counter()
+                rows = run_chunk(generator, stage.kind, start, stop, now, context, total)
+                stage.generate += time.perf_counter() - chunk_started
+                if rows:
+                    yield rows
+                # Let the other stages and in-flight uploads run
+                await asyncio.sleep(0)
+            return
+        
+        # Keep up to ``jobs`` chunks in flight; trust chunks carry the running
+        # trust state from one to the next, so they are generated one at a time
+        window = 1 if stage.kind == 'trust' else self.jobs
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        remaining = iter(bounds)
+        
+        def submit_next():
+            bound = next(remaining, None)
+            if bound is not None:
+                pending.append(loop.run_in_executor(
+                    self.executor, generate_chunk_in_worker, stage.kind, bound[0], bound[1], now, context, total
+                ))
+        
+        for _ in range(window):
+            submit_next()
+        
+        while pending:
+            rows, state, seconds = await pending.popleft()
+            if state is not None:
+                context = state
+            stage.generate += seconds
+            submit_next()
+            if rows:
+                yield rows
+        if stage.kind == 'trust':
+            generator.state = context
+    
+    def stored_rows(self, table_name: str) -> Tuple[int, int]:
+        """Rows stored and rows failed so far for ``table_name``, from the sink's throughput stats"""
+        stats = self.db.throughput.get(table_name)
+        return (stats.rows, stats.failed_rows) if stats is not None else (0, 0)
+    
+    def row_range(self, total: int, align: int = 1) -> Tuple[int, int]:
+        """This shard's slice ``[first, last)`` of a stage's ``total`` candidate rows, cut at multiples of ``align``"""
+        index, shards = self.shard
+        cut = lambda k: min(total, total * k // shards // align * align)
+        return cut(index), (cut(index + 1) if index + 1 < shards else total)
+    
+    def log_timings(self):
+        """Log the end-of-run timing breakdown per stage"""
+        logger.info("Seeding stage timings (seconds):")
+        logger.info(f"  {'stage':<18}{'wait':>8}{'generate':>10}{'upload':>9}{'total':>9}{'rows':>11}")
+        for stage in self.stages:
+            logger.info(
+                f"  {stage.table_name:<18}{stage.wait:>8.2f}{stage.generate:>10.2f}"
+                f"{stage.upload:>9.2f}{stage.total:>9.2f}{stage.rows:>11}"
+            )
+
+async def seed_historical_data(db, generators: Dict[str, Any], counts: Dict[str, int],
+                               stream: bool = False, jobs: int = 1, now: Optional[datetime.datetime] = None):
+    """Seed historical data for all data types, ending at ``now`` (default: the current time)
+    
+    With a fixed ``now`` the seeded rows are the same on every run,
+    whatever ``jobs`` and the chunk size.
+    """
+    logger.info("Seeding historical data...")
+    
+    scheduler = SeedScheduler(db, generators, counts, jobs=jobs, stream=stream, now=now)
+    await scheduler.run()
     
     logger.info("Historical data seeding complete")
+    
+    # Per-table upload throughput (rows/s, bytes/s, retries)
+    for stats in getattr(db, "throughput", {}).values():
+        logger.info(f"Upload throughput - {stats.summary()}")
+
+def create_generators(db, args: argparse.Namespace) -> Dict[str, Any]:
+    """Create the data generators for the command line options
+    
+    They share one in-process vehicle registry, the RSUs serve the live
+    vehicle fleet and the anomaly detector watches its telemetry.
+    """
+    registry = VehicleRegistry()
+    vehicle_generator = VehicleGenerator(db, registry=registry)
+    return {
+        'vehicle': vehicle_generator,
+        'congestion': CongestionGenerator(db, hours=args.congestion_hours,
+                                          resolution=args.congestion_resolution,
+                                          synthetic_zones=args.synthetic_zones),
+        'anomaly': AnomalyGenerator(db, registry=registry, fleet=vehicle_generator.fleet),
+        'trust': TrustGenerator(db, registry=registry),
+        'rsu': RsuGenerator(db, count=args.rsus, fleet=vehicle_generator.fleet)
+    }
+
+def seed_shard(shard: int, args: argparse.Namespace, counts: Dict[str, int], now: datetime.datetime,
+               ledger_base: int) -> Tuple[List[Tuple[str, int, float]], Optional[List[Tuple[int, str, int]]]]:
+    """Seed one shard of every table inside a worker process
+    
+    Returns (table, rows written, seconds) per stage and the roots of the
+    shard's trust ledger blocks, or None if some of its entries were not stored.
+    """
+    return asyncio.run(seed_shard_async(shard, args, counts, now, ledger_base))
+
+async def seed_shard_async(shard: int, args: argparse.Namespace, counts: Dict[str, int], now: datetime.datetime,
+                           ledger_base: int) -> Tuple[List[Tuple[str, int, float]], Optional[List[Tuple[int, str, int]]]]:
+    # Each shard writes through its own sink: its own connection pool, or its
+    # own partition directory for the file sinks
+    output_dir = os.path.join(args.output_dir, f"shard-{shard:03d}")
+    async with create_sink(args.sink, output_dir, **sink_options(args)) as db:
+        if args.clear and isinstance(db, FileSink):
+            for table in ["vehicles", "zones_congestion", "anomalies", "trust_ledger", "trust_blocks", "rsus"]:
+                await db.clear_table(table)
+        
+        scheduler = SeedScheduler(db, create_generators(db, args), counts, stream=args.stream,
+                                  now=now, shard=(shard, args.shards), ledger_base=ledger_base)
+        await scheduler.run()
+        roots = scheduler.block_roots if scheduler.ledger_complete else None
+        return [(stage.table_name, stage.rows, stage.total) for stage in scheduler.stages], roots
+
+async def seed_sharded(db, args: argparse.Namespace, counts: Dict[str, int], ledger: TrustLedger):
+    """Seed historical data in ``args.shards`` worker processes, each writing its own output
+    
+    Every shard generates its slice of each table's rows and its slice of
+    the vehicle-ID set, and uploads (or writes ``<output dir>/shard-NNN/``)
+    on its own, so nothing is sent back to this process or merged
+    afterwards. Keys are unique across shards: vehicle IDs are split
+    between them, and anomaly IDs and trust ``tx_id``s are derived from
+    the global row index (see ``RngStreams.row_keys``). Each shard owns
+    whole trust ledger blocks and returns only their Merkle roots, which
+    are chained into ``ledger`` here.
+    """
+    # Every shard needs vehicles of its own, so there are no more shards than vehicle IDs
+    vehicle_count = len(VehicleGenerator(None).create_vehicle_ids(counts['vehicles']))
+    if args.shards > max(1, vehicle_count):
+        logger.warning(f"Only {vehicle_count} vehicle IDs to split; seeding in {max(1, vehicle_count)} shards instead of {args.shards}")
+        args = argparse.Namespace(**{**vars(args), "shards": max(1, vehicle_count)})
+    
+    # All shards must agree on the end of the history, which also keys the row IDs
+    now = args.start or datetime.datetime.now()
+    if ledger.height == 0:
+        await ledger.resume_from(db)
+    logger.info(f"Seeding historical data in {args.shards} shards...")
+    started = time.perf_counter()
+    
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=args.shards) as executor:
+        results = await asyncio.gather(*(
+            loop.run_in_executor(executor, seed_shard, shard, args, counts, now, ledger.height)
+            for shard in range(args.shards)
+        ))
+    
+    # Shard roots come in height order, since shards own consecutive block ranges
+    headers = []
+    if any(roots is None for _, roots in results):
+        logger.error("Some trust ledger entries were not stored; not chaining the seeded blocks")
+    else:
+        headers = ledger.chain([root for _, roots in results for root in roots], now.isoformat())
+    if headers:
+        await db.insert_data("trust_blocks", headers)
+    elapsed = time.perf_counter() - started
+    
+    totals: Dict[str, int] = {}
+    logger.info("Shard timings (seconds):")
+    for shard, (stages, _) in enumerate(results):
+        logger.info(f"  shard {shard:03d}: " + ", ".join(
+            f"{table} {rows} rows in {seconds:.2f}" for table, rows, seconds in stages
+        ))
+        for table, rows, _ in stages:
+            totals[table] = totals.get(table, 0) + rows
+    
+    for table, rows in totals.items():
+        logger.info(f"✓ Seeded {rows} {table} records ({rows / elapsed:,.0f} rows/s)")
+        if isinstance(db, FileSink):
+            # The partitions were written by the workers; count them towards this run
+            db.counts[table] = db.counts.get(table, 0) + rows
+    logger.info(f"Chained {len(headers)} trust ledger blocks")
+    logger.info(f"Historical data seeding complete in {elapsed:.2f}s")
+
+async def seed_from_args(db, generators: Dict[str, Any], counts: Dict[str, int], args: argparse.Namespace):
+    """Seed historical data as the command line asks: sharded across processes or from this one"""
+    # Pin the end of the history, so live congestion can continue from its last sample
+    now = args.start or datetime.datetime.now()
+    if args.shards > 1:
+        await seed_sharded(db, argparse.Namespace(**{**vars(args), "start": now}), counts, generators['trust'].ledger)
+    else:
+        await seed_historical_data(db, generators, counts, stream=args.stream, jobs=args.jobs, now=now)
+    if args.simulate:
+        generators['congestion'].resume_history(now)
 
 async def verify_data_counts(db):
     """Verify that sufficient data has been loaded for each table"""
@@ -88,72 +473,78 @@ async def verify_data_counts(db):
     
     return all_good
 
-async def run_simulations(generators: Dict[str, Any]):
-    """Run all simulation generators concurrently"""
+async def run_simulations(generators: Dict[str, Any], clock: Optional[SimulationClock] = None,
+                          until: Optional[datetime.datetime] = None):
+    """Run all simulation generators off one shared clock
+    
+    ``clock`` sets the pace (real time by default) and ``until`` the
+    virtual time to stop at (never, if None).
+    """
     logger.info("Starting continuous data simulation...")
     
-    # Create tasks for all generators
-    tasks = [
-        generators['vehicle'].simulate(),
-        generators['congestion'].simulate(),
-        generators['anomaly'].simulate(),
-        generators['trust'].simulate()
-    ]
+    scheduler = SimulationScheduler(clock or SimulationClock())
+    scheduler.every(VEHICLE_UPDATE_INTERVAL, generators['vehicle'].tick, name="vehicles")
+    # Registered after the vehicles, so each tick checks the fleet they just moved
+    scheduler.every(VEHICLE_UPDATE_INTERVAL, generators['anomaly'].detect, name="detector")
+    scheduler.every(CONGESTION_UPDATE_INTERVAL, generators['congestion'].tick, name="congestion")
+    scheduler.every(ANOMALY_UPDATE_INTERVAL, generators['anomaly'].tick, name="anomalies")
+    scheduler.every(TRUST_UPDATE_INTERVAL, generators['trust'].tick, name="trust")
+    scheduler.every(RSU_UPDATE_INTERVAL, generators['rsu'].tick, name="rsus")
     
-    # Run all simulations concurrently
-    await asyncio.gather(*tasks)
+    try:
+        await scheduler.run(until)
+    finally:
+        await generators['vehicle'].flush()
 
 async def main(args):
     """Main function to set up database, seed data, and run simulations"""
     try:
         logger.info("Initializing Smart Traffic Management System data simulation")
         
-        # Initialize database connection
-        db = Database()
-        
-        # Initialize data generators
-        generators = {
-            'vehicle': VehicleGenerator(db),
-            'congestion': CongestionGenerator(db),
-            'anomaly': AnomalyGenerator(db),
-            'trust': TrustGenerator(db)
-        }
-        
-        # Create tables if needed
-        await create_tables(db)
-        
-        # Define data counts for historical seeding
-        counts = {
-            'vehicles': args.vehicles,
-            'congestion': args.congestion,
-            'anomalies': args.anomalies,
-            'trust': args.trust
-        }
-        
-        # Clear existing data if requested
-        if args.clear:
-            logger.warning("Clearing existing data as requested...")
-            for table in ["vehicles", "zones_congestion", "anomalies", "trust_ledger"]:
-                await db.clear_table(table)
+        # Initialize the output sink (Supabase or a local file format); it is closed on exit
+        async with create_sink(args.sink, args.output_dir, **sink_options(args)) as db:
+            
+            # Initialize data generators
+            generators = create_generators(db, args)
         
-        # Seed historical data
-        if args.seed:
-            await seed_historical_data(db, generators, counts)
+            # Create tables if needed
+            await create_tables(db)
         
-        # Verify data counts
-        sufficient_data = await verify_data_counts(db)
+            # Define data counts for historical seeding
+            counts = {
+                'vehicles': args.vehicles,
+                'congestion': args.congestion,
+                'anomalies': args.anomalies,
+                'trust': args.trust
+            }
         
-        if not sufficient_data and not args.seed:
-            logger.warning("Insufficient data found and seeding was not enabled")
-            if input("Would you like to seed historical data now? (y/n): ").lower() == 'y':
-                await seed_historical_data(db, generators, counts)
+            # Clear existing data if requested
+            if args.clear:
+                logger.warning("Clearing existing data as requested...")
+                for table in ["vehicles", "zones_congestion", "anomalies", "trust_ledger", "trust_blocks", "rsus"]:
+                    await db.clear_table(table)
         
-        # Run continuous simulations if requested
-        if args.simulate:
-            logger.info("Starting continuous data simulation...")
-            await run_simulations(generators)
-        else:
-            logger.info("Simulation not requested. Exiting.")
+            # Seed historical data
+            if args.seed:
+                await seed_from_args(db, generators, counts, args)
+        
+            # Verify data counts
+            sufficient_data = await verify_data_counts(db)
+        
+            if not sufficient_data and not args.seed:
+                logger.warning("Insufficient data found and seeding was not enabled")
+                if input("Would you like to seed historical data now? (y/n): ").lower() == 'y':
+                    await seed_from_args(db, generators, counts, args)
+        
+            # Run continuous simulations if requested
+            if args.simulate:
+                clock = SimulationClock(speed=args.speed, start=args.start)
+                until = None
+                if args.duration is not None:
+                    until = clock.start + datetime.timedelta(hours=args.duration)
+                await run_simulations(generators, clock, until)
+            else:
+                logger.info("Simulation not requested. Exiting.")
         
     except Exception as e:
         logger.exception(f"Error in main: {str(e)}")
@@ -169,9 +560,25 @@ if __name__ == "__main__":
     
     parser.add_argument("--vehicles", type=int, default=10000, help="Number of historical vehicle records to generate")
     parser.add_argument("--congestion", type=int, default=10000, help="Number of historical congestion records to generate")
+    parser.add_argument("--congestion-hours", type=float, default=CONGESTION_HISTORY_HOURS, help="Hours of congestion history to generate")
+    parser.add_argument("--congestion-resolution", type=float, default=CONGESTION_HISTORY_RESOLUTION, help="Seconds between historical congestion samples")
+    parser.add_argument("--synthetic-zones", type=int, default=CONGESTION_SYNTHETIC_ZONES, help="Extra synthetic grid zones for congestion data")
     parser.add_argument("--anomalies", type=int, default=10000, help="Number of historical anomaly records to generate")
+    parser.add_argument("--rsus", type=int, default=RSU_COUNT, help="Number of roadside units to simulate")
     parser.add_argument("--trust", type=int, default=1000, help="Number of historical trust ledger records to generate")
     
+    parser.add_argument("--stream", action="store_true", help="Stream generated records straight into the uploader instead of materialising each table")
+    parser.add_argument("--sink", choices=SINK_NAMES, default="supabase", help="Where generated records are written")
+    parser.add_argument("--url", default=None, help="PostgREST base URL for the supabase sink, e.g. a local rest_server.py (default: SUPABASE_URL)")
+    parser.add_argument("--output-dir", default=SINK_OUTPUT_DIR, help="Output directory for the ndjson, parquet and csv sinks")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes for generating historical data (1 generates on the event loop)")
+    parser.add_argument("--shards", type=int, default=1, help="Seed in this many worker processes that each generate and upload (or write a shard-NNN output directory) on their own")
+    parser.add_argument("--concurrency", type=int, default=DB_UPLOAD_CONCURRENCY, help="Number of upload batches kept in flight per table")
+    
+    parser.add_argument("--speed", type=float, default=SIMULATION_SPEED, help="Simulation speed: 1 is real time, N is N times faster, 0 is as fast as possible")
+    parser.add_argument("--start", type=datetime.datetime.fromisoformat, default=None, help="Simulated start time, and the end of the seeded history (ISO format, default now)")
+    parser.add_argument("--duration", type=float, default=None, help="Simulated hours to run before stopping (default: run forever)")
+    
     args = parser.parse_args()
     
     # If no actions are specified, enable all
@@ -0,0 +1,330 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import time
+from typing import List, Dict, Any, Optional, AsyncIterable
+
+from .config import SINK_OUTPUT_DIR, NDJSON_COMPRESSLEVEL, PARQUET_ROW_GROUP_SIZE
+from .batching import TableThroughput
+from .schema import TABLE_COLUMNS, column_names, merge_sql
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional dependency, only needed for the Parquet sink
+    pa = None
+    pq = None
+
+logger = logging.getLogger("traffic_simulator.sinks")
+
+class Sink:
+    """Base class for destinations that generated records are written to
+
+    ``Database`` (Supabase REST), ``PostgresDatabase`` (direct COPY) and the
+    local file sinks below share this
+    interface, so generators only ever call ``insert_data`` and the seeding
+    pipeline can switch destinations without code changes.
+    """
+
+    name = "sink"
+    # Whether rows may carry only some columns (change-only updates of
+    # existing keys); sinks without it are always sent complete rows
+    supports_partial_rows = False
+
+    def __init__(self):
+        self.throughput: Dict[str, TableThroughput] = {}
+
+    async def __aenter__(self) -> "Sink":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Release any resources held by the sink"""
+
+    async def create_tables(self) -> bool:
+        """Make sure the destination tables exist"""
+        return True
+
+    async def insert_data(self, table_name: str, data: List[Dict[str, Any]]) -> bool:
+        """Write records to a table; return True if any were written"""
+        raise NotImplementedError
+
+    async def insert_stream(self, table_name: str, chunks: AsyncIterable[List[Dict[str, Any]]]) -> int:
+        """Write chunks from an async iterator as they arrive; return rows written"""
+        inserted = 0
+        async for chunk in chunks:
+            if await self.insert_data(table_name, chunk):
+                inserted += len(chunk)
+        logger.info(f"Wrote {inserted} streamed records to {table_name} ({self.name})")
+        return inserted
+
+    async def fetch_rows(self, table_name: str, columns: List[str], since: Optional[str] = None,
+                         since_column: str = "timestamp", limit: int = 1000,
+                         newest_first: bool = False) -> List[Dict[str, Any]]:
+        """Read back up to ``limit`` rows with ``since_column`` after ``since``
+
+        Rows come oldest first, or newest first with ``newest_first``.
+        Write-only sinks return no rows; a failed read raises rather than
+        returning an empty list, which would read as "no rows".
+        """
+        return []
+
+    async def get_count(self, table_name: str) -> int:
+        """Get count of records in a table"""
+        raise NotImplementedError
+
+    async def clear_table(self, table_name: str) -> bool:
+        """Clear all data from a table"""
+        raise NotImplementedError
+
+    def _get_throughput(self, table_name: str) -> TableThroughput:
+        if table_name not in self.throughput:
+            self.throughput[table_name] = TableThroughput(table_name)
+        return self.throughput[table_name]
+
+class FileSink(Sink):
+    """Base class for sinks that write one local file per table
+
+    Writes run in a worker thread so encoding and compression do not block
+    the event loop; a per-table lock keeps concurrent writers in order.
+    """
+
+    extension = ""
+
+    def __init__(self, output_dir: str = SINK_OUTPUT_DIR):
+        super().__init__()
+        self.output_dir = output_dir
+        self.counts: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def path_for(self, table_name: str) -> str:
+        return os.path.join(self.output_dir, f"{table_name}{self.extension}")
+
+    async def insert_data(self, table_name: str, data: List[Dict[str, Any]]) -> bool:
+        if not data:
+            logger.warning(f"No data to insert into {table_name}")
+            return False
+
+        if table_name not in self._locks:
+            self._locks[table_name] = asyncio.Lock()
+
+        stats = self._get_throughput(table_name)
+        started = time.perf_counter()
+        try:
+            async with self._locks[table_name]:
+                nbytes = await asyncio.to_thread(self._write, table_name, data)
+        except Exception as e:
+            logger.error(f"Error writing {len(data)} records to {self.path_for(table_name)}: {str(e)}")
+            stats.failed_rows += len(data)
+            return False
+
+        stats.elapsed += time.perf_counter() - started
+        stats.rows += len(data)
+        stats.bytes += nbytes
+        stats.batches += 1
+        self.counts[table_name] = self.counts.get(table_name, 0) + len(data)
+        logger.debug(f"Wrote {len(data)} records to {self.path_for(table_name)}")
+        return True
+
+    def _write(self, table_name: str, data: List[Dict[str, Any]]) -> int:
+        """Append records to the table's file; return bytes written (uncompressed)"""
+        raise NotImplementedError
+
+    async def get_count(self, table_name: str) -> int:
+        count = self.counts.get(table_name, 0)
+        logger.info(f"Table {table_name} has {count} records written this run ({self.path_for(table_name)})")
+        return count
+
+    async def clear_table(self, table_name: str) -> bool:
+        logger.warning(f"Removing output for {table_name}")
+        path = self.path_for(table_name)
+        if os.path.exists(path):
+            os.remove(path)
+        self.counts[table_name] = 0
+        return True
+
+class NdjsonSink(FileSink):
+    """Write records as gzip-compressed newline-delimited JSON (``<table>.ndjson.gz``)"""
+
+    name = "ndjson"
+    extension = ".ndjson.gz"
+    supports_partial_rows = True
+
+    def __init__(self, output_dir: str = SINK_OUTPUT_DIR, compresslevel: int = NDJSON_COMPRESSLEVEL):
+        super().__init__(output_dir)
+        self.compresslevel = compresslevel
+
+    def _write(self, table_name: str, data: List[Dict[str, Any]]) -> int:
+        payload = "".join(json.dumps(row, separators=(",", ":"), default=str) + "\n" for row in data).encode("utf-8")
+        # Each call appends a gzip member; concatenated members are still one valid gzip file
+        with gzip.open(self.path_for(table_name), "ab", compresslevel=self.compresslevel) as f:
+            f.write(payload)
+        return len(payload)
+
+class CopyCsvSink(FileSink):
+    """Write records as CSV files ready for PostgreSQL ``COPY ... FROM``
+
+    Alongside ``<table>.csv`` a ``load.sql`` script is kept up to date. Run
+    it with ``psql -f load.sql`` from the output directory: it copies each
+    file into a temporary staging table and merges it into the real table in
+    one set-based statement, so repeated natural keys are upserted.
+    """
+
+    name = "csv"
+    extension = ".csv"
+
+    def _write(self, table_name: str, data: List[Dict[str, Any]]) -> int:
+        path = self.path_for(table_name)
+        columns = column_names(table_name) if table_name in TABLE_COLUMNS else list(data[0].keys())
+        write_header = not os.path.exists(path)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        if write_header:
+            writer.writerow(columns)
+        for row in data:
+            # COPY's CSV format reads an unquoted empty field as NULL
+            writer.writerow(["" if row.get(c) is None else row.get(c) for c in columns])
+
+        text = buffer.getvalue()
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            f.write(text)
+
+        if write_header:
+            self._write_load_script()
+        return len(text.encode("utf-8"))
+
+    def _write_load_script(self):
+        """Regenerate load.sql for every CSV file present in the output directory"""
+        statements = ["\\set ON_ERROR_STOP on", "BEGIN;"]
+        for table_name in TABLE_COLUMNS:
+            if not os.path.exists(self.path_for(table_name)):
+                continue
+            columns = ", ".join(f'"{c}"' for c in column_names(table_name))
+            staging = f"staging_{table_name}"
+            statements += [
+                f"CREATE TEMP TABLE {staging} (LIKE public.{table_name} INCLUDING DEFAULTS) ON COMMIT DROP;",
+                f"\\copy {staging} ({columns}) FROM '{table_name}{self.extension}' WITH (FORMAT csv, HEADER true)",
+                merge_sql(table_name, staging),
+            ]
+        statements.append("COMMIT;")
+        with open(os.path.join(self.output_dir, "load.sql"), "w", encoding="utf-8") as f:
+            f.write("\n".join(statements) + "\n")
+
+class ParquetSink(FileSink):
+    """Write records as columnar Parquet files (requires ``pyarrow``)
+
+    Rows are buffered per table and flushed as row groups; files are
+    finalised on ``close()``. Each run writes new ``<table>-<n>.parquet``
+    files rather than overwriting earlier ones.
+    """
+
+    name = "parquet"
+    extension = ".parquet"
+
+    ARROW_TYPES = {
+        "text": "string",
+        "uuid": "string",
+        "int": "int64",
+        "float": "float64",
+        "timestamp": "timestamp",
+    }
+
+    def __init__(self, output_dir: str = SINK_OUTPUT_DIR, row_group_size: int = PARQUET_ROW_GROUP_SIZE):
+        if pa is None:
+            raise RuntimeError("The parquet sink requires pyarrow (pip install pyarrow)")
+        super().__init__(output_dir)
+        self.row_group_size = row_group_size
+        self._paths: Dict[str, str] = {}
+        self._writers: Dict[str, Any] = {}
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {}
+
+    def path_for(self, table_name: str) -> str:
+        if table_name not in self._paths:
+            n = 0
+            while os.path.exists(os.path.join(self.output_dir, f"{table_name}-{n}{self.extension}")):
+                n += 1
+            self._paths[table_name] = os.path.join(self.output_dir, f"{table_name}-{n}{self.extension}")
+        return self._paths[table_name]
+
+    def schema_for(self, table_name: str):
+        fields = []
+        for name, kind in TABLE_COLUMNS[table_name]:
+            arrow_type = pa.timestamp("us") if kind == "timestamp" else pa.type_for_alias(self.ARROW_TYPES[kind])
+            fields.append(pa.field(name, arrow_type))
+        return pa.schema(fields)
+
+    def _write(self, table_name: str, data: List[Dict[str, Any]]) -> int:
+        buffer = self._buffers.setdefault(table_name, [])
+        buffer.extend(data)
+        nbytes = 0
+        while len(buffer) >= self.row_group_size:
+            nbytes += self._flush(table_name, buffer[:self.row_group_size])
+            del buffer[:self.row_group_size]
+        return nbytes
+
+    def _flush(self, table_name: str, rows: List[Dict[str, Any]]) -> int:
+        schema = self.schema_for(table_name)
+        arrays = []
+        for field in schema:
+            values = [row.get(field.name) for row in rows]
+            if pa.types.is_timestamp(field.type):
+                # ISO strings are parsed by Arrow's cast rather than row by row in Python
+                arrays.append(pa.array(values, type=pa.string()).cast(field.type))
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        batch = pa.Table.from_arrays(arrays, schema=schema)
+
+        if table_name not in self._writers:
+            self._writers[table_name] = pq.ParquetWriter(self.path_for(table_name), schema, compression="zstd")
+        self._writers[table_name].write_table(batch)
+        return batch.nbytes
+
+    async def close(self):
+        for table_name, buffer in self._buffers.items():
+            if buffer:
+                await asyncio.to_thread(self._flush, table_name, buffer)
+                buffer.clear()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+    async def clear_table(self, table_name: str) -> bool:
+        logger.warning(f"Removing output for {table_name}")
+        writer = self._writers.pop(table_name, None)
+        if writer is not None:
+            writer.close()
+        self._buffers.pop(table_name, None)
+        prefix = f"{table_name}-"
+        for filename in os.listdir(self.output_dir):
+            if filename.startswith(prefix) and filename.endswith(self.extension):
+                os.remove(os.path.join(self.output_dir, filename))
+        self._paths.pop(table_name, None)
+        self.counts[table_name] = 0
+        return True
+
+# Sink names accepted by seed_data.py --sink
+SINK_NAMES = ["supabase", "postgres", "ndjson", "parquet", "csv"]
+
+def create_sink(name: str, output_dir: str = SINK_OUTPUT_DIR, **kwargs) -> Sink:
+    """Create a sink by name; ``kwargs`` are passed to the database sinks"""
+    if name == "supabase":
+        from .db import Database
+        return Database(**kwargs)
+    if name == "postgres":
+        from .pg import PostgresDatabase
+        return PostgresDatabase(**kwargs)
+    if name == "ndjson":
+        return NdjsonSink(output_dir)
+    if name == "parquet":
+        return ParquetSink(output_dir)
+    if name == "csv":
+        return CopyCsvSink(output_dir)
+    raise ValueError(f"Unknown sink '{name}', expected one of {', '.join(SINK_NAMES)}")
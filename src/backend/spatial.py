@@ -0,0 +1,240 @@
+import abc
+import logging
+import math
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from .config import TRAFFIC_ZONES, KEY_JUNCTIONS, CITY_CENTER_LAT, CITY_CENTER_LNG, KM_PER_DEGREE
+
+logger = logging.getLogger("traffic_simulator.spatial")
+
+KM_PER_DEGREE_LNG = KM_PER_DEGREE * math.cos(math.radians(CITY_CENTER_LAT))
+
+def project(lat: Any, lng: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """Equirectangular projection to km east/north of the city center (fine at city scale)"""
+    x = (np.asarray(lng, dtype=float) - CITY_CENTER_LNG) * KM_PER_DEGREE_LNG
+    y = (np.asarray(lat, dtype=float) - CITY_CENTER_LAT) * KM_PER_DEGREE
+    return x, y
+
+class _Grid(abc.ABC):
+    """Uniform grid over the bounding box of a set of shapes, each cell listing candidate shapes
+
+    Subclasses decide which shapes a cell lists. Candidate indices and
+    coordinates are stored per cell in padded, fixed-width rows (padding
+    sits at infinity), and kept column-wise so a batch of queries is one
+    array pass per candidate column with no per-query Python. Queries are
+    ordered by their cell's candidate count first, so pass k only touches
+    the prefix of queries that have a k-th candidate.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, reach: np.ndarray, max_cells: int,
+                 margin_km: float, max_work: float = 2e8):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.count = len(self.x)
+        self.nx = self.ny = 0
+        self.cell = 1.0
+        self.x0 = self.y0 = 0.0
+        if self.count == 0:
+            self._pack([])
+            return
+
+        self.x0 = float(np.min(self.x - reach)) - margin_km
+        self.y0 = float(np.min(self.y - reach)) - margin_km
+        width = float(np.max(self.x + reach)) + margin_km - self.x0
+        height = float(np.max(self.y + reach)) + margin_km - self.y0
+        # Several cells per shape keeps candidate rows short; building costs cells x shapes
+        cells = min(max(4 * self.count, 256), max_cells ** 2, max(1.0, max_work / self.count))
+        cell = max(math.sqrt(width * height / cells), width / max_cells, height / max_cells, 1e-9)
+        self.cell = cell
+        self.nx = max(1, math.ceil(width / cell))
+        self.ny = max(1, math.ceil(height / cell))
+        self.diagonal = cell * math.sqrt(2)
+
+        rows = []
+        cx = self.x0 + (np.arange(self.nx) + 0.5) * cell
+        for j in range(self.ny):
+            cy = self.y0 + (j + 0.5) * cell
+            distance = np.hypot(self.x[None, :] - cx[:, None], self.y[None, :] - cy)
+            rows.extend(np.flatnonzero(keep) for keep in self._keep(distance))
+        self._pack(rows)
+
+    def _pack(self, rows: List[np.ndarray]):
+        widest = max([1] + [len(row) for row in rows])
+        self.candidates = np.full((max(1, len(rows)), widest), -1, dtype=np.int64)
+        for i, row in enumerate(rows):
+            self.candidates[i, :len(row)] = row
+        self.widths = np.count_nonzero(self.candidates >= 0, axis=1)
+        self.candidate_index = np.ascontiguousarray(self.candidates.T)
+        self.candidate_x = self._columns(self.x, np.inf)
+        self.candidate_y = self._columns(self.y, np.inf)
+
+    def _columns(self, values: np.ndarray, pad: float) -> np.ndarray:
+        """``values`` of each cell's candidates as a (K, cells) array, ``pad`` where a row is short"""
+        padded = self.candidates < 0
+        column = values[np.where(padded, 0, self.candidates)] if self.count else np.zeros(padded.shape)
+        return np.ascontiguousarray(np.where(padded, pad, column).T)
+
+    @abc.abstractmethod
+    def _keep(self, distance: np.ndarray) -> np.ndarray:
+        """Boolean (cells, shapes): which shapes each cell must list, given centre distances"""
+
+    def _cells(self, qx: np.ndarray, qy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Cell of each query point and whether it falls inside the grid"""
+        fx = (qx - self.x0) * (1 / self.cell)
+        fy = (qy - self.y0) * (1 / self.cell)
+        inside = (fx >= 0) & (fx < self.nx) & (fy >= 0) & (fy < self.ny)
+        return np.where(inside, fy.astype(np.int64) * self.nx + fx.astype(np.int64), 0), inside
+
+    def _by_width(self, cell: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Query order by descending candidate count, and how many queries have more than k candidates"""
+        width = self.widths[cell]
+        order = np.argsort(-width, kind="stable")
+        at_least = np.bincount(width, minlength=self.candidates.shape[1] + 1)[::-1].cumsum()[::-1]
+        return order, at_least[1:]
+
+class PointIndex(_Grid):
+    """Class to find the nearest of a fixed set of points for batches of query points
+
+    A cell lists every point that can be nearest to some location inside
+    it: those within (distance from the cell centre to its nearest point
+    + the cell diagonal). Queries outside the grid fall back to a
+    brute-force scan, done in blocks to bound memory.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, max_cells: int = 256, margin_km: float = 5.0):
+        super().__init__(x, y, np.zeros(len(x)), max_cells, margin_km)
+
+    def _keep(self, distance: np.ndarray) -> np.ndarray:
+        return distance <= distance.min(axis=1, keepdims=True) + self.diagonal
+
+    def nearest(self, qx: np.ndarray, qy: np.ndarray) -> np.ndarray:
+        """Index of the nearest point to each query (-1 if the index is empty)"""
+        qx = np.asarray(qx, dtype=float)
+        qy = np.asarray(qy, dtype=float)
+        if self.count == 0:
+            return np.full(len(qx), -1, dtype=np.int64)
+        cell, inside = self._cells(qx, qy)
+        order, live = self._by_width(cell)
+        sx, sy, cell = qx[order], qy[order], cell[order]
+        best = np.full(len(qx), np.inf)
+        column = np.zeros(len(qx), dtype=np.int64)
+        for k, m in enumerate(live.tolist()):
+            c = cell[:m]
+            dx = self.candidate_x[k][c] - sx[:m]
+            dy = self.candidate_y[k][c] - sy[:m]
+            d2 = dx * dx + dy * dy
+            closer = d2 < best[:m]
+            best[:m] = np.where(closer, d2, best[:m])
+            column[:m][closer] = k
+        result = np.empty(len(qx), dtype=np.int64)
+        result[order] = self.candidates[cell, column]
+
+        outside = np.flatnonzero(~inside)
+        block = max(1, int(4e6 // self.count))
+        for start in range(0, len(outside), block):
+            rows = outside[start:start + block]
+            d2 = (self.x[None, :] - qx[rows, None]) ** 2 + (self.y[None, :] - qy[rows, None]) ** 2
+            result[rows] = np.argmin(d2, axis=1)
+        return result
+
+class CircleIndex(_Grid):
+    """Class to find which of a set of circles (zones, RSU coverage) contains each query point
+
+    A cell lists every circle that overlaps it. When circles overlap, the
+    one whose centre is relatively closest (distance / radius) wins.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, radius_km: np.ndarray,
+                 max_cells: int = 256, margin_km: float = 0.0):
+        self.radius = np.asarray(radius_km, dtype=float)
+        super().__init__(x, y, self.radius, max_cells, margin_km)
+        self.candidate_r = self._columns(self.radius, 1.0)
+
+    def _keep(self, distance: np.ndarray) -> np.ndarray:
+        return distance <= self.radius[None, :] + self.diagonal / 2
+
+    def containing(self, qx: np.ndarray, qy: np.ndarray, enabled: Optional[np.ndarray] = None) -> np.ndarray:
+        """Index of the circle containing each query (-1 for none)
+
+        ``enabled`` is an optional boolean per circle; disabled circles are
+        skipped, so an overlapping enabled one can take over.
+        """
+        qx = np.asarray(qx, dtype=float)
+        qy = np.asarray(qy, dtype=float)
+        if self.count == 0:
+            return np.full(len(qx), -1, dtype=np.int64)
+        # Queries outside the grid are outside every circle
+        cell, inside = self._cells(qx, qy)
+        order, live = self._by_width(cell)
+        sx, sy, cell = qx[order], qy[order], cell[order]
+        best = np.full(len(qx), np.inf)
+        column = np.zeros(len(qx), dtype=np.int64)
+        for k, m in enumerate(live.tolist()):
+            # Squared distance relative to the squared radius orders circles like distance / radius
+            c = cell[:m]
+            dx = self.candidate_x[k][c] - sx[:m]
+            dy = self.candidate_y[k][c] - sy[:m]
+            r = self.candidate_r[k][c]
+            relative = (dx * dx + dy * dy) / (r * r)
+            if enabled is not None:
+                relative[~enabled[self.candidate_index[k][c]]] = np.inf
+            closer = relative < best[:m]
+            best[:m] = np.where(closer, relative, best[:m])
+            column[:m][closer] = k
+        result = np.empty(len(qx), dtype=np.int64)
+        result[order] = np.where(best <= 1, self.candidates[cell, column], -1)
+        return np.where(inside, result, -1)
+
+class SpatialIndex:
+    """Class to index zones, junctions and RSU coverage for batched location queries
+
+    Positions are projected to a flat km grid around the city centre.
+    Every query takes arrays of latitudes and longitudes and returns one
+    index per position into ``zone_names``, ``junction_names`` or
+    ``rsu_ids`` (-1 where nothing matches).
+    """
+
+    def __init__(self, zones: Dict[str, Dict[str, float]] = TRAFFIC_ZONES,
+                 junctions: Dict[str, Dict[str, float]] = KEY_JUNCTIONS):
+        self.zone_names = np.array(list(zones.keys()), dtype=object)
+        x, y = project([z["lat"] for z in zones.values()], [z["lng"] for z in zones.values()])
+        self.zones = CircleIndex(x, y, [z["radius"] for z in zones.values()])
+
+        self.junction_names = np.array(list(junctions.keys()), dtype=object)
+        x, y = project([j["lat"] for j in junctions.values()], [j["lng"] for j in junctions.values()])
+        self.junctions = PointIndex(x, y)
+
+        self.set_rsus([], [], [], [])
+
+    def set_rsus(self, rsu_ids: List[str], lat: Any, lng: Any, coverage_radius_m: Any):
+        """Replace the indexed RSUs; ``coverage_radius_m`` is in metres, as in the rsus table"""
+        self.rsu_ids = np.array(list(rsu_ids), dtype=object)
+        x, y = project(lat, lng)
+        self.rsus = CircleIndex(x, y, np.asarray(coverage_radius_m, dtype=float) / 1000)
+        if len(self.rsu_ids):
+            logger.info(f"Indexed {len(self.rsu_ids)} RSUs")
+
+    def nearest_junction(self, lat: Any, lng: Any) -> np.ndarray:
+        return self.junctions.nearest(*project(lat, lng))
+
+    def junction_labels(self, lat: Any, lng: Any) -> np.ndarray:
+        """Name of the nearest junction to each position"""
+        return self.junction_names[self.nearest_junction(lat, lng)]
+
+    def containing_zone(self, lat: Any, lng: Any) -> np.ndarray:
+        return self.zones.containing(*project(lat, lng))
+
+    def covering_rsu(self, lat: Any, lng: Any, online: Optional[np.ndarray] = None) -> np.ndarray:
+        """RSU serving each position; ``online`` (a boolean per RSU) leaves out RSUs that are down"""
+        return self.rsus.containing(*project(lat, lng), enabled=online)
+
+_index: Optional[SpatialIndex] = None
+
+def get_spatial_index() -> SpatialIndex:
+    """Shared index over the configured zones and junctions, built on first use"""
+    global _index
+    if _index is None:
+        _index = SpatialIndex()
+    return _index
@@ -0,0 +1,146 @@
+import csv
+import datetime
+import logging
+from typing import List, Dict, Any, Optional, Iterable
+
+import numpy as np
+
+from .config import (
+    TRAFFIC_PROFILE_WEEKDAY, TRAFFIC_PROFILE_WEEKEND, TRAFFIC_PROFILE_ZONES,
+    TRAFFIC_PROFILE_RESOLUTION, TRAFFIC_PROFILE_SMOOTHING, TRAFFIC_PROFILE_FILE
+)
+
+logger = logging.getLogger("traffic_simulator.traffic_profile")
+
+MINUTES_PER_DAY = 24 * 60
+DAY_TYPES = ("weekday", "weekend")
+
+def smooth_curve(hourly: Iterable[float], resolution: int = TRAFFIC_PROFILE_RESOLUTION,
+                 smoothing: float = TRAFFIC_PROFILE_SMOOTHING) -> np.ndarray:
+    """Turn 24 hourly factors into one value per ``resolution`` minutes of the day
+
+    The hourly values are held as steps and smoothed with a circular
+    Gaussian of ``smoothing`` minutes, so the curve wraps cleanly across
+    midnight and keeps each hour's average volume.
+    """
+    hourly = np.asarray(list(hourly), dtype=float)
+    if len(hourly) != 24:
+        raise ValueError(f"expected 24 hourly values, got {len(hourly)}")
+    slots = MINUTES_PER_DAY // resolution
+    minutes = (np.arange(slots) + 0.5) * resolution
+    curve = hourly[(minutes // 60).astype(np.int64)]
+    sigma = smoothing / resolution
+    if sigma > 0:
+        radius = min(slots // 2, int(np.ceil(4 * sigma)))
+        offsets = np.arange(-radius, radius + 1)
+        kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+        kernel /= kernel.sum()
+        wrapped = np.concatenate([curve[-radius:], curve, curve[:radius]]) if radius else curve
+        curve = np.convolve(wrapped, kernel, mode="valid")
+    return np.clip(curve, 0.0, 1.0)
+
+class TrafficProfile:
+    """Class to look up the diurnal traffic volume factor from a precomputed table
+
+    The table holds one smoothed curve per variant (row 0 is city-wide,
+    then one row per zone override) and day type (weekday, weekend) at
+    ``resolution`` minutes. Lookups are pure indexing: ``factor`` for one
+    moment, ``factors`` for whole arrays of ``datetime64`` timestamps.
+    """
+
+    def __init__(self, weekday: Iterable[float] = TRAFFIC_PROFILE_WEEKDAY,
+                 weekend: Iterable[float] = TRAFFIC_PROFILE_WEEKEND,
+                 zones: Optional[Dict[str, Dict[str, Iterable[float]]]] = None,
+                 resolution: int = TRAFFIC_PROFILE_RESOLUTION, smoothing: float = TRAFFIC_PROFILE_SMOOTHING):
+        if resolution <= 0 or MINUTES_PER_DAY % resolution:
+            raise ValueError("resolution must be a positive divisor of 1440 minutes")
+        zones = TRAFFIC_PROFILE_ZONES if zones is None else zones
+        self.resolution = resolution
+        self.zone_rows: Dict[str, int] = {}
+
+        city = [smooth_curve(weekday, resolution, smoothing), smooth_curve(weekend, resolution, smoothing)]
+        variants = [city]
+        for zone_name, curves in zones.items():
+            self.zone_rows[zone_name] = len(variants)
+            variants.append([
+                smooth_curve(curves[day_type], resolution, smoothing) if day_type in curves else city[d]
+                for d, day_type in enumerate(DAY_TYPES)
+            ])
+        self.table = np.array(variants)  # (variant, day type, slot)
+
+    @classmethod
+    def from_counts(cls, path: str, resolution: int = TRAFFIC_PROFILE_RESOLUTION,
+                    smoothing: float = TRAFFIC_PROFILE_SMOOTHING) -> "TrafficProfile":
+        """Build a profile from a CSV of observed traffic counts
+
+        Columns: ``hour`` (0-23) or ``minute`` (0-1439), ``count``, and
+        optionally ``day_type`` (weekday/weekend; rows without one count
+        for both) and ``zone`` (blank for city-wide). Counts are averaged
+        per hour, hours without data are interpolated, and everything is
+        scaled so the busiest hour is 1.0.
+        """
+        sums: Dict[tuple, np.ndarray] = {}
+        seen: Dict[tuple, np.ndarray] = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                hour = int(row["hour"]) if row.get("hour") not in (None, "") else int(row["minute"]) // 60
+                zone = (row.get("zone") or "").strip()
+                day_types = [row["day_type"].strip()] if row.get("day_type") else list(DAY_TYPES)
+                for day_type in day_types:
+                    key = (zone, day_type)
+                    sums.setdefault(key, np.zeros(24))[hour % 24] += float(row["count"])
+                    seen.setdefault(key, np.zeros(24))[hour % 24] += 1
+        if not sums:
+            raise ValueError(f"no traffic counts in {path}")
+
+        hourly: Dict[tuple, np.ndarray] = {}
+        for key, total in sums.items():
+            observed = seen[key] > 0
+            means = total[observed] / seen[key][observed]
+            hours = np.arange(24)
+            hourly[key] = np.interp(hours, hours[observed], means, period=24)
+        peak = max(values.max() for values in hourly.values()) or 1.0
+
+        def curve(zone: str, day_type: str) -> Optional[List[float]]:
+            values = hourly.get((zone, day_type))
+            return None if values is None else (values / peak).tolist()
+
+        weekday = curve("", "weekday") or TRAFFIC_PROFILE_WEEKDAY
+        weekend = curve("", "weekend") or TRAFFIC_PROFILE_WEEKEND
+        zones: Dict[str, Dict[str, Any]] = {}
+        for zone, day_type in hourly:
+            if zone:
+                zones.setdefault(zone, {})[day_type] = curve(zone, day_type)
+        logger.info(f"Loaded traffic profile from {path} ({len(zones)} zone variants)")
+        return cls(weekday, weekend, zones, resolution, smoothing)
+
+    def rows_for(self, zone_names: Iterable[str]) -> np.ndarray:
+        """Table row of each zone (0, the city-wide curve, for zones without an override)"""
+        return np.array([self.zone_rows.get(name, 0) for name in zone_names], dtype=np.int64)
+
+    def factors(self, timestamps: np.ndarray, rows: Any = 0) -> np.ndarray:
+        """Volume factors for an array of ``datetime64`` timestamps
+
+        ``rows`` (from ``rows_for``) broadcasts against ``timestamps``, e.g.
+        shape (zones, 1) against (times,) gives a zones × times matrix.
+        """
+        timestamps = np.asarray(timestamps, dtype="datetime64[m]")
+        days = timestamps.astype("datetime64[D]")
+        minute = (timestamps - days).astype(np.int64)
+        weekend = (days.astype(np.int64) + 3) % 7 >= 5  # 1970-01-01 was a Thursday
+        return self.table[rows, weekend.astype(np.int64), minute // self.resolution]
+
+    def factor(self, moment: datetime.datetime, zone: Optional[str] = None) -> float:
+        """Volume factor (0-1) at ``moment``"""
+        row = self.zone_rows.get(zone, 0) if zone is not None else 0
+        minute = moment.hour * 60 + moment.minute
+        return float(self.table[row, int(moment.weekday() >= 5), minute // self.resolution])
+
+_profile: Optional[TrafficProfile] = None
+
+def get_traffic_profile() -> TrafficProfile:
+    """Shared profile, built on first use from TRAFFIC_PROFILE_FILE or the configured curves"""
+    global _profile
+    if _profile is None:
+        _profile = TrafficProfile.from_counts(TRAFFIC_PROFILE_FILE) if TRAFFIC_PROFILE_FILE else TrafficProfile()
+    return _profile